@@ -0,0 +1,160 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponseNotAllowed, JsonResponse
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from api.filters import RecipeFilter
+from api.serializers import (IngredientSerializer, RecipeReadSerializer,
+                             TagSerializer, recipe_fieldset)
+from api.views import recipe_queryset
+from recipes.models import Ingredient, Recipe, Tag
+
+
+class NotAuthenticated(Exception):
+    pass
+
+
+def json_response(data, status=200):
+    return JsonResponse(
+        data, status=status, safe=False,
+        json_dumps_params={'ensure_ascii': False})
+
+
+def async_read_view(view):
+    """Только GET, пользователь по токену, ответы об ошибках как в DRF."""
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return HttpResponseNotAllowed(['GET'])
+        try:
+            # Сериализаторы смотрят request.user, как в DRF.
+            request.user = await get_user(request) or AnonymousUser()
+        except NotAuthenticated:
+            return json_response(
+                {'detail': 'Недопустимый токен.'}, status=401)
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def get_user(request):
+    keyword, _, key = request.META.get(
+        'HTTP_AUTHORIZATION', '').partition(' ')
+    if keyword != 'Token' or not key:
+        return None
+    try:
+        token = await Token.objects.select_related('user').aget(key=key)
+    except Token.DoesNotExist:
+        raise NotAuthenticated
+    if not token.user.is_active:
+        raise NotAuthenticated
+    return token.user
+
+
+def serialize_recipes(request, recipes, many):
+    """Тот же RecipeReadSerializer, что у RecipesViewSet.
+
+    Вызывается в sync_to_async: подписки и КБЖУ сериализатор
+    добирает запросами к БД.
+    """
+
+    return RecipeReadSerializer(
+        recipes, many=many, context={'request': request}).data
+
+
+def filter_recipes(request, queryset):
+    filterset = RecipeFilter(request.GET, queryset=queryset, request=request)
+    if not filterset.is_valid():
+        return None, filterset.errors
+    return filterset.qs, None
+
+
+def page_params(request):
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+        limit = int(request.GET.get('limit', settings.REST_FRAMEWORK[
+            'PAGE_SIZE']))
+    except ValueError:
+        page, limit = 1, settings.REST_FRAMEWORK['PAGE_SIZE']
+    return page, max(limit, 1)
+
+
+def read_queryset(request):
+    """Queryset RecipesViewSet с учетом ?fields= и ?expand=."""
+
+    try:
+        return recipe_queryset(request, recipe_fieldset(request)), None
+    except ValidationError as error:
+        return None, error.detail
+
+
+@async_read_view
+async def recipe_list(request):
+    """Лента рецептов: те же фильтры и пагинация, что у RecipeViewSet."""
+
+    queryset, errors = read_queryset(request)
+    if errors is None:
+        queryset, errors = await sync_to_async(filter_recipes)(
+            request, queryset)
+    if errors:
+        return json_response(errors, status=400)
+    page, limit = page_params(request)
+    offset = (page - 1) * limit
+
+    recipes = [recipe async for recipe in queryset[offset:offset + limit]]
+    count = await queryset.acount()
+    if not recipes and page > 1:
+        return json_response(
+            {'detail': 'Неправильная страница'}, status=404)
+    results = await sync_to_async(serialize_recipes)(request, recipes, True)
+    url = request.build_absolute_uri()
+    return json_response({
+        'count': count,
+        'next': (
+            replace_query_param(url, 'page', page + 1)
+            if offset + limit < count else None),
+        'previous': (
+            None if page == 1
+            else remove_query_param(url, 'page') if page == 2
+            else replace_query_param(url, 'page', page - 1)),
+        'results': results,
+    })
+
+
+@async_read_view
+async def recipe_detail(request, pk):
+    # DRF фильтрует и retrieve: ?is_favorited=1 и для одного рецепта.
+    queryset, errors = read_queryset(request)
+    if errors is None:
+        queryset, errors = await sync_to_async(filter_recipes)(
+            request, queryset)
+    if errors:
+        return json_response(errors, status=400)
+    try:
+        recipe = await queryset.aget(pk=pk)
+    except Recipe.DoesNotExist:
+        # Текст Http404 из get_object_or_404, как отдает DRF.
+        return json_response(
+            {'detail': 'No Recipe matches the given query.'}, status=404)
+    return json_response(
+        await sync_to_async(serialize_recipes)(request, recipe, False))
+
+
+@async_read_view
+async def tag_list(request):
+    tags = [tag async for tag in Tag.objects.all()]
+    return json_response(TagSerializer(tags, many=True).data)
+
+
+@async_read_view
+async def ingredient_list(request):
+    queryset = Ingredient.objects.all()
+    if name := request.GET.get('name'):
+        queryset = queryset.filter(name__istartswith=name)
+    return json_response(IngredientSerializer(
+        [item async for item in queryset], many=True).data)
@@ -0,0 +1,133 @@
+import gzip
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+from recipes.loaders import bulk_loaded
+from recipes.models import Ingredient, Tag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Порядок - предпочтение сервера при равных q.
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+# Только JSON API. HTML (админка, browsable API) несет CSRF-токен рядом
+# с данными из запроса - сжатие открыло бы его для BREACH.
+COMPRESSIBLE_PATH = '/api/'
+COMPRESSIBLE_TYPES = ('application/json',)
+REFERENCE_KEY = 'reference:{}:{}'
+REFERENCE_VERSION_KEY = 'reference:{}:version'
+
+
+def accepted_encoding(request):
+    """Лучшая кодировка из Accept-Encoding, которую мы умеем, или None."""
+
+    accepted = {}
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        accepted[name.strip().lower()] = quality
+    wildcard = accepted.get('*', 0)
+    candidates = [
+        (accepted.get(encoding, wildcard), -index, encoding)
+        for index, encoding in enumerate(ENCODINGS)]
+    quality, _, encoding = max(candidates)
+    return encoding if quality > 0 else None
+
+
+def compress(content, encoding, best=False):
+    """best - максимальное сжатие для того, что сжимается один раз."""
+
+    if encoding == 'br':
+        return brotli.compress(
+            content,
+            quality=11 if best else settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(
+        content,
+        compresslevel=9 if best else settings.COMPRESSION_GZIP_LEVEL,
+        mtime=0)
+
+
+def is_compressible(request, response):
+    content_type = response.get('Content-Type', '').split(';')[0]
+    return (request.path.startswith(COMPRESSIBLE_PATH)
+            and content_type in COMPRESSIBLE_TYPES)
+
+
+def precompressed(name, render):
+    """Тело справочника и его сжатые варианты - раз на версию данных.
+
+    Версия - хэш тела, ключ версии живет CACHE_VERSION_TIMEOUT. Когда
+    он истек, тело рендерится заново, а сжимается, только если
+    изменилось; ETag у всех процессов одинаковый.
+    """
+
+    version_key = REFERENCE_VERSION_KEY.format(name)
+    version = cache.get(version_key)
+    variants = None if version is None else cache.get(
+        REFERENCE_KEY.format(name, version))
+    if variants is not None:
+        return version, variants
+    content = render()
+    version = hashlib.sha256(content).hexdigest()[:32]
+    cache.set(version_key, version, settings.CACHE_VERSION_TIMEOUT)
+    key = REFERENCE_KEY.format(name, version)
+    variants = cache.get(key)
+    if variants is None:
+        variants = {'identity': content}
+        for encoding in ENCODINGS:
+            variants[encoding] = compress(content, encoding, best=True)
+        cache.set(key, variants, settings.REFERENCE_CACHE_TIMEOUT)
+    return version, variants
+
+
+class PrecompressedListMixin:
+    """Полный список справочника (без фильтров) из кэша, уже сжатый."""
+
+    reference_name = None
+
+    def list(self, request, *args, **kwargs):
+        if (request.query_params
+                or not isinstance(request.accepted_renderer, JSONRenderer)):
+            return super().list(request, *args, **kwargs)
+        version, variants = precompressed(
+            self.reference_name,
+            lambda: JSONRenderer().render(
+                self.get_serializer(self.get_queryset(), many=True).data))
+        etag = f'"{self.reference_name}-{version}"'
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            response = HttpResponseNotModified()
+        else:
+            encoding = accepted_encoding(request)
+            response = HttpResponse(
+                variants.get(encoding, variants['identity']),
+                content_type='application/json')
+            if encoding in variants:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+@receiver((post_save, post_delete, bulk_loaded), sender=Tag)
+def reset_tags(**kwargs):
+    cache.delete(REFERENCE_VERSION_KEY.format('tags'))
+
+
+@receiver((post_save, post_delete, bulk_loaded), sender=Ingredient)
+def reset_ingredients(**kwargs):
+    cache.delete(REFERENCE_VERSION_KEY.format('ingredients'))
@@ -0,0 +1,31 @@
+from rest_framework.exceptions import ValidationError
+
+
+def query_list(request, name):
+    value = request.GET.get(name, '') if request else ''
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+
+class Fieldset:
+    """Разреженный ответ: ?fields=id,name,tags&expand=tags.
+
+    Без fields отдаются все поля целиком. С fields - только перечисленные,
+    а связи (relations) сворачиваются до id, если их нет в expand.
+    """
+
+    def __init__(self, request, allowed, relations):
+        fields = query_list(request, 'fields')
+        expand = query_list(request, 'expand')
+        unknown = (fields | expand) - set(allowed)
+        if unknown:
+            raise ValidationError(
+                {'fields': f'Неизвестные поля: {", ".join(sorted(unknown))}.'})
+        self.sparse = bool(fields)
+        self.fields = fields | expand
+        self.expand = expand & set(relations)
+
+    def includes(self, name):
+        return not self.sparse or name in self.fields
+
+    def expands(self, name):
+        return not self.sparse or name in self.expand
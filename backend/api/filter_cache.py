@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.loaders import bulk_loaded
+from recipes.models import Tag
+
+User = get_user_model()
+
+TAG_SLUGS_KEY = 'filters:tag-slugs'
+USER_EXISTS_KEY = 'filters:user-exists:{}'
+
+
+def tag_ids_by_slug():
+    """slug -> id всех тэгов для фильтра по тэгам."""
+
+    return cache.get_or_set(
+        TAG_SLUGS_KEY,
+        lambda: dict(Tag.objects.values_list('slug', 'id')),
+        settings.FILTER_CACHE_TIMEOUT)
+
+
+def user_exists(user_id):
+    """Есть ли пользователь с таким id (и отрицательный ответ кэшируем)."""
+
+    return cache.get_or_set(
+        USER_EXISTS_KEY.format(user_id),
+        lambda: User.objects.filter(id=user_id).exists(),
+        settings.FILTER_CACHE_TIMEOUT)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(bulk_loaded, sender=Tag)
+def reset_tag_slugs(**kwargs):
+    cache.delete(TAG_SLUGS_KEY)
+
+
+@receiver(post_save, sender=User)
+def reset_created_user(sender, instance, created, **kwargs):
+    if created:
+        cache.delete(USER_EXISTS_KEY.format(instance.id))
+
+
+@receiver(post_delete, sender=User)
+def reset_deleted_user(sender, instance, **kwargs):
+    cache.delete(USER_EXISTS_KEY.format(instance.id))
@@ -1,8 +1,34 @@
+from django import forms
 from django.core.exceptions import ValidationError
+from django.db.models import Exists, OuterRef
 import django_filters as filters
 
-from users.models import User
-from recipes.models import Ingredient, Recipe
+from api.filter_cache import tag_ids_by_slug, user_exists
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+TAGS_ALL = 'all'
+TAGS_ANY = 'any'
+
+
+class AuthorField(forms.IntegerField):
+    """id автора, проверка существования - по кэшу, а не запросом."""
+
+    default_error_messages = {
+        'invalid_choice': 'Выберите корректный вариант. '
+                          '%(value)s нет среди допустимых значений.',
+    }
+
+    def validate(self, value):
+        super().validate(value)
+        if value is not None and not user_exists(value):
+            raise ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value})
+
+
+class AuthorFilter(filters.Filter):
+    field_class = AuthorField
 
 
 class TagsMultipleChoiceField(
@@ -20,9 +46,67 @@ class TagsMultipleChoiceField(
                     params={'value': val},)
 
 
-class TagsFilter(filters.AllValuesMultipleFilter):
+class TagsFilter(filters.MultipleChoiceFilter):
+    """Фильтр по slug тэгов через EXISTS: без JOIN, дублей и DISTINCT.
+
+    По умолчанию рецепт подходит, если у него есть любой из тэгов;
+    с tags_mode=all - только если есть все.
+    """
+
     field_class = TagsMultipleChoiceField
 
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('choices', lambda: [
+            (slug, slug) for slug in tag_ids_by_slug()])
+        kwargs.setdefault('distinct', False)
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        ids_by_slug = tag_ids_by_slug()
+        tag_ids = {ids_by_slug.get(slug) for slug in value}
+        links = Recipe.tags.through.objects.filter(recipe_id=OuterRef('pk'))
+        if self.parent.form.cleaned_data.get('tags_mode') == TAGS_ALL:
+            if None in tag_ids:
+                return qs.none()
+            for tag_id in tag_ids:
+                qs = qs.filter(Exists(links.filter(tag_id=tag_id)))
+            return qs
+        tag_ids.discard(None)
+        return qs.filter(Exists(links.filter(tag_id__in=tag_ids)))
+
+
+class IngredientsFilter(filters.BaseInFilter, filters.Filter):
+    """id ингредиентов через запятую, проверка через EXISTS.
+
+    Рецепт подходит, если в нем есть все ингредиенты, а с exclude=True -
+    если нет ни одного.
+    """
+
+    field_class = forms.IntegerField
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        items = RecipeIngredient.objects.filter(recipe_id=OuterRef('pk'))
+        if self.exclude:
+            return qs.filter(~Exists(items.filter(ingredient_id__in=value)))
+        for ingredient_id in set(value):
+            qs = qs.filter(Exists(items.filter(ingredient_id=ingredient_id)))
+        return qs
+
+
+class RecipeOrderingFilter(filters.OrderingFilter):
+    """Сортировка по нескольким полям; id в конце - для стабильных страниц."""
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        ordering = [self.get_ordering_value(param) for param in value]
+        return qs.order_by(
+            *ordering, '-id' if ordering[0].startswith('-') else 'id')
+
 
 class IngredientFilter(filters.FilterSet):
     name = filters.CharFilter(lookup_expr='istartswith')
@@ -33,18 +117,43 @@ class IngredientFilter(filters.FilterSet):
 
 
 class RecipeFilter(filters.FilterSet):
-    author = filters.ModelChoiceFilter(
-        queryset=User.objects.all())
+    author = AuthorFilter(
+        field_name='author_id',
+        label='Автор')
     is_in_shopping_cart = filters.BooleanFilter(
         widget=filters.widgets.BooleanWidget(),
         label='В корзине.')
     is_favorited = filters.BooleanFilter(
         widget=filters.widgets.BooleanWidget(),
         label='В избранных.')
-    tags = filters.AllValuesMultipleFilter(
+    tags = TagsFilter(
         field_name='tags__slug',
         label='Ссылка')
+    tags_mode = filters.ChoiceFilter(
+        choices=((TAGS_ANY, 'Любой из тэгов'), (TAGS_ALL, 'Все тэги')),
+        method='filter_tags_mode',
+        label='Режим тэгов')
+    cooking_time = filters.RangeFilter(
+        label='Время приготовления: cooking_time_min, cooking_time_max')
+    pub_date = filters.IsoDateTimeFromToRangeFilter(
+        label='Дата публикации: pub_date_after, pub_date_before')
+    ingredients = IngredientsFilter(
+        label='Есть все ингредиенты (id через запятую)')
+    exclude_ingredients = IngredientsFilter(
+        exclude=True,
+        label='Нет ни одного из ингредиентов (id через запятую)')
+    ordering = RecipeOrderingFilter(
+        fields=('cooking_time', 'pub_date', 'name'),
+        label='Сортировка, например ordering=cooking_time,-pub_date')
 
     class Meta:
         model = Recipe
-        fields = ['is_favorited', 'is_in_shopping_cart', 'author', 'tags']
+        fields = [
+            'is_favorited', 'is_in_shopping_cart', 'author',
+            'tags', 'tags_mode', 'cooking_time', 'pub_date',
+            'ingredients', 'exclude_ingredients']
+
+    def filter_tags_mode(self, queryset, name, value):
+        """Режим учитывается в TagsFilter."""
+
+        return queryset
@@ -0,0 +1,338 @@
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management import BaseCommand, CommandError
+
+from recipes.management.commands.seed_load_data import PASSWORD
+
+PERCENTILES = (50, 95, 99)
+INGREDIENT_PREFIXES = ('а', 'б', 'к', 'м', 'п', 'с', 'со', 'ма', 'мо')
+
+
+class HTTPError(Exception):
+    pass
+
+
+class Connection:
+    """Минимальный keep-alive HTTP/1.1 клиент поверх asyncio."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, headers=None, body=None):
+        for attempt in range(2):
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection(
+                    self.host, self.port)
+            try:
+                return await self._request(method, path, headers, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if attempt:
+                    raise
+
+    async def _request(self, method, path, headers, body):
+        lines = [
+            f'{method} {path} HTTP/1.1',
+            f'Host: {self.host}:{self.port}',
+            'Connection: keep-alive',
+            'Accept: application/json']
+        lines += [f'{key}: {value}' for key, value in (headers or {}).items()]
+        if body is not None:
+            lines.append(f'Content-Length: {len(body)}')
+        self.writer.write(
+            ('\r\n'.join(lines) + '\r\n\r\n').encode() + (body or b''))
+        await self.writer.drain()
+        status_line = await self.reader.readuntil(b'\r\n')
+        if not status_line.strip():
+            raise ConnectionResetError
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while (line := await self.reader.readuntil(b'\r\n')) != b'\r\n':
+            key, _, value = line.decode('latin-1').partition(':')
+            response_headers[key.strip().lower()] = value.strip()
+        payload = await self._read_body(response_headers)
+        if response_headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, payload
+
+    async def _read_body(self, headers):
+        if 'content-length' in headers:
+            return await self.reader.readexactly(
+                int(headers['content-length']))
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while size := int(
+                    (await self.reader.readuntil(b'\r\n')).split(b';')[0],
+                    16):
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readuntil(b'\r\n')
+            await self.reader.readuntil(b'\r\n')
+            return b''.join(chunks)
+        payload = await self.reader.read()
+        self.close()
+        return payload
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class VirtualUser:
+    """Пользователь сценария со своим соединением и токеном."""
+
+    def __init__(self, bench, email):
+        self.bench, self.email = bench, email
+        self.connection = Connection(bench.host, bench.port)
+        self.headers = {}
+
+    async def call(self, name, method, path, body=None, expect=(200,),
+                   read=False):
+        headers = dict(self.headers)
+        if body is not None:
+            body = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        started = time.perf_counter()
+        try:
+            status, payload = await self.connection.request(
+                method,
+                (self.bench.read_prefix if read else self.bench.prefix) + path,
+                headers, body)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            self.connection.close()
+            status, payload = 0, b''
+        self.bench.record(
+            name, time.perf_counter() - started, status in expect,
+            len(payload))
+        return status, payload
+
+    async def login(self):
+        status, payload = await self.call(
+            'login', 'POST', '/auth/token/login/',
+            {'email': self.email, 'password': self.bench.password},
+            expect=(200, 201))
+        if status not in (200, 201):
+            raise HTTPError(f'Не удалось войти как {self.email}: {status}')
+        self.headers['Authorization'] = (
+            f'Token {json.loads(payload)["auth_token"]}')
+
+    async def recipes_feed(self, rnd):
+        tags = rnd.sample(
+            self.bench.tags, rnd.randint(0, len(self.bench.tags)))
+        query = urlencode(
+            [('page', rnd.randint(1, 5))] + [('tags', tag) for tag in tags])
+        await self.call(
+            'recipes_feed', 'GET', f'/recipes/?{query}', read=True)
+
+    async def recipe_detail(self, rnd):
+        recipe_id = rnd.choice(self.bench.recipe_ids)
+        await self.call(
+            'recipe_detail', 'GET', f'/recipes/{recipe_id}/', read=True)
+
+    async def favorite_toggle(self, rnd):
+        recipe_id = rnd.choice(self.bench.recipe_ids)
+        path = f'/recipes/{recipe_id}/favorite/'
+        await self.call('favorite_add', 'POST', path, {}, expect=(201,))
+        await self.call('favorite_delete', 'DELETE', path, expect=(204,))
+
+    async def subscriptions(self, rnd):
+        await self.call(
+            'subscriptions', 'GET',
+            f'/users/subscriptions/?recipes_limit={rnd.randint(1, 6)}')
+
+    async def ingredients(self, rnd):
+        query = urlencode({'name': rnd.choice(INGREDIENT_PREFIXES)})
+        await self.call(
+            'ingredients', 'GET', f'/ingredients/?{query}', read=True)
+
+    async def tags(self, rnd):
+        await self.call('tags', 'GET', '/tags/', read=True)
+
+    async def download_shopping_cart(self, rnd):
+        await self.call(
+            'download_shopping_cart', 'GET',
+            '/recipes/download_shopping_cart/')
+
+
+SCENARIOS = {
+    'full': {
+        'recipes_feed': 40,
+        'recipe_detail': 25,
+        'favorite_toggle': 10,
+        'subscriptions': 10,
+        'ingredients': 10,
+        'download_shopping_cart': 5,
+    },
+    # Только чтение: сравнение синхронного API и async/ пути.
+    'reads': {
+        'recipes_feed': 50,
+        'recipe_detail': 30,
+        'ingredients': 10,
+        'tags': 10,
+    },
+}
+
+
+def percentile(values, rank):
+    """Перцентиль по методу ближайшего ранга."""
+
+    if not values:
+        return None
+    index = max(0, -(-len(values) * rank // 100) - 1)
+    return values[index]
+
+
+class Bench:
+
+    def __init__(self, url, password, seed, scenario='full', read_path=None):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.read_prefix = (read_path or self.prefix).rstrip('/')
+        self.scenario = SCENARIOS[scenario]
+        self.password = password
+        self.rnd = random.Random(seed)
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.bytes = defaultdict(int)
+        self.recording = False
+        self.tags, self.recipe_ids = [], []
+
+    def record(self, name, elapsed, ok, size):
+        if not self.recording:
+            return
+        self.timings[name].append(elapsed)
+        self.bytes[name] += size
+        if not ok:
+            self.errors[name] += 1
+
+    async def prepare(self, user):
+        _, payload = await user.call('tags', 'GET', '/tags/')
+        self.tags = [tag['slug'] for tag in json.loads(payload)]
+        _, payload = await user.call('recipes_feed', 'GET', '/recipes/')
+        pages = -(-json.loads(payload)['count'] // 100)
+        for page in range(1, min(pages, 5) + 1):
+            _, payload = await user.call(
+                'recipes_feed', 'GET', f'/recipes/?limit=100&page={page}')
+            self.recipe_ids += [
+                recipe['id'] for recipe in json.loads(payload)['results']]
+        if not self.recipe_ids:
+            raise HTTPError('Нет рецептов, запустите seed_load_data.')
+
+    async def worker(self, user, deadline, rnd):
+        names, weights = zip(*self.scenario.items())
+        while time.monotonic() < deadline:
+            await getattr(user, rnd.choices(names, weights)[0])(rnd)
+
+    async def run(self, emails, duration, warmup):
+        users = [VirtualUser(self, email) for email in emails]
+        for user in users:
+            await user.login()
+        await self.prepare(users[0])
+        for recording, seconds in ((False, warmup), (True, duration)):
+            self.recording = recording
+            started = time.monotonic()
+            deadline = started + seconds
+            await asyncio.gather(*(
+                self.worker(user, deadline, random.Random(self.rnd.random()))
+                for user in users))
+        for user in users:
+            user.connection.close()
+        return time.monotonic() - started
+
+    def report(self, elapsed, concurrency):
+        endpoints = {}
+        for name, timings in sorted(self.timings.items()):
+            timings.sort()
+            endpoints[name] = {
+                'requests': len(timings),
+                'errors': self.errors[name],
+                'rps': round(len(timings) / elapsed, 2),
+                'mean_ms': round(sum(timings) / len(timings) * 1000, 2),
+                **{f'p{rank}_ms': round(percentile(timings, rank) * 1000, 2)
+                   for rank in PERCENTILES},
+                'bytes_per_request': self.bytes[name] // len(timings),
+            }
+        total = sum(item['requests'] for item in endpoints.values())
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'duration_s': round(elapsed, 2),
+            'concurrency': concurrency,
+            'requests': total,
+            'rps': round(total / elapsed, 2),
+            'errors': sum(item['errors'] for item in endpoints.values()),
+            'endpoints': endpoints,
+        }
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест API: RPS и p50/p95/p99 по эндпоинтам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://localhost:8000/api',
+            help='Базовый адрес API запущенного сервера.')
+        parser.add_argument(
+            '--concurrency', type=int, default=10,
+            help='Число одновременных виртуальных пользователей.')
+        parser.add_argument('--duration', type=float, default=30)
+        parser.add_argument('--warmup', type=float, default=5)
+        parser.add_argument(
+            '--prefix', default='load',
+            help='Префикс пользователей, созданных seed_load_data.')
+        parser.add_argument('--password', default=PASSWORD)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--scenario', choices=SCENARIOS, default='full',
+            help='full - весь сценарий, reads - только чтение.')
+        parser.add_argument(
+            '--read-path',
+            help='Путь для запросов чтения, например /api/async.')
+        parser.add_argument(
+            '--output', help='Файл для JSON отчета.')
+        parser.add_argument(
+            '--compare', help='Предыдущий JSON отчет для сравнения.')
+
+    def handle(self, *args, **options):
+        bench = Bench(
+            options['url'], options['password'], options['seed'],
+            options['scenario'], options['read_path'])
+        emails = [
+            f'{options["prefix"]}{number}@example.com'
+            for number in range(options['concurrency'])]
+        try:
+            elapsed = asyncio.run(bench.run(
+                emails, options['duration'], options['warmup']))
+        except (OSError, HTTPError) as error:
+            raise CommandError(f'Нагрузочный тест прерван: {error}')
+        report = bench.report(elapsed, options['concurrency'])
+        report['scenario'] = options['scenario']
+        report['read_path'] = bench.read_prefix
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        previous = {}
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                previous = json.load(file)['endpoints']
+        self.stdout.write(
+            f'{"endpoint":<24}{"req":>7}{"err":>5}{"rps":>9}'
+            f'{"p50":>9}{"p95":>9}{"p99":>9}{"Δp95":>9}')
+        for name, item in report['endpoints'].items():
+            delta = (
+                f'{item["p95_ms"] - previous[name]["p95_ms"]:+.1f}'
+                if name in previous else '')
+            self.stdout.write(
+                f'{name:<24}{item["requests"]:>7}{item["errors"]:>5}'
+                f'{item["rps"]:>9}{item["p50_ms"]:>9}{item["p95_ms"]:>9}'
+                f'{item["p99_ms"]:>9}{delta:>9}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Всего {report["requests"]} запросов, {report["rps"]} RPS, '
+            f'ошибок {report["errors"]}.'))
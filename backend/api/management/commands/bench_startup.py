@@ -0,0 +1,126 @@
+import http.client
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+# Холодный старт воркера без preload: Django, URL и первый запрос.
+BOOT_SCRIPT = '''
+import resource, sys, time
+started = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+from django.test import Client
+application = get_wsgi_application()
+if {eager}:
+    from api.shopping_list import pdf_canvas
+    pdf_canvas()
+Client().get('/api/tags/', HTTP_HOST={host!r})
+print(time.perf_counter() - started,
+      resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+      int('reportlab' in sys.modules))
+'''
+
+
+def memory(pid):
+    """Rss, Pss и Private процесса в КБ по /proc/<pid>/smaps_rollup."""
+
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as file:
+        for line in file:
+            name, _, rest = line.partition(':')
+            if name in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+                values[name] = int(rest.split()[0])
+    return (values['Rss'], values['Pss'],
+            values['Private_Clean'] + values['Private_Dirty'])
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as file:
+        return [int(child) for child in file.read().split()]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def get(port, path):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    try:
+        connection.request(
+            'GET', path, headers={'Host': settings.ALLOWED_HOSTS[0]})
+        return connection.getresponse().status
+    except OSError:
+        return None
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Время старта и память воркеров gunicorn: preload и без него'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--requests', type=int, default=50)
+
+    def handle(self, *args, **options):
+        for label, eager in (('PDF при импорте', True), ('PDF лениво', False)):
+            self.boot(label, eager, options['repeat'])
+        for preload in (False, True):
+            self.gunicorn(preload, options['workers'], options['requests'])
+
+    def boot(self, label, eager, repeat):
+        script = BOOT_SCRIPT.format(
+            eager=eager, host=settings.ALLOWED_HOSTS[0])
+        timings, peaks = [], []
+        for _ in range(repeat):
+            output = subprocess.run(
+                (sys.executable, '-c', script), capture_output=True,
+                text=True, check=True, cwd=settings.BASE_DIR)
+            seconds, peak, pdf = output.stdout.split()
+            timings.append(float(seconds))
+            peaks.append(int(peak))
+        self.stdout.write(
+            f'{label:<18}старт {min(timings) * 1000:5.0f} мс '
+            f'(медиана {statistics.median(timings) * 1000:5.0f})  '
+            f'пик RSS {max(peaks) / 1024:6.1f} МБ  reportlab {pdf}')
+
+    def gunicorn(self, preload, workers, requests):
+        port = free_port()
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            (sys.executable, '-m', 'gunicorn', 'foodgram.wsgi:application',
+             '--bind', f'127.0.0.1:{port}', '--workers', str(workers)),
+            cwd=settings.BASE_DIR,
+            env={**os.environ, 'GUNICORN_PRELOAD': str(preload)},
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while (len(children(process.pid)) < workers
+                   or get(port, '/api/tags/') != 200):
+                if process.poll() is not None:
+                    raise CommandError('gunicorn не запустился.')
+                time.sleep(0.05)
+            ready = time.perf_counter() - started
+            # Запросы до замера: у каждого воркера прогреты свои кэши.
+            for _ in range(requests):
+                get(port, '/api/recipes/?nutrition=1')
+            rows = [memory(pid) for pid in children(process.pid)]
+            master = memory(process.pid)
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait()
+        rss, _, private = (
+            statistics.mean(column) / 1024 for column in zip(*rows))
+        total = (master[1] + sum(row[1] for row in rows)) / 1024
+        self.stdout.write(
+            f'{"preload" if preload else "без preload":<18}'
+            f'готов {ready * 1000:7.0f} мс  RSS воркера {rss:6.1f} МБ  '
+            f'личная {private:5.1f} МБ  PSS всего {total:6.1f} МБ')
@@ -0,0 +1,64 @@
+import statistics
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db.models import Value
+from django.http import QueryDict
+
+from api.filter_cache import tag_ids_by_slug
+from api.filters import RecipeFilter
+from recipes.models import Recipe
+
+
+def legacy_filter(queryset, slugs, conjoined):
+    """Прежний вариант: DISTINCT по тэгам рецептов + JOIN через M2M."""
+
+    list(Recipe.objects.values_list(
+        'tags__slug', flat=True).distinct().order_by('tags__slug'))
+    if conjoined:
+        for slug in slugs:
+            queryset = queryset.filter(tags__slug=slug)
+        return queryset.distinct()
+    return queryset.filter(tags__slug__in=slugs).distinct()
+
+
+def exists_filter(queryset, slugs, conjoined):
+    data = QueryDict(mutable=True)
+    data.setlist('tags', slugs)
+    data['tags_mode'] = 'all' if conjoined else 'any'
+    return RecipeFilter(data, queryset=queryset).qs
+
+
+class Command(BaseCommand):
+    help = 'Сравнение фильтра по тэгам: JOIN + DISTINCT против EXISTS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=6)
+
+    def handle(self, *args, **options):
+        slugs = sorted(tag_ids_by_slug())[:2]
+        if not Recipe.objects.exists() or len(slugs) < 2:
+            raise CommandError(
+                'Нужны рецепты и хотя бы два тэга: seed_load_data.')
+        queryset = Recipe.objects.annotate(
+            is_favorited=Value(False),
+            is_in_shopping_cart=Value(False)).select_related('author')
+        self.stdout.write(
+            f'Рецептов: {Recipe.objects.count()}, тэги: {", ".join(slugs)}')
+        for conjoined in (False, True):
+            for name, build in (
+                    ('JOIN + DISTINCT', legacy_filter),
+                    ('EXISTS', exists_filter)):
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    filtered = build(queryset, slugs, conjoined)
+                    count = filtered.count()
+                    list(filtered[:options['page_size']])
+                    timings.append(time.perf_counter() - started)
+                self.stdout.write(
+                    f'{"все" if conjoined else "любой":<6}{name:<17}'
+                    f'найдено {count:>8}  '
+                    f'медиана {statistics.median(timings) * 1000:8.1f} мс  '
+                    f'макс {max(timings) * 1000:8.1f} мс')
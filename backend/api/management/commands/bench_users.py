@@ -0,0 +1,108 @@
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.db.models.expressions import Exists, OuterRef
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.views import UsersViewSet
+from recipes.models import Subscribe
+from users.models import User
+
+PREFIX = 'bench-users-'
+
+
+class LegacyUsersViewSet(UsersViewSet):
+    """Прежний queryset: все колонки и prefetch всех подписок страницы."""
+
+    def get_queryset(self):
+        return User.objects.annotate(
+            is_subscribed=Exists(
+                self.request.user.follower.filter(
+                    author=OuterRef('id'))
+            )).prefetch_related('follower', 'following')
+
+
+def create_author(followers, batch_size):
+    author = User.objects.create(
+        email=f'{PREFIX}author@example.com', username=f'{PREFIX}author',
+        first_name='Автор', last_name='Популярный', password='!')
+    with transaction.atomic():
+        users = User.objects.bulk_create(
+            (User(email=f'{PREFIX}{number}@example.com',
+                  username=f'{PREFIX}{number}',
+                  first_name='Подписчик', last_name=str(number),
+                  password='!')
+             for number in range(followers)),
+            batch_size=batch_size)
+        Subscribe.objects.bulk_create(
+            (Subscribe(user_id=user.id, author=author) for user in users),
+            batch_size=batch_size)
+    return author
+
+
+class Command(BaseCommand):
+    help = 'Память и время /api/users/ для автора с массой подписчиков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--followers', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--page-size', type=int, default=6)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Не удалять созданных пользователей.')
+
+    def handle(self, *args, **options):
+        author = User.objects.filter(
+            email=f'{PREFIX}author@example.com').first()
+        if author is None:
+            started = time.perf_counter()
+            author = create_author(
+                options['followers'], options['batch_size'])
+            self.stdout.write(
+                f'Создано {options["followers"]} подписчиков за '
+                f'{time.perf_counter() - started:.1f} c.')
+        viewer = User.objects.filter(follower__author=author).first()
+        page = User.objects.filter(
+            id__lt=author.id).count() // options['page_size'] + 1
+        factory = APIRequestFactory()
+        requests = (
+            ('список', {'get': 'list'}, {},
+             {'limit': options['page_size'], 'page': page}),
+            ('автор', {'get': 'retrieve'}, {'id': author.id}, {}),
+        )
+        try:
+            for name, actions, kwargs, params in requests:
+                for label, viewset in (
+                        ('prefetch', LegacyUsersViewSet),
+                        ('only + EXISTS', UsersViewSet)):
+                    view = viewset.as_view(actions)
+                    timings, peaks = [], []
+                    for _ in range(options['repeat']):
+                        request = factory.get(
+                            '/api/users/', params,
+                            HTTP_HOST=settings.ALLOWED_HOSTS[0])
+                        force_authenticate(request, viewer)
+                        tracemalloc.start()
+                        started = time.perf_counter()
+                        with CaptureQueriesContext(connection) as queries:
+                            response = view(request, **kwargs)
+                            response.render()
+                        timings.append(time.perf_counter() - started)
+                        peaks.append(tracemalloc.get_traced_memory()[1])
+                        tracemalloc.stop()
+                    self.stdout.write(
+                        f'{name:<8}{label:<15}'
+                        f'запросов {len(queries):>3}  '
+                        f'медиана '
+                        f'{statistics.median(timings) * 1000:8.1f} мс  '
+                        f'пик памяти {max(peaks) / 2 ** 20:7.1f} МБ')
+        finally:
+            if not options['keep']:
+                Subscribe.objects.filter(author=author).delete()
+                User.objects.filter(email__startswith=PREFIX).delete()
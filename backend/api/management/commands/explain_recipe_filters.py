@@ -0,0 +1,67 @@
+import re
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db.models import Count, Value
+from django.http import QueryDict
+
+from api.filter_cache import tag_ids_by_slug
+from api.filters import RecipeFilter
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+# Полный проход по таблице рецептов: SQLite и PostgreSQL.
+FULL_SCAN = re.compile(
+    r'^\s*(?:\d+ \d+ \d+ )?SCAN recipes_recipe\s*$'
+    r'|Seq Scan on recipes_recipe\b', re.MULTILINE)
+
+
+def scenarios():
+    nuts = ','.join(str(pk) for pk in Ingredient.objects.filter(
+        name__icontains='орех').values_list('id', flat=True)) or '0'
+    popular = RecipeIngredient.objects.values('ingredient_id').annotate(
+        recipes=Count('id')).order_by('-recipes').first()
+    tag = next(iter(sorted(tag_ids_by_slug())), '')
+    return (
+        ('быстрые', 'cooking_time_max=15'),
+        ('быстрые без орехов', f'tags={tag}&cooking_time_max=15'
+                               f'&exclude_ingredients={nuts}'),
+        ('с ингредиентом', 'ingredients='
+                           f'{popular["ingredient_id"] if popular else 0}'),
+        ('за период', 'pub_date_after=2020-01-01T00:00:00'
+                      '&pub_date_before=2020-02-01T00:00:00'),
+        ('сортировка', 'ordering=cooking_time,-pub_date'),
+        ('диапазон + сортировка',
+         'cooking_time_min=10&cooking_time_max=20&ordering=-cooking_time'),
+    )
+
+
+class Command(BaseCommand):
+    help = 'Планы запросов фильтра рецептов: диапазоны, ингредиенты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=6)
+        parser.add_argument(
+            '--fail-on-scan', action='store_true',
+            help='Ошибка, если рецепты читаются полным проходом.')
+
+    def handle(self, *args, **options):
+        queryset = Recipe.objects.annotate(
+            is_favorited=Value(False), is_in_shopping_cart=Value(False))
+        scans = []
+        for name, query in scenarios():
+            filterset = RecipeFilter(QueryDict(query), queryset=queryset)
+            if not filterset.is_valid():
+                raise CommandError(f'{name}: {filterset.errors}')
+            page = filterset.qs[:options['page_size']]
+            started = time.perf_counter()
+            count = filterset.qs.count()
+            list(page)
+            elapsed = (time.perf_counter() - started) * 1000
+            plan = page.explain()
+            if FULL_SCAN.search(plan):
+                scans.append(name)
+            self.stdout.write(
+                f'== {name}: {query}\n'
+                f'найдено {count}, {elapsed:.1f} мс\n{plan}\n')
+        if scans and options['fail_on_scan']:
+            raise CommandError(f'Полный проход: {", ".join(scans)}.')
@@ -0,0 +1,26 @@
+import sys
+
+from django.core.management import BaseCommand, CommandError
+
+from api.user_data import export_lines
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Выгружаем рецепты, избранное и корзину пользователя в JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email')
+        parser.add_argument(
+            '-o', '--output', default='-',
+            help='Файл выгрузки, по умолчанию stdout.')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(email=options['email']).first()
+        if user is None:
+            raise CommandError(f'Нет пользователя {options["email"]}.')
+        if options['output'] == '-':
+            sys.stdout.buffer.writelines(export_lines(user))
+            return
+        with open(options['output'], 'wb') as file:
+            file.writelines(export_lines(user))
@@ -0,0 +1,32 @@
+import sys
+
+from django.core.management import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from api.user_data import import_lines
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Загружаем рецепты, избранное и корзину пользователя из JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email')
+        parser.add_argument(
+            'input', nargs='?', default='-',
+            help='Файл выгрузки, по умолчанию stdin.')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(email=options['email']).first()
+        if user is None:
+            raise CommandError(f'Нет пользователя {options["email"]}.')
+        try:
+            if options['input'] == '-':
+                counts = import_lines(user, sys.stdin.buffer)
+            else:
+                with open(options['input'], 'rb') as file:
+                    counts = import_lines(user, file)
+        except ValidationError as error:
+            raise CommandError(error.detail['errors'])
+        self.stdout.write(self.style.SUCCESS(', '.join(
+            f'{name}: {count}' for name, count in counts.items())))
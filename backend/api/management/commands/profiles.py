@@ -0,0 +1,59 @@
+import io
+import pstats
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from api.profiling import ProfileStorage
+
+
+class Command(BaseCommand):
+    help = 'Просмотр и агрегация профилей, собранных ProfilingMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action', choices=('list', 'aggregate'),
+            help='list - список профилей, aggregate - сводная статистика.')
+        parser.add_argument(
+            '--view', help='Только профили этого view, например '
+                           'api:recipe-list.')
+        parser.add_argument(
+            '--last', type=int,
+            help='Только N последних профилей.')
+        parser.add_argument(
+            '--sort', default='cumulative',
+            help='Ключ сортировки pstats: cumulative, tottime, calls...')
+        parser.add_argument(
+            '--limit', type=int, default=30,
+            help='Сколько строк статистики показать.')
+
+    def handle(self, *args, **options):
+        storage = ProfileStorage(
+            settings.PROFILING_DIR, settings.PROFILING_MAX_FILES)
+        entries = [
+            (path, meta) for path, meta in storage.entries()
+            if not options['view'] or meta['view'] == options['view']]
+        if options['last']:
+            entries = entries[-options['last']:]
+        if not entries:
+            raise CommandError('Профилей не найдено.')
+        if options['action'] == 'list':
+            for _, meta in entries:
+                created = datetime.fromtimestamp(meta['created'])
+                self.stdout.write(
+                    f'{created:%Y-%m-%d %H:%M:%S} {meta["duration_ms"]:>9} мс '
+                    f'{meta["status"]} {meta["reason"]:<6} '
+                    f'{meta["view"]} {meta["method"]} {meta["path"]}')
+            return
+        output = io.StringIO()
+        stats = pstats.Stats(entries[0][0], stream=output)
+        for path, _ in entries[1:]:
+            stats.add(path)
+        stats.strip_dirs().sort_stats(options['sort']).print_stats(
+            options['limit'])
+        total = sum(meta['duration_ms'] for _, meta in entries)
+        self.stdout.write(
+            f'Профилей: {len(entries)}, '
+            f'среднее время: {total / len(entries):.1f} мс')
+        self.stdout.write(output.getvalue())
@@ -0,0 +1,234 @@
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+current_stats = ContextVar('current_stats', default=None)
+
+
+class RequestStats:
+    """Замеры одного запроса: SQL, сериализация, рендеринг."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.render_started = None
+        self.render_time = 0.0
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def slowest_queries(self, count):
+        return sorted(self.queries, reverse=True)[:count]
+
+
+def record_query(execute, sql, params, many, context):
+    """execute_wrapper: считаем время и число запросов к БД."""
+
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.db_time += elapsed
+        stats.queries.append((elapsed, sql))
+
+
+@receiver(connection_created)
+def track_queries(sender, connection, **kwargs):
+    """record_query на каждом соединении, и в потоках async ORM тоже.
+
+    Вне запроса (current_stats пуст) обертка ничего не делает.
+    """
+
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedSerializerMixin:
+    """Учитываем время сериализации во внешнем to_representation."""
+
+    def to_representation(self, instance):
+        stats = current_stats.get()
+        if stats is None:
+            return super().to_representation(instance)
+        stats.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_depth -= 1
+            if not stats.serializer_depth:
+                stats.serializer_time += time.perf_counter() - started
+
+
+def _labels(labels):
+    return ','.join(
+        f'{key}="{str(value)}"'.replace('\n', ' ')
+        for key, value in sorted(labels))
+
+
+def _merge(counters, histograms, snapshot):
+    for name, labels, value in snapshot['counters']:
+        counters[(name, tuple(map(tuple, labels)))] += value
+    for name, labels, buckets, total in snapshot['histograms']:
+        key = (name, tuple(map(tuple, labels)))
+        old_buckets, old_total = histograms.get(key, ([0] * len(buckets), 0))
+        histograms[key] = (
+            [old + new for old, new in zip(old_buckets, buckets)],
+            old_total + total)
+
+
+class Registry:
+    """Счетчики и гистограммы в формате Prometheus.
+
+    С METRICS_DIR каждый процесс не позже чем через METRICS_FLUSH_SECONDS
+    после запроса пишет свои значения в <pid>.json, а render суммирует
+    все файлы. Файлы завершившихся воркеров остаются: счетчики не убывают.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.help = {}
+        self.clear()
+        # После fork (preload) счетчики мастера не копируем в воркеры.
+        os.register_at_fork(after_in_child=self.clear)
+
+    def clear(self):
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.flushed_at = time.monotonic()
+        self.timer = None
+
+    def describe(self, name, kind, text):
+        self.help[name] = (kind, text)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(labels.items()))
+        with self.lock:
+            self.counters[key] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(labels.items()))
+        with self.lock:
+            buckets, total = self.histograms.get(
+                key, ([0] * (len(BUCKETS) + 1), 0.0))
+            buckets[bisect_left(BUCKETS, value)] += 1
+            self.histograms[key] = (buckets, total + value)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [
+                    (name, labels, value)
+                    for (name, labels), value in self.counters.items()],
+                'histograms': [
+                    (name, labels, list(buckets), total)
+                    for (name, labels), (buckets, total)
+                    in self.histograms.items()]}
+
+    def flush(self):
+        """Атомарно переписываем файл процесса в METRICS_DIR."""
+
+        if not settings.METRICS_DIR:
+            return
+        self.timer = None
+        self.flushed_at = time.monotonic()
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        path = os.path.join(settings.METRICS_DIR, f'{os.getpid()}.json')
+        temporary = f'{path}.{threading.get_ident()}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(self.snapshot(), file, default=str)
+        os.replace(temporary, path)
+
+    def maybe_flush(self):
+        """После запроса: файл сразу или таймером, но не чаще интервала."""
+
+        if not settings.METRICS_DIR or self.timer is not None:
+            return
+        delay = (self.flushed_at + settings.METRICS_FLUSH_SECONDS
+                 - time.monotonic())
+        if delay <= 0:
+            self.flush()
+            return
+        self.timer = threading.Timer(delay, self.flush)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def collect(self):
+        """Значения всех процессов: свои - сейчас, чужие - из файлов."""
+
+        counters, histograms = defaultdict(float), {}
+        if not settings.METRICS_DIR:
+            _merge(counters, histograms, self.snapshot())
+            return counters, histograms
+        self.flush()
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+            try:
+                with open(path) as file:
+                    _merge(counters, histograms, json.load(file))
+            except (OSError, ValueError):
+                continue
+        return counters, histograms
+
+    def render(self):
+        lines = []
+        counters, histograms = self.collect()
+        counters, histograms = sorted(counters.items()), sorted(
+            histograms.items())
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen and name in self.help:
+                seen.add(name)
+                lines.append(f'# HELP {name} {self.help[name][1]}')
+                lines.append(f'# TYPE {name} {self.help[name][0]}')
+            lines.append(f'{name}{{{_labels(labels)}}} {value}')
+        for (name, labels), (buckets, total) in histograms:
+            if name not in seen and name in self.help:
+                seen.add(name)
+                lines.append(f'# HELP {name} {self.help[name][1]}')
+                lines.append(f'# TYPE {name} histogram')
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), buckets):
+                cumulative += count
+                bucket_labels = _labels(labels + (('le', bound),))
+                lines.append(f'{name}_bucket{{{bucket_labels}}} {cumulative}')
+            lines.append(f'{name}_sum{{{_labels(labels)}}} {total}')
+            lines.append(f'{name}_count{{{_labels(labels)}}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+registry.describe(
+    'foodgram_requests_total', 'counter', 'Число запросов.')
+registry.describe(
+    'foodgram_request_duration_seconds', 'histogram',
+    'Время обработки запроса.')
+registry.describe(
+    'foodgram_db_queries_total', 'counter', 'Число SQL запросов.')
+registry.describe(
+    'foodgram_db_duration_seconds_total', 'counter', 'Время в БД.')
+registry.describe(
+    'foodgram_serializer_duration_seconds_total', 'counter',
+    'Время сериализации.')
+registry.describe(
+    'foodgram_response_bytes_total', 'counter', 'Размер ответов.')
+registry.describe(
+    'foodgram_slow_requests_total', 'counter', 'Число медленных запросов.')
@@ -0,0 +1,312 @@
+import cProfile
+import hashlib
+import logging
+import random
+import time
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import Resolver404, resolve
+from django.utils.cache import patch_vary_headers
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+
+from api.compression import accepted_encoding, compress, is_compressible
+from api.metrics import RequestStats, current_stats, registry
+from api.profiling import ProfileStorage
+from foodgram.routers import use_replica
+
+logger = logging.getLogger('foodgram.performance')
+
+
+class HybridMiddleware:
+    """Работает и в синхронном, и в асинхронном стеке.
+
+    Под ASGI асинхронные представления не уходят из-за нас в поток.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+
+class PerformanceMiddleware(HybridMiddleware):
+    """Время запроса, SQL и сериализации: Server-Timing и метрики."""
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.slow_request = settings.PERF_SLOW_REQUEST_MS / 1000
+        self.slow_queries = settings.PERF_SLOW_QUERIES_LOGGED
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.finish(request, response, stats)
+
+    async def __acall__(self, request):
+        # Потоки sync_to_async получают копию контекста с теми же stats.
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.finish(request, response, stats)
+
+    def finish(self, request, response, stats):
+        if stats.render_started is not None:
+            stats.render_time = time.perf_counter() - stats.render_started
+        self.report(request, response, stats)
+        registry.maybe_flush()
+        return response
+
+    def process_template_response(self, request, response):
+        stats = current_stats.get()
+        if stats is not None:
+            stats.render_started = time.perf_counter()
+        return response
+
+    def report(self, request, response, stats):
+        total = stats.total
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        size = 0 if response.streaming else len(response.content)
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={stats.db_time * 1000:.1f};'
+            f'desc="{len(stats.queries)} queries"',
+            f'serializer;dur={stats.serializer_time * 1000:.1f}',
+            f'render;dur={stats.render_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}'))
+        registry.inc(
+            'foodgram_requests_total', view=view,
+            method=request.method, status=response.status_code)
+        registry.observe(
+            'foodgram_request_duration_seconds', total, view=view)
+        registry.inc(
+            'foodgram_db_queries_total', len(stats.queries), view=view)
+        registry.inc(
+            'foodgram_db_duration_seconds_total', stats.db_time, view=view)
+        registry.inc(
+            'foodgram_serializer_duration_seconds_total',
+            stats.serializer_time, view=view)
+        registry.inc('foodgram_response_bytes_total', size, view=view)
+        if total < self.slow_request:
+            return
+        registry.inc('foodgram_slow_requests_total', view=view)
+        logger.warning(
+            'Медленный запрос %s %s (%s): %.0f мс, SQL %d за %.0f мс, '
+            'сериализация %.0f мс, %d байт.\n%s',
+            request.method, request.get_full_path(), view, total * 1000,
+            len(stats.queries), stats.db_time * 1000,
+            stats.serializer_time * 1000, size,
+            '\n'.join(
+                f'  {elapsed * 1000:.1f} мс: {sql}'
+                for elapsed, sql in stats.slowest_queries(
+                    self.slow_queries)))
+
+
+class ProfilingMiddleware(HybridMiddleware):
+    """cProfile для выборки запросов или по заголовку от администратора."""
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.views = set(settings.PROFILING_VIEWS)
+        self.header = 'HTTP_' + settings.PROFILING_HEADER.upper().replace(
+            '-', '_')
+        self.storage = ProfileStorage(
+            settings.PROFILING_DIR, settings.PROFILING_MAX_FILES)
+        self.random = random.Random()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        reason = self.should_profile(
+            request, self.requested(request) and self.is_admin(request))
+        if reason is None:
+            return self.get_response(request)
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.disable()
+        self.save(request, response, profile, started, reason)
+        return response
+
+    async def __acall__(self, request):
+        admin = self.requested(request) and await sync_to_async(
+            self.is_admin)(request)
+        reason = self.should_profile(request, admin)
+        if reason is None:
+            return await self.get_response(request)
+        # cProfile видит только поток цикла событий: запросы ORM
+        # из sync_to_async в профиль не попадают, чужие корутины - да.
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profile.disable()
+        await sync_to_async(self.save)(
+            request, response, profile, started, reason)
+        return response
+
+    def save(self, request, response, profile, started, reason):
+        match = request.resolver_match
+        self.storage.save(profile, {
+            'view': match.view_name if match else 'unmatched',
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+            'reason': reason,
+            'created': time.time(),
+        })
+
+    def requested(self, request):
+        return bool(request.META.get(self.header))
+
+    def should_profile(self, request, admin):
+        if admin:
+            return 'header'
+        if not self.sample_rate or self.random.random() >= self.sample_rate:
+            return None
+        if self.views:
+            try:
+                view = resolve(request.path_info).view_name
+            except Resolver404:
+                return None
+            if view not in self.views:
+                return None
+        return 'sample'
+
+    @staticmethod
+    def is_admin(request):
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            try:
+                user, _ = TokenAuthentication().authenticate(
+                    request) or (None, None)
+            except AuthenticationFailed:
+                return False
+        return user is not None and user.is_staff
+
+
+class ReplicaRoutingMiddleware(HybridMiddleware):
+    """Отправляем чтение на реплики, пока пользователь ничего не писал."""
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.views = set(settings.REPLICA_VIEWS)
+        self.sticky_seconds = settings.REPLICA_STICKY_SECONDS
+        if iscoroutinefunction(self):
+            # Иначе Django обернет синхронный process_view в поток.
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = use_replica.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replica.reset(token)
+        if client := self.sticky_client(request, response):
+            cache.set(client, True, self.sticky_seconds)
+        return response
+
+    async def __acall__(self, request):
+        token = use_replica.set(False)
+        try:
+            response = await self.get_response(request)
+        finally:
+            use_replica.reset(token)
+        if client := self.sticky_client(request, response):
+            await cache.aset(client, True, self.sticky_seconds)
+        return response
+
+    def sticky_client(self, request, response):
+        """Клиент, которого после записи держим на основной базе."""
+
+        if (request.method in SAFE_METHODS
+                or response.status_code >= 400):
+            return None
+        return self.client_key(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.readonly(request):
+            client = self.client_key(request)
+            use_replica.set(not client or not cache.get(client))
+
+    async def aprocess_view(self, request, view_func, view_args,
+                            view_kwargs):
+        if self.readonly(request):
+            client = self.client_key(request)
+            use_replica.set(not client or not await cache.aget(client))
+
+    def readonly(self, request):
+        return (settings.DATABASE_REPLICAS
+                and request.method in SAFE_METHODS
+                and request.resolver_match.view_name in self.views)
+
+    @staticmethod
+    def client_key(request):
+        credentials = request.META.get('HTTP_AUTHORIZATION')
+        if not credentials:
+            return None
+        digest = hashlib.sha256(credentials.encode()).hexdigest()
+        return f'db-primary-sticky:{digest}'
+
+
+class CompressionMiddleware(HybridMiddleware):
+    """brotli/gzip для JSON API; мелкие и потоковые ответы - как есть."""
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.min_bytes = settings.COMPRESSION_MIN_BYTES
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process(request, await self.get_response(request))
+
+    def process(self, request, response):
+        if (response.streaming
+                or response.has_header('Content-Encoding')
+                or len(response.content) < self.min_bytes
+                or not is_compressible(request, response)):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = accepted_encoding(request)
+        if encoding is None:
+            return response
+        content = compress(response.content, encoding)
+        if len(content) >= len(response.content):
+            return response
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+        # Как в GZipMiddleware: сжатое тело побайтно другое.
+        etag = response.get('ETag')
+        if etag and not etag.startswith('W/'):
+            response['ETag'] = f'W/{etag}'
+        return response
@@ -1,6 +1,34 @@
+import base64
+
+from django.utils.dateparse import parse_datetime
 from rest_framework.pagination import PageNumberPagination
 
+FEED_MAX_LIMIT = 100
+BATCH_MAX_IDS = 100
+
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+
+def encode_cursor(key):
+    pub_date, recipe_id = key
+    return base64.urlsafe_b64encode(
+        f'{pub_date.isoformat()}|{recipe_id}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Ключ (pub_date, id) из курсора; ValueError для испорченного."""
+
+    if not cursor:
+        return None
+    try:
+        pub_date, recipe_id = base64.urlsafe_b64decode(
+            cursor.encode()).decode().split('|')
+        pub_date = parse_datetime(pub_date)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(cursor)
+    if pub_date is None:
+        raise ValueError(cursor)
+    return pub_date, int(recipe_id)
@@ -0,0 +1,53 @@
+import json
+import os
+import re
+import time
+
+
+class ProfileStorage:
+    """Кольцевой буфер профилей на диске: .prof и .json с метаданными."""
+
+    def __init__(self, directory, max_files):
+        self.directory = directory
+        self.max_files = max_files
+
+    def save(self, profile, meta):
+        os.makedirs(self.directory, exist_ok=True)
+        view = re.sub(r'[^\w.-]+', '_', meta['view'])
+        name = f'{time.time_ns()}-{os.getpid()}-{view}'
+        path = os.path.join(self.directory, name)
+        profile.dump_stats(f'{path}.prof')
+        with open(f'{path}.json', 'w', encoding='utf-8') as file:
+            json.dump(meta, file, ensure_ascii=False)
+        self.trim()
+        return name
+
+    def names(self):
+        """Имена профилей от старых к новым."""
+
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            file[:-len('.json')] for file in os.listdir(self.directory)
+            if file.endswith('.json'))
+
+    def trim(self):
+        for name in self.names()[:-self.max_files]:
+            for extension in ('.json', '.prof'):
+                try:
+                    os.remove(os.path.join(
+                        self.directory, name + extension))
+                except FileNotFoundError:
+                    pass
+
+    def entries(self):
+        """Пары (путь к .prof, метаданные) от старых к новым."""
+
+        for name in self.names():
+            path = os.path.join(self.directory, name)
+            try:
+                with open(f'{path}.json', encoding='utf-8') as file:
+                    meta = json.load(file)
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+            yield f'{path}.prof', meta
@@ -0,0 +1,214 @@
+import hashlib
+import uuid
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from rest_framework.response import Response
+
+from api.serializers import recipe_fieldset
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+
+User = get_user_model()
+
+RESPONSE_KEY = 'recipes:response:{}'
+# Версия суррогатного ключа меняется при записи; ответ, сохраненный
+# при другой версии любого своего ключа, считается устаревшим.
+SURROGATE_KEY = 'recipes:surrogate:{}'
+ALL_RECIPES = 'all'
+RECIPE_LISTS = 'lists'
+
+
+def response_key(request):
+    """Адрес с отсортированным query string: ?a=1&b=2 и ?b=2&a=1 - одно.
+
+    Хост тоже в ключе: ссылки next/previous и картинок абсолютные.
+    """
+
+    query = urlencode(sorted(
+        (name, value)
+        for name, values in request.GET.lists()
+        for value in values))
+    digest = hashlib.sha256(
+        f'{request.build_absolute_uri(request.path)}?{query}'.encode()
+    ).hexdigest()
+    return RESPONSE_KEY.format(digest)
+
+
+def surrogate_keys(recipes, fieldset, many):
+    """Рецепты, авторы и тэги, попавшие в ответ.
+
+    Ключи берем из объектов, а не из тела ответа: с ?fields= в нем
+    может не быть ни id, ни связей. Поля вне fieldset не читаем -
+    их колонки не загружены, а связи не в prefetch.
+    """
+
+    keys = {ALL_RECIPES}
+    if many:
+        keys.add(RECIPE_LISTS)
+    for recipe in recipes:
+        keys.add(f'recipe:{recipe.pk}')
+        if fieldset.includes('author'):
+            keys.add(f'author:{recipe.author_id}')
+        if fieldset.includes('tags'):
+            keys.update(f'tag:{tag.pk}' for tag in recipe.tags.all())
+    return sorted(keys)
+
+
+def current_versions(keys):
+    stored = cache.get_many([SURROGATE_KEY.format(key) for key in keys])
+    return [stored.get(SURROGATE_KEY.format(key)) for key in keys]
+
+
+def ensure_versions(keys):
+    """Текущие версии ключей, недостающие заводим."""
+
+    versions = current_versions(keys)
+    missing = {
+        SURROGATE_KEY.format(key): new_version()
+        for key, version in zip(keys, versions) if version is None}
+    if missing:
+        cache.set_many(missing, None)
+        versions = current_versions(keys)
+    return versions
+
+
+def get_cached(request):
+    entry = cache.get(response_key(request))
+    if entry is None:
+        return None
+    keys, versions, data = entry
+    if current_versions(keys) != versions:
+        return None
+    return data
+
+
+def set_cached(request, data, keys, guard_keys, guard_versions):
+    """Сохраняем ответ, если guard_keys не сбросили, пока он строился."""
+
+    versions = ensure_versions(keys)
+    if current_versions(guard_keys) != guard_versions:
+        return
+    cache.set(
+        response_key(request), (keys, versions, data),
+        settings.RECIPE_CACHE_TIMEOUT)
+
+
+def new_version():
+    return uuid.uuid4().hex
+
+
+def purge(*keys):
+    """Сбрасываем ответы с этими ключами после коммита транзакции."""
+
+    transaction.on_commit(lambda: cache.set_many(
+        {SURROGATE_KEY.format(key): new_version() for key in keys}, None))
+
+
+class AnonymousCacheMixin:
+    """Кэш list/retrieve для анонимов: у них нет персональных полей."""
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(
+            super().list, (ALL_RECIPES, RECIPE_LISTS),
+            request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe_id = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self.cached(
+            super().retrieve, (ALL_RECIPES, f'recipe:{recipe_id}'),
+            request, *args, **kwargs)
+
+    def cached(self, view, guard_keys, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+        data = get_cached(request)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        guard_versions = ensure_versions(guard_keys)
+        self.serialized = ([], False)
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            recipes, many = self.serialized
+            set_cached(
+                request, response.data,
+                surrogate_keys(recipes, recipe_fieldset(request), many),
+                guard_keys, guard_versions)
+            response['X-Cache'] = 'MISS'
+        return response
+
+    def get_serializer(self, *args, **kwargs):
+        """Запоминаем рецепты ответа: по ним строятся ключи сброса."""
+
+        serializer = super().get_serializer(*args, **kwargs)
+        if args:
+            many = kwargs.get('many', False)
+            self.serialized = (args[0] if many else [args[0]], many)
+        return serializer
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        if request.method in ('GET', 'HEAD'):
+            patch_vary_headers(response, ('Authorization', 'Accept'))
+            if request.user.is_authenticated:
+                patch_cache_control(response, private=True, no_cache=True)
+            elif response.status_code == 200:
+                patch_cache_control(
+                    response, public=True,
+                    max_age=settings.RECIPE_CACHE_MAX_AGE)
+        return response
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def purge_recipe(sender, instance, **kwargs):
+    purge(f'recipe:{instance.id}', RECIPE_LISTS)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def purge_recipe_ingredient(sender, instance, **kwargs):
+    purge(f'recipe:{instance.recipe_id}', RECIPE_LISTS)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def purge_recipe_relations(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse and pk_set is None:
+        purge(ALL_RECIPES)
+    elif reverse:
+        purge(RECIPE_LISTS, *(f'recipe:{pk}' for pk in pk_set))
+    else:
+        purge(f'recipe:{instance.id}', RECIPE_LISTS)
+
+
+@receiver(post_save, sender=Tag)
+def purge_tag(sender, instance, **kwargs):
+    purge(f'tag:{instance.id}')
+
+
+@receiver(post_delete, sender=Tag)
+def purge_deleted_tag(sender, instance, **kwargs):
+    purge(f'tag:{instance.id}', RECIPE_LISTS)
+
+
+@receiver(post_save, sender=User)
+def purge_author(sender, instance, created, update_fields, **kwargs):
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    purge(f'author:{instance.id}')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def purge_ingredient(sender, instance, **kwargs):
+    # Ингредиент может быть в любом рецепте: сбрасываем все.
+    purge(ALL_RECIPES)
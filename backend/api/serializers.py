@@ -4,8 +4,14 @@ from django.contrib.auth.hashers import make_password
 from django.shortcuts import get_object_or_404
 from drf_base64.fields import Base64ImageField
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 
-from recipes.models import Ingredient, Recipe, RecipeIngredient, Subscribe, Tag
+from api.fieldsets import Fieldset
+from api.metrics import TimedSerializerMixin
+from jobs.models import Job
+from recipes.models import (MAX_SERVINGS, Ingredient, Recipe,
+                            RecipeIngredient, Subscribe, Tag)
+from recipes.nutrition import recipe_totals
 
 User = get_user_model()
 ERR_MSG = 'Не удается войти в систему с предоставленными учетными данными.'
@@ -49,15 +55,18 @@ class GetIsSubscribedMixin:
 
     def get_is_subscribed(self, obj):
         user = self.context['request'].user
-        return (
-            user.follower.filter(author=obj).exists()
-            if user.is_authenticated
-            else False
-        )
+        if not user.is_authenticated:
+            return False
+        # Для страницы рецептов подписки выбираются одним запросом.
+        subscribed = self.context.get('subscribed_authors')
+        if subscribed is not None:
+            return obj.id in subscribed
+        return user.follower.filter(author=obj).exists()
 
 
 class UserListSerializer(
         GetIsSubscribedMixin,
+        TimedSerializerMixin,
         serializers.ModelSerializer):
     is_subscribed = serializers.BooleanField(read_only=True)
 
@@ -109,7 +118,9 @@ class UserPasswordSerializer(serializers.Serializer):
         return validated_data
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(
+        TimedSerializerMixin,
+        serializers.ModelSerializer):
 
     class Meta:
         model = Tag
@@ -117,7 +128,9 @@ class TagSerializer(serializers.ModelSerializer):
             'id', 'name', 'color', 'slug',)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(
+        TimedSerializerMixin,
+        serializers.ModelSerializer):
 
     class Meta:
         model = Ingredient
@@ -247,7 +260,50 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             }).data
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+def wants_nutrition(request):
+    return bool(request) and request.GET.get('nutrition') in ('1', 'true')
+
+
+RECIPE_FIELDS = (
+    'id', 'tags', 'author', 'ingredients', 'is_favorited',
+    'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time',
+    'pub_date')
+RECIPE_RELATIONS = ('tags', 'author', 'ingredients')
+
+
+def recipe_fieldset(request):
+    return Fieldset(request, RECIPE_FIELDS, RECIPE_RELATIONS)
+
+
+class RecipeIngredientAmountSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(
+        source='ingredient_id')
+
+    class Meta:
+        model = RecipeIngredient
+        fields = ('id', 'amount')
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Подписки на авторов, КБЖУ и цена - для всей страницы разом."""
+
+    def to_representation(self, data):
+        recipes = list(data.all() if hasattr(data, 'all') else data)
+        request = self.context.get('request')
+        if (request and request.user.is_authenticated
+                and recipe_fieldset(request).expands('author')):
+            self._context['subscribed_authors'] = set(
+                request.user.follower.filter(
+                    author_id__in={recipe.author_id for recipe in recipes}
+                ).values_list('author_id', flat=True))
+        if wants_nutrition(request):
+            self._context['nutrition'] = recipe_totals(recipes)
+        return super().to_representation(recipes)
+
+
+class RecipeReadSerializer(
+        TimedSerializerMixin,
+        serializers.ModelSerializer):
     image = Base64ImageField()
     tags = TagSerializer(
         many=True,
@@ -263,20 +319,55 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         read_only=True)
     is_in_shopping_cart = serializers.BooleanField(
         read_only=True)
+    nutrition = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = '__all__'
+        list_serializer_class = RecipeListSerializer
 
-
-class SubscribeRecipeSerializer(serializers.ModelSerializer):
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if not wants_nutrition(request):
+            fields.pop('nutrition')
+        fieldset = recipe_fieldset(request)
+        for name in RECIPE_FIELDS:
+            if not fieldset.includes(name):
+                fields.pop(name)
+            elif name in RECIPE_RELATIONS and not fieldset.expands(name):
+                fields[name] = self.compact_field(name)
+        return fields
+
+    def compact_field(self, name):
+        """Связь, свернутая до id (без expand)."""
+
+        if name == 'tags':
+            return serializers.PrimaryKeyRelatedField(
+                many=True, read_only=True)
+        if name == 'author':
+            return serializers.ReadOnlyField(source='author_id')
+        return RecipeIngredientAmountSerializer(many=True, source='recipe')
+
+    def get_nutrition(self, obj):
+        totals = self.context.get('nutrition') or {}
+        if obj.id not in totals:
+            totals = recipe_totals([obj])
+        return totals[obj.id]
+
+
+class SubscribeRecipeSerializer(
+        TimedSerializerMixin,
+        serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
-class SubscribeSerializer(serializers.ModelSerializer):
+class SubscribeSerializer(
+        TimedSerializerMixin,
+        serializers.ModelSerializer):
     id = serializers.IntegerField(
         source='author.id')
     email = serializers.EmailField(
@@ -308,3 +399,34 @@ class SubscribeSerializer(serializers.ModelSerializer):
         return SubscribeRecipeSerializer(
             recipes,
             many=True).data
+
+
+class CartServingsSerializer(serializers.Serializer):
+    servings = serializers.IntegerField(
+        label='Множитель порций',
+        min_value=1,
+        max_value=MAX_SERVINGS,
+        default=1)
+
+
+class JobSerializer(serializers.ModelSerializer):
+    status_url = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = (
+            'id', 'name', 'status', 'attempts', 'created',
+            'status_url', 'download_url')
+
+    def get_status_url(self, obj):
+        return reverse(
+            'api:job', args=(obj.id,),
+            request=self.context.get('request'))
+
+    def get_download_url(self, obj):
+        if obj.status != Job.DONE:
+            return None
+        return reverse(
+            'api:job_download', args=(obj.id,),
+            request=self.context.get('request'))
@@ -0,0 +1,172 @@
+import functools
+import hashlib
+import io
+import json
+import os
+import uuid
+
+from django.conf import settings
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.aggregates import Sum
+from django.db.models.functions import Coalesce
+
+from recipes.models import RecipeIngredient, UnitConversion
+from recipes.nutrition import cart_totals
+
+FILENAME = 'shoppingcart.pdf'
+# Меняем версию при изменении верстки PDF, чтобы не отдавать старый кэш.
+PDF_FORMAT = 'pdf-v3'
+CACHE_DIR = 'shopping_lists/cache'
+
+
+def cart_items(user):
+    """Ингредиенты рецептов корзины, умноженные на число порций."""
+
+    return RecipeIngredient.objects.filter(
+        recipe__shopping_cart_entries__shoppingcart__user=user,
+    ).annotate(scaled_amount=(
+        F('amount') * F('recipe__shopping_cart_entries__servings')))
+
+
+def unit_conversion(field):
+    return Subquery(UnitConversion.objects.filter(
+        unit=OuterRef('ingredient__measurement_unit'),
+    ).order_by().values(field)[:1])
+
+
+def shopping_list(user):
+    """Список покупок одним запросом с группировкой.
+
+    Единицы из UnitConversion сводятся к базовым, так что "г" и "кг"
+    одного продукта попадают в одну строку.
+    """
+
+    return cart_items(user).values(
+        name=F('ingredient__name'),
+        measurement_unit=Coalesce(
+            unit_conversion('base_unit'), F('ingredient__measurement_unit')),
+    ).annotate(amount=Sum(
+        F('scaled_amount')
+        * Coalesce(unit_conversion('factor'), Value(1.0)))
+    ).order_by('name', 'measurement_unit')
+
+
+def shopping_list_totals(user):
+    """КБЖУ и цена корзины: по исходным ингредиентам, без сведения единиц."""
+
+    return cart_totals(list(cart_items(user).values(
+        'ingredient_id').annotate(amount=Sum('scaled_amount')).order_by()))
+
+
+def format_amount(amount):
+    """Два знака после запятой без хвостовых нулей: 1234567, 2.5, 0.33."""
+
+    return f'{amount:.2f}'.rstrip('0').rstrip('.')
+
+
+@functools.cache
+def pdf_canvas():
+    """Класс холста reportlab, шрифт регистрируется один раз.
+
+    reportlab (и Pillow за ним) нужен только для PDF, поэтому грузится
+    при первом рендере, а не при импорте views.
+    """
+
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+
+    pdfmetrics.registerFont(TTFont('Vera', 'Vera.ttf'))
+    return canvas.Canvas
+
+
+def render_pdf(shopping_cart, totals):
+    """PDF со списком покупок."""
+
+    buffer = io.BytesIO()
+    page = pdf_canvas()(buffer)
+    x_position, y_position = 50, 800
+    page.setFont('Vera', 14)
+    if shopping_cart:
+        indent = 20
+        page.drawString(x_position, y_position, 'Cписок покупок:')
+        for index, recipe in enumerate(shopping_cart, start=1):
+            page.drawString(
+                x_position, y_position - indent,
+                f'{index}. {recipe["name"]} - '
+                f'{format_amount(recipe["amount"])} '
+                f'{recipe["measurement_unit"]}.')
+            y_position -= 15
+            if y_position <= 50:
+                page.showPage()
+                y_position = 800
+        for line in totals_lines(totals):
+            y_position -= 15
+            page.drawString(x_position, y_position - indent, line)
+        page.save()
+        return buffer.getvalue()
+    page.setFont('Vera', 24)
+    page.drawString(
+        x_position,
+        y_position,
+        'Cписок покупок пуст!')
+    page.save()
+    return buffer.getvalue()
+
+
+def totals_lines(totals):
+    lines = [
+        f'Итого: {totals["calories"]:.0f} ккал, ~{totals["price"]:.2f} руб.',
+        f'Белки {totals["proteins"]:.0f} г, жиры {totals["fats"]:.0f} г, '
+        f'углеводы {totals["carbohydrates"]:.0f} г.']
+    if not totals['complete']:
+        lines.append('Не для всех продуктов есть данные.')
+    return lines
+
+
+def cache_key(shopping_cart, totals, file_format=PDF_FORMAT):
+    rows = sorted(
+        (row['name'], row['measurement_unit'], format_amount(row['amount']))
+        for row in shopping_cart)
+    # Итоги зависят от справочника ингредиентов, а не только от корзины.
+    return hashlib.sha256(json.dumps(
+        [file_format, rows, totals], ensure_ascii=False, default=str
+    ).encode()).hexdigest()
+
+
+def cached_pdf(shopping_cart, totals):
+    """Путь к PDF в PRIVATE_MEDIA_ROOT; одинаковые списки - один рендер."""
+
+    name = f'{CACHE_DIR}/{cache_key(shopping_cart, totals)}.pdf'
+    path = os.path.join(settings.PRIVATE_MEDIA_ROOT, name)
+    try:
+        os.utime(path)
+        return name
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(render_pdf(shopping_cart, totals))
+    os.replace(tmp_path, path)
+    evict(os.path.dirname(path), settings.SHOPPING_LIST_CACHE_MAX_BYTES)
+    return name
+
+
+def evict(directory, max_bytes):
+    """LRU по mtime: удаляем давно не запрошенные файлы сверх лимита."""
+
+    files = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.pdf'):
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
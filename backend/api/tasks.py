@@ -0,0 +1,23 @@
+import uuid
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+
+from api.shopping_list import render_pdf, shopping_list, shopping_list_totals
+from jobs.queue import task
+
+
+@task('shopping_cart_pdf')
+def shopping_cart_pdf(job):
+    """Готовим PDF списка покупок в закрытом хранилище.
+
+    Имя случайное: по id задачи чужой файл не подобрать. Файл удаляется
+    вместе с задачей (jobs.queue.delete_result_file).
+    """
+
+    name = storages['private'].save(
+        f'shopping_lists/jobs/{uuid.uuid4().hex}.pdf',
+        ContentFile(render_pdf(
+            list(shopping_list(job.user)),
+            shopping_list_totals(job.user))))
+    return {'file': name}
@@ -0,0 +1,693 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Value
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+
+from api.filter_cache import tag_ids_by_slug
+from api.filters import RecipeFilter
+from api.management.commands.explain_recipe_filters import FULL_SCAN
+from api.metrics import Registry
+from api.shopping_list import (format_amount, render_pdf, shopping_list,
+                               shopping_list_totals)
+from api.user_data import export_lines, import_lines
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCartRecipe, Subscribe, Tag,
+                            TimelineEntry, UnitConversion)
+from recipes.nutrition import VERSION_KEY, get_table
+
+User = get_user_model()
+INGREDIENTS_CSV = os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv')
+
+
+def csv_units():
+    with open(INGREDIENTS_CSV, encoding='utf-8', newline='') as file:
+        return {row['measurement_unit'] for row in csv.DictReader(file)}
+
+
+class ShoppingListUnitsTests(TestCase):
+    """Сведение единиц на реальном справочнике data/ingredients.csv."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('load_ingrs', INGREDIENTS_CSV, stdout=io.StringIO())
+        cls.user = User.objects.create_user(
+            email='cook@example.com', username='cook',
+            first_name='Повар', last_name='Поваров')
+
+    def ingredient(self, name, unit):
+        return Ingredient.objects.get(name=name, measurement_unit=unit)
+
+    def add_to_cart(self, servings, *items):
+        recipe = Recipe.objects.create(
+            author=self.user, name=f'Рецепт {Recipe.objects.count()}',
+            text='Текст', cooking_time=10, image='recipe.png')
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient=self.ingredient(name, unit),
+                amount=amount)
+            for name, unit, amount in items)
+        ShoppingCartRecipe.objects.create(
+            shoppingcart=self.user.shopping_cart, recipe=recipe,
+            servings=servings)
+
+    def rows(self):
+        return {
+            (row['name'], row['measurement_unit']): row['amount']
+            for row in shopping_list(self.user)}
+
+    def test_csv_units_convert_to_base_units(self):
+        units = csv_units()
+        conversions = {
+            unit: (base_unit, factor)
+            for unit, base_unit, factor in UnitConversion.objects.filter(
+                unit__in=units).values_list('unit', 'base_unit', 'factor')}
+        self.assertEqual(conversions, {
+            'кг': ('г', 1000),
+            'л': ('мл', 1000),
+            'стакан': ('мл', 250),
+            'ст. л.': ('мл', 15),
+            'ч. л.': ('мл', 5),
+        })
+        self.assertTrue(
+            {base_unit for base_unit, _ in conversions.values()} <= units)
+
+    def test_servings_and_units_are_merged(self):
+        self.add_to_cart(
+            3,
+            ('снежок', 'л', 1),
+            ('пекарский порошок', 'ч. л.', 2),
+            ('пекарский порошок', 'г', 10),
+            ('стейк семги', 'шт.', 1),
+            ('бараньи антрекоты', 'кг', 1))
+        self.add_to_cart(
+            2,
+            ('снежок', 'л', 2),
+            ('бараньи антрекоты', 'кг', 2))
+        self.assertEqual(self.rows(), {
+            ('снежок', 'мл'): 7000,
+            ('пекарский порошок', 'мл'): 30,
+            ('пекарский порошок', 'г'): 30,
+            ('стейк семги', 'шт.'): 3,
+            ('бараньи антрекоты', 'г'): 7000,
+        })
+
+    def test_every_csv_unit_in_one_cart(self):
+        units = sorted(csv_units())
+        ingredients = [
+            Ingredient.objects.filter(measurement_unit=unit).first()
+            for unit in units]
+        self.add_to_cart(1, *(
+            (ingredient.name, ingredient.measurement_unit, 3)
+            for ingredient in ingredients))
+        conversions = dict(UnitConversion.objects.values_list(
+            'unit', 'base_unit'))
+        rows = self.rows()
+        self.assertEqual(len(rows), len(units))
+        for ingredient in ingredients:
+            unit = conversions.get(
+                ingredient.measurement_unit, ingredient.measurement_unit)
+            self.assertIn((ingredient.name, unit), rows)
+        pdf = render_pdf(
+            list(shopping_list(self.user)),
+            shopping_list_totals(self.user))
+        self.assertTrue(pdf.startswith(b'%PDF'))
+
+    def test_format_amount(self):
+        self.assertEqual(format_amount(1234567), '1234567')
+        self.assertEqual(format_amount(7000.0), '7000')
+        self.assertEqual(format_amount(2.5), '2.5')
+        self.assertEqual(format_amount(1 / 3), '0.33')
+
+
+class AnonymousRecipeCacheTests(TestCase):
+    """Кэш ответов для анонимов, в том числе с ?fields= без id."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Авторов')
+        cls.recipe = Recipe.objects.create(
+            author=author, name='Борщ', text='Текст', cooking_time=60,
+            image='recipe.png')
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url):
+        response = self.client.get(url, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_sparse_responses_are_purged(self):
+        urls = ('/api/recipes/?fields=name',
+                f'/api/recipes/{self.recipe.id}/?fields=name')
+        for number, url in enumerate(urls):
+            with self.subTest(url=url):
+                self.assertEqual(self.get(url)['X-Cache'], 'MISS')
+                self.assertEqual(self.get(url)['X-Cache'], 'HIT')
+                self.recipe.name = f'Щи {number}'
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.recipe.save()
+                response = self.get(url)
+                self.assertEqual(response['X-Cache'], 'MISS')
+                data = response.json()
+                self.assertEqual(
+                    data['results'][0] if 'results' in data else data,
+                    {'name': self.recipe.name})
+
+
+class CompressionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('load_ingrs', INGREDIENTS_CSV, stdout=io.StringIO())
+
+    def get(self, url):
+        return self.client.get(
+            url, HTTP_HOST='localhost', HTTP_ACCEPT_ENCODING='gzip')
+
+    def test_api_json_is_compressed(self):
+        response = self.get('/api/ingredients/?name=а')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_html_is_not_compressed(self):
+        # BREACH: в HTML CSRF-токен рядом с данными из запроса.
+        for url in ('/admin/login/', '/api/ingredients/?format=api'):
+            with self.subTest(url=url):
+                response = self.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class ReferenceReloadTests(TestCase):
+    """Сжатые списки тэгов и ингредиентов сбрасываются после load_*."""
+
+    def setUp(self):
+        cache.clear()
+
+    def load(self, command, records):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'data.json')
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(records, file)
+            call_command(command, path, stdout=io.StringIO())
+
+    def assert_reloaded(self, url, command, records, expected):
+        old = self.client.get(url, HTTP_HOST='localhost')
+        self.assertEqual(old.json(), [])
+        self.load(command, records)
+        response = self.client.get(
+            url, HTTP_HOST='localhost', HTTP_IF_NONE_MATCH=old['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], old['ETag'])
+        self.assertEqual(
+            [item['name'] for item in response.json()], expected)
+
+    def test_tags(self):
+        self.assertEqual(tag_ids_by_slug(), {})
+        self.assert_reloaded(
+            '/api/tags/', 'load_tags',
+            [{'name': 'Завтрак', 'color': '#E26C2D', 'slug': 'breakfast'}],
+            ['Завтрак'])
+        # Кэш slug -> id для фильтра тоже обновлен.
+        self.assertEqual(
+            tag_ids_by_slug(),
+            {'breakfast': Tag.objects.get(slug='breakfast').id})
+
+    def test_ingredients(self):
+        get_table()
+        version = cache.get(VERSION_KEY)
+        self.assert_reloaded(
+            '/api/ingredients/', 'load_ingrs',
+            [{'name': 'соль', 'measurement_unit': 'г'}], ['соль'])
+        self.assertNotEqual(cache.get(VERSION_KEY), version)
+
+
+class RecipeFilterTests(TestCase):
+    """Что возвращают фильтры и сортировка рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Авторов')
+        cls.salt, cls.sugar, cls.nuts = Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('соль', 'сахар', 'грецкий орех'))
+        cls.recipes = Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'Рецепт {number}', text='Текст',
+                   cooking_time=cooking_time, image='recipe.png')
+            for number, cooking_time in enumerate((10, 20, 20, 30)))
+        day = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        Recipe.objects.update(pub_date=day)
+        Recipe.objects.filter(id=cls.recipes[3].id).update(
+            pub_date=day + timedelta(days=1))
+        contents = (
+            (cls.salt,), (cls.salt, cls.sugar),
+            (cls.salt, cls.sugar, cls.nuts), (cls.sugar,))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe, ingredients in zip(cls.recipes, contents)
+            for ingredient in ingredients)
+
+    def ids(self, query):
+        filterset = RecipeFilter(
+            QueryDict(query), queryset=Recipe.objects.all())
+        self.assertTrue(filterset.is_valid(), filterset.errors)
+        numbers = {recipe.id: number
+                   for number, recipe in enumerate(self.recipes)}
+        return [numbers[pk] for pk in filterset.qs.values_list(
+            'id', flat=True)]
+
+    def test_ingredients_require_all(self):
+        self.assertEqual(
+            sorted(self.ids(f'ingredients={self.salt.id},{self.sugar.id}')),
+            [1, 2])
+
+    def test_exclude_ingredients_drop_any(self):
+        self.assertEqual(
+            sorted(self.ids(
+                f'exclude_ingredients={self.sugar.id},{self.nuts.id}')),
+            [0])
+
+    def test_ranges_are_inclusive(self):
+        self.assertEqual(
+            sorted(self.ids('cooking_time_min=20&cooking_time_max=30')),
+            [1, 2, 3])
+        self.assertEqual(
+            sorted(self.ids('pub_date_after=2024-01-02T00:00:00Z'
+                            '&pub_date_before=2024-01-02T00:00:00Z')),
+            [3])
+
+    def test_ordering_has_id_tiebreak(self):
+        # У рецептов 1 и 2 совпадают cooking_time и pub_date.
+        for query, order_by, expected in (
+                ('cooking_time,-pub_date',
+                 ('cooking_time', '-pub_date', 'id'), [0, 1, 2, 3]),
+                ('-cooking_time,pub_date',
+                 ('-cooking_time', 'pub_date', '-id'), [3, 2, 1, 0])):
+            with self.subTest(ordering=query):
+                filterset = RecipeFilter(
+                    QueryDict(f'ordering={query}'),
+                    queryset=Recipe.objects.all())
+                self.assertTrue(filterset.is_valid())
+                self.assertEqual(filterset.qs.query.order_by, order_by)
+                self.assertEqual(self.ids(f'ordering={query}'), expected)
+
+
+class RecipeFilterPlanTests(TestCase):
+    """Фильтры рецептов читают таблицу по индексам, без полного прохода."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Авторов')
+        tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast')
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('грецкий орех', 'мука', 'сахар'))
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'Рецепт {number}', text='Текст',
+                   cooking_time=number % 60 + 1, image='recipe.png')
+            for number in range(200))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag.id)
+            for recipe in recipes[::2])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for number, recipe in enumerate(recipes)
+            for ingredient in ingredients[:number % 3 + 1])
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # На маленькой таблице PostgreSQL выберет Seq Scan даже при
+            # подходящем индексе. SET LOCAL живет до отката транзакции теста.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def test_no_full_scan(self):
+        # CommandError, если какой-то сценарий читает рецепты целиком.
+        call_command(
+            'explain_recipe_filters', fail_on_scan=True,
+            stdout=io.StringIO())
+
+    def test_filters_use_indexes(self):
+        queryset = Recipe.objects.annotate(
+            is_favorited=Value(False), is_in_shopping_cart=Value(False))
+        # PostgreSQL может пройти индекс сортировки (-pub_date) с фильтром.
+        scenarios = (
+            ('cooking_time_max=15',
+             'recipe_cooking_time_idx|recipe_pub_date_idx'),
+            ('cooking_time_min=10&cooking_time_max=20'
+             '&ordering=-cooking_time', 'recipe_cooking_time_idx'),
+            ('pub_date_after=2020-01-01T00:00:00'
+             '&pub_date_before=2020-02-01T00:00:00', 'recipe_pub_date_idx'),
+            ('ordering=name', 'recipe_name_idx'),
+        )
+        for query, indexes in scenarios:
+            with self.subTest(query=query):
+                filterset = RecipeFilter(QueryDict(query), queryset=queryset)
+                self.assertTrue(filterset.is_valid())
+                plan = filterset.qs[:6].explain()
+                self.assertRegex(plan, indexes)
+                self.assertNotRegex(plan, FULL_SCAN)
+
+
+class ImportValidationTests(TestCase):
+    """Импорт отклоняет то, что не пропустил бы RecipeWriteSerializer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='cook@example.com', username='cook',
+            first_name='Повар', last_name='Поваров')
+        Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    def setUp(self):
+        self.image = default_storage.save(
+            'static/recipe/import.png', ContentFile(b'png'))
+        self.addCleanup(default_storage.delete, self.image)
+
+    def record(self, **changes):
+        return {
+            'type': 'recipe', 'id': 1, 'name': 'Суп', 'text': 'Текст',
+            'cooking_time': 10, 'image': self.image, 'tags': ['lunch'],
+            'ingredients': [
+                {'name': 'соль', 'measurement_unit': 'г', 'amount': 5}],
+            **changes}
+
+    def test_valid_recipe(self):
+        counts = import_lines(self.user, [json.dumps(self.record())])
+        self.assertEqual(counts['recipes'], 1)
+        self.assertEqual(Recipe.objects.get().image.name, self.image)
+
+    def test_invalid_recipes(self):
+        salt = {'measurement_unit': 'г', 'amount': 5}
+        cases = (
+            {'tags': []},
+            {'tags': [['lunch']]},
+            {'tags': [{'slug': 'lunch'}]},
+            {'ingredients': []},
+            {'ingredients': [{**salt, 'name': ['соль']}]},
+            {'ingredients': [{**salt, 'name': 'соль',
+                              'measurement_unit': {}}]},
+            {'ingredients': [{**salt, 'name': 'соль', 'amount': 0}]},
+            {'cooking_time': 0},
+            {'image': 'shopping_lists/1.pdf'},
+            {'image': 'static/recipe/../../private/1.pdf'},
+            {'image': 'static/recipe/missing.png'},
+            {'image': 42},
+            {'pub_date': 'вчера'},
+            {'pub_date': '2020-13-01T00:00:00+00:00'},
+            {'pub_date': '2999-01-01T00:00:00+00:00'},
+            {'pub_date': 1577836800},
+        )
+        for changes in cases:
+            with self.subTest(changes=changes):
+                with self.assertRaises(ValidationError):
+                    import_lines(
+                        self.user, [json.dumps(self.record(**changes))])
+        self.assertFalse(Recipe.objects.exists())
+
+
+class RestoreTests(TestCase):
+    """Экспорт и импорт обратно сохраняют даты публикации."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cook, cls.other, cls.reader = [
+            User.objects.create_user(
+                email=f'user{number}@example.com', username=f'user{number}',
+                first_name='Имя', last_name='Фамилия')
+            for number in range(3)]
+        Subscribe.objects.create(user=cls.reader, author=cls.cook)
+        Subscribe.objects.create(user=cls.reader, author=cls.other)
+        tag = Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        cls.old_date = datetime(2020, 1, 1, 12, tzinfo=timezone.utc)
+        for author, name in ((cls.cook, 'Суп'), (cls.other, 'Салат')):
+            recipe = Recipe.objects.create(
+                author=author, name=name, text='Текст', cooking_time=10)
+            recipe.tags.add(tag)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=salt, amount=5)
+        Recipe.objects.filter(author=cls.cook).update(pub_date=cls.old_date)
+
+    def timeline(self):
+        return list(TimelineEntry.objects.filter(
+            user=self.reader).values_list('recipe__name', 'pub_date'))
+
+    def test_roundtrip(self):
+        lines = [line.decode() for line in export_lines(self.cook)]
+        self.assertEqual(
+            json.loads(lines[0])['pub_date'], self.old_date.isoformat())
+        Recipe.objects.filter(author=self.cook).delete()
+        self.assertEqual(import_lines(self.cook, lines)['recipes'], 1)
+        self.assertEqual(
+            Recipe.objects.get(author=self.cook).pub_date, self.old_date)
+        # Восстановленный рецепт - под более новым, а не наверху ленты.
+        other_date = Recipe.objects.get(author=self.other).pub_date
+        self.assertEqual(
+            self.timeline(),
+            [('Салат', other_date), ('Суп', self.old_date)])
+
+    def test_without_pub_date(self):
+        record = json.loads(next(export_lines(self.cook)))
+        del record['pub_date']
+        Recipe.objects.filter(author=self.cook).delete()
+        import_lines(self.cook, [json.dumps(record)])
+        self.assertGreater(
+            Recipe.objects.get(author=self.cook).pub_date, self.old_date)
+
+
+class SmokeTests(TestCase):
+    """Основные сценарии API на профиле test_settings."""
+
+    RECIPES = 30
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='cook@example.com', username='cook',
+            first_name='Повар', last_name='Поваров', password='pass')
+        tag = Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        cls.recipes = Recipe.objects.bulk_create(
+            Recipe(author=cls.user, name=f'Рецепт {number}', text='Текст',
+                   cooking_time=10, image='recipe.png')
+            for number in range(cls.RECIPES))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag.id)
+            for recipe in cls.recipes)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=salt, amount=5)
+            for recipe in cls.recipes)
+
+    def setUp(self):
+        # Кэш ответов для анонимов общий для всех тестов процесса.
+        cache.clear()
+
+    def login(self):
+        response = self.client.post(
+            '/api/auth/token/login/',
+            {'email': 'cook@example.com', 'password': 'pass'},
+            HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 201)
+        return f'Token {response.json()["auth_token"]}'
+
+    def test_recipe_list(self):
+        response = self.client.get('/api/recipes/', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], self.RECIPES)
+
+    def test_shopping_cart_pdf(self):
+        token = self.login()
+        for recipe in self.recipes[:3]:
+            response = self.client.post(
+                f'/api/recipes/{recipe.id}/shopping_cart/',
+                HTTP_HOST='localhost', HTTP_AUTHORIZATION=token)
+            self.assertEqual(response.status_code, 201)
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/',
+            HTTP_HOST='localhost', HTTP_AUTHORIZATION=token)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response).startswith(b'%PDF'))
+
+    def test_export(self):
+        response = self.client.get(
+            '/api/users/me/export/',
+            HTTP_HOST='localhost', HTTP_AUTHORIZATION=self.login())
+        self.assertEqual(response.status_code, 200)
+        records = [
+            json.loads(line)
+            for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(
+            sum(record['type'] == 'recipe' for record in records),
+            self.RECIPES)
+
+
+class MetricsTests(TestCase):
+    """Формат Prometheus и сумма счетчиков нескольких воркеров."""
+
+    def registry(self):
+        registry = Registry()
+        registry.describe('foodgram_requests_total', 'counter', 'Запросы.')
+        registry.describe(
+            'foodgram_request_duration_seconds', 'histogram', 'Время.')
+        return registry
+
+    @override_settings(METRICS_DIR='')
+    def test_exposition(self):
+        registry = self.registry()
+        registry.inc('foodgram_requests_total', view='recipes', status=200)
+        registry.inc('foodgram_requests_total', view='recipes', status=200)
+        registry.observe(
+            'foodgram_request_duration_seconds', 0.02, view='recipes')
+        registry.observe(
+            'foodgram_request_duration_seconds', 3, view='recipes')
+        lines = registry.render().splitlines()
+        self.assertEqual(lines[:3], [
+            '# HELP foodgram_requests_total Запросы.',
+            '# TYPE foodgram_requests_total counter',
+            'foodgram_requests_total{status="200",view="recipes"} 2.0',
+        ])
+        self.assertEqual(lines[3:5], [
+            '# HELP foodgram_request_duration_seconds Время.',
+            '# TYPE foodgram_request_duration_seconds histogram',
+        ])
+        self.assertIn(
+            'foodgram_request_duration_seconds_bucket'
+            '{le="0.025",view="recipes"} 1', lines)
+        self.assertIn(
+            'foodgram_request_duration_seconds_bucket'
+            '{le="+Inf",view="recipes"} 2', lines)
+        self.assertEqual(lines[-2:], [
+            'foodgram_request_duration_seconds_sum{view="recipes"} 3.02',
+            'foodgram_request_duration_seconds_count{view="recipes"} 2',
+        ])
+
+    def test_workers_are_summed(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with override_settings(METRICS_DIR=directory.name):
+            other = self.registry()
+            other.inc('foodgram_requests_total', 3, view='tags')
+            other.observe(
+                'foodgram_request_duration_seconds', 0.5, view='tags')
+            other.flush()
+            # Файл другого (в том числе завершившегося) воркера.
+            os.replace(
+                os.path.join(directory.name, f'{os.getpid()}.json'),
+                os.path.join(directory.name, '1.json'))
+            registry = self.registry()
+            registry.inc('foodgram_requests_total', 2, view='tags')
+            registry.observe(
+                'foodgram_request_duration_seconds', 0.5, view='tags')
+            lines = registry.render().splitlines()
+        self.assertIn('foodgram_requests_total{view="tags"} 5.0', lines)
+        self.assertIn(
+            'foodgram_request_duration_seconds_count{view="tags"} 2', lines)
+
+    def test_endpoint(self):
+        admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin',
+            first_name='Админ', last_name='Админов', password='pass')
+        token = Token.objects.create(user=admin)
+        self.client.get('/api/tags/', HTTP_HOST='localhost')
+        response = self.client.get(
+            '/api/metrics/', HTTP_HOST='localhost',
+            HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(
+            '# TYPE foodgram_requests_total counter',
+            response.content.decode())
+
+
+class AsyncRecipeParityTests(TestCase):
+    """/api/async/recipes/ отдает то же, что /api/recipes/."""
+
+    QUERIES = (
+        '',
+        '?limit=2&page=2',
+        '?fields=name,tags,author&expand=tags',
+        '?fields=id,ingredients',
+        '?nutrition=1',
+        '?tags=lunch&is_favorited=1',
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Авторов')
+        cls.reader = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Читатель', last_name='Читателев')
+        cls.token = Token.objects.create(user=cls.reader)
+        cls.reader.follower.create(author=cls.author)
+        tag = Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=cls.author, name=f'Рецепт {number}', text='Текст',
+                   cooking_time=number + 1, image='recipe.png')
+            for number in range(5))
+        for recipe in recipes[::2]:
+            recipe.tags.add(tag)
+            cls.reader.favorite_recipe.recipe.add(recipe)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=salt, amount=5)
+            for recipe in recipes)
+        cls.recipe = recipes[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url, **headers):
+        response = self.client.get(url, HTTP_HOST='localhost', **headers)
+        return response.status_code, response.json()
+
+    def assertSame(self, path, query, **headers):
+        status, sync = self.get(f'/api/{path}{query}', **headers)
+        async_status, async_ = self.get(
+            f'/api/async/{path}{query}', **headers)
+        self.assertEqual(async_status, status)
+        if status == 200 and 'results' in sync:
+            for data in (sync, async_):
+                for name in ('next', 'previous'):
+                    if data[name]:
+                        data[name] = data[name].replace('/async/', '/')
+        self.assertEqual(async_, sync)
+
+    def test_list_and_detail(self):
+        auth = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        for headers in ({}, auth):
+            for query in self.QUERIES:
+                with self.subTest(query=query, auth=bool(headers)):
+                    self.assertSame('recipes/', query, **headers)
+                    self.assertSame(
+                        f'recipes/{self.recipe.id}/', query, **headers)
+
+    def test_errors(self):
+        for query in ('?fields=secret', '?cooking_time_max=x'):
+            with self.subTest(query=query):
+                self.assertSame('recipes/', query)
+                self.assertSame(f'recipes/{self.recipe.id}/', query)
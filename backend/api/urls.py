@@ -1,9 +1,11 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from api import async_views
 from api.views import (AddAndDeleteSubscribe, AddDeleteFavoriteRecipe,
                        AddDeleteShoppingCart, AuthToken, IngredientsViewSet,
-                       RecipesViewSet, TagsViewSet, UsersViewSet, set_password)
+                       JobDetail, JobDownload, RecipesViewSet, TagsViewSet,
+                       UsersViewSet, metrics, set_password)
 
 app_name = 'api'
 
@@ -23,6 +25,10 @@ urlpatterns = [
           'users/set_password/',
           set_password,
           name='set_password'),
+     path(
+          'metrics/',
+          metrics,
+          name='metrics'),
      path(
           'users/<int:user_id>/subscribe/',
           AddAndDeleteSubscribe.as_view(),
@@ -35,6 +41,30 @@ urlpatterns = [
           'recipes/<int:recipe_id>/shopping_cart/',
           AddDeleteShoppingCart.as_view(),
           name='shopping_cart'),
+     path(
+          'jobs/<int:pk>/',
+          JobDetail.as_view(),
+          name='job'),
+     path(
+          'jobs/<int:pk>/download/',
+          JobDownload.as_view(),
+          name='job_download'),
+     path(
+          'async/recipes/',
+          async_views.recipe_list,
+          name='async-recipe-list'),
+     path(
+          'async/recipes/<int:pk>/',
+          async_views.recipe_detail,
+          name='async-recipe-detail'),
+     path(
+          'async/tags/',
+          async_views.tag_list,
+          name='async-tag-list'),
+     path(
+          'async/ingredients/',
+          async_views.ingredient_list,
+          name='async-ingredient-list'),
      path('', include(router.urls)),
      path('', include('djoser.urls')),
      path('auth/', include('djoser.urls.authtoken')),
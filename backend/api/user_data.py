@@ -0,0 +1,333 @@
+import json
+import posixpath
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from api.response_cache import RECIPE_LISTS, purge
+from recipes.feed import deliver_recent, follower_ids, is_popular
+from recipes.models import (MAX_SERVINGS, FavoriteRecipe, Ingredient,
+                            Recipe, RecipeIngredient, ShoppingCartRecipe,
+                            Tag)
+from recipes.similar import mark_changed, user_recipe_ids
+
+CONTENT_TYPE = 'application/x-ndjson'
+FILENAME = 'foodgram.jsonl'
+EXPORT_CHUNK = 500
+IMPORT_BATCH = 500
+MAX_SMALL_INT = 32767
+IMAGE_DIR = Recipe._meta.get_field('image').upload_to
+
+
+def dump(record):
+    return json.dumps(record, ensure_ascii=False).encode() + b'\n'
+
+
+def export_lines(user):
+    """Данные пользователя строками JSONL: свои рецепты, избранное, корзина.
+
+    Рецепты идут первыми - при импорте на них ссылаются избранное
+    и корзина. Все читается через iterator, память не растет с объемом.
+    """
+
+    recipes = Recipe.objects.filter(
+        author=user).order_by('id').prefetch_related('tags', Prefetch(
+            'recipe',
+            queryset=RecipeIngredient.objects.select_related(
+                'ingredient').order_by('id')))
+    for recipe in recipes.iterator(chunk_size=EXPORT_CHUNK):
+        yield dump({
+            'type': 'recipe',
+            'id': recipe.id,
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'pub_date': recipe.pub_date.isoformat(),
+            'image': recipe.image.name or None,
+            'tags': sorted(tag.slug for tag in recipe.tags.all()),
+            'ingredients': [
+                {'name': item.ingredient.name,
+                 'measurement_unit': item.ingredient.measurement_unit,
+                 'amount': item.amount}
+                for item in recipe.recipe.all()],
+        })
+    favorites = FavoriteRecipe.recipe.through.objects.filter(
+        favoriterecipe__user=user).order_by('id').values_list(
+        'recipe_id', flat=True)
+    for recipe_id in favorites.iterator(chunk_size=EXPORT_CHUNK):
+        yield dump({'type': 'favorite', 'recipe': recipe_id})
+    cart = ShoppingCartRecipe.objects.filter(
+        shoppingcart__user=user).order_by('id').values_list(
+        'recipe_id', 'servings')
+    for recipe_id, servings in cart.iterator(chunk_size=EXPORT_CHUNK):
+        yield dump({'type': 'cart', 'recipe': recipe_id, 'servings': servings})
+
+
+def stream_export(user):
+    response = StreamingHttpResponse(
+        export_lines(user), content_type=CONTENT_TYPE)
+    response['Content-Disposition'] = f'attachment; filename="{FILENAME}"'
+    return response
+
+
+def positive(value, limit=MAX_SMALL_INT):
+    return type(value) is int and 1 <= value <= limit
+
+
+def non_empty_list(value):
+    return isinstance(value, list) and len(value) > 0
+
+
+def is_valid_ingredient(item):
+    return (
+        isinstance(item, dict)
+        and isinstance(item.get('name'), str)
+        and isinstance(item.get('measurement_unit'), str)
+        and positive(item.get('amount')))
+
+
+def parse_pub_date(value):
+    """Дата публикации из экспорта; None - нет даты или она неверная."""
+
+    if not isinstance(value, str):
+        return None
+    try:
+        date = parse_datetime(value)
+    except ValueError:
+        return None
+    if date is not None and timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+def is_valid_pub_date(value):
+    """В старых экспортах даты нет; если есть - не в будущем."""
+
+    if value is None:
+        return True
+    date = parse_pub_date(value)
+    return date is not None and date <= timezone.now()
+
+
+def is_valid_recipe(record):
+    """Те же минимумы, что у RecipeWriteSerializer: тэг и ингредиент."""
+
+    return (
+        isinstance(record.get('name'), str)
+        and 0 < len(record['name']) <= 255
+        and isinstance(record.get('text'), str)
+        and positive(record.get('cooking_time'))
+        and non_empty_list(record.get('tags'))
+        and all(isinstance(slug, str) for slug in record['tags'])
+        and non_empty_list(record.get('ingredients'))
+        and all(map(is_valid_ingredient, record['ingredients']))
+        and is_valid_pub_date(record.get('pub_date')))
+
+
+def is_valid_image(name):
+    """Только уже загруженная картинка рецепта, а не любой файл.
+
+    Пути вне static/recipe/ (например, чужой PDF) и с .. не принимаем.
+    """
+
+    return name is None or (
+        isinstance(name, str)
+        and name.startswith(IMAGE_DIR)
+        and posixpath.normpath(name) == name
+        and default_storage.exists(name))
+
+
+def restore_pub_dates(records, recipes):
+    """auto_now_add подменяет pub_date при вставке: возвращаем исходную."""
+
+    restored = []
+    for record, recipe in zip(records, recipes):
+        if record.get('pub_date') is not None:
+            recipe.pub_date = parse_pub_date(record['pub_date'])
+            restored.append(recipe)
+    Recipe.objects.bulk_update(restored, ['pub_date'])
+
+
+def check_references(number, record, ingredients, tags):
+    """Ингредиенты и тэги рецепта должны быть в справочниках."""
+
+    keys = [(item.get('name'), item.get('measurement_unit'))
+            for item in record['ingredients']]
+    unknown = [key[0] for key in keys if key not in ingredients]
+    unknown += [slug for slug in record['tags'] if slug not in tags]
+    if unknown:
+        raise ValidationError({'errors': (
+            f'Строка {number}: нет ингредиентов или тэгов '
+            f'{", ".join(map(str, unknown))}.')})
+    if len(set(keys)) != len(keys):
+        raise ValidationError(
+            {'errors': f'Строка {number}: ингредиенты повторяются.'})
+
+
+class Importer:
+    """Импорт JSONL пачками по IMPORT_BATCH записей.
+
+    Свои рецепты с тем же названием не дублируются: повторный импорт
+    того же файла ничего не меняет. В памяти держим только пачку
+    и соответствие id рецептов из файла новым id.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.recipe_ids = {}
+        self.batches = {'recipe': [], 'favorite': [], 'cart': []}
+        self.counts = {
+            'recipes': 0, 'favorites': 0, 'shopping_cart': 0, 'skipped': 0}
+
+    def feed(self, lines):
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                batch = self.batches[record['type']]
+            except (ValueError, TypeError, KeyError):
+                raise ValidationError(
+                    {'errors': f'Строка {number}: неверная запись.'})
+            batch.append((number, record))
+            if len(batch) >= IMPORT_BATCH:
+                self.flush()
+        self.flush()
+        if self.counts['recipes']:
+            purge(RECIPE_LISTS)
+            # Ленты пополняем по исходным датам: восстановленные рецепты
+            # встают на свое место, а не наверх ленты подписчиков.
+            if not is_popular(self.user.id):
+                deliver_recent(follower_ids(self.user.id), self.user.id)
+        if self.counts['favorites'] or self.counts['shopping_cart']:
+            # bulk_create не шлет m2m_changed: соседей отмечаем сами.
+            mark_changed(
+                user_recipe_ids([self.user.id]), [self.user.id])
+        return self.counts
+
+    def flush(self):
+        # Рецепты раньше ссылок на них, даже если в пачке все вперемешку.
+        self.import_recipes(self.batches['recipe'])
+        self.import_favorites(self.batches['favorite'])
+        self.import_cart(self.batches['cart'])
+        for batch in self.batches.values():
+            batch.clear()
+
+    def import_recipes(self, batch):
+        if not batch:
+            return
+        for number, record in batch:
+            if not is_valid_recipe(record):
+                raise ValidationError(
+                    {'errors': f'Строка {number}: неверный рецепт.'})
+            if not is_valid_image(record.get('image')):
+                raise ValidationError(
+                    {'errors': f'Строка {number}: нет такой картинки.'})
+        existing = dict(Recipe.objects.filter(
+            author=self.user,
+            name__in=[record['name'] for _, record in batch],
+        ).values_list('name', 'id'))
+        tags = dict(Tag.objects.filter(slug__in={
+            slug for _, record in batch for slug in record['tags']
+        }).values_list('slug', 'id'))
+        ingredients = {
+            (name, unit): pk
+            for pk, name, unit in Ingredient.objects.filter(name__in={
+                item.get('name')
+                for _, record in batch for item in record['ingredients']
+            }).values_list('id', 'name', 'measurement_unit')}
+        new, skipped = [], []
+        for number, record in batch:
+            if record['name'] in existing:
+                skipped.append(record)
+                continue
+            check_references(number, record, ingredients, tags)
+            # Повтор названия ниже в пачке сошлется на этот рецепт.
+            existing[record['name']] = None
+            new.append((record, Recipe(
+                author=self.user,
+                name=record['name'],
+                text=record['text'],
+                cooking_time=record['cooking_time'],
+                image=record.get('image') or None)))
+        created = Recipe.objects.bulk_create(recipe for _, recipe in new)
+        restore_pub_dates([record for record, _ in new], created)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredients[
+                    item['name'], item['measurement_unit']],
+                amount=item['amount'])
+            for (record, _), recipe in zip(new, created)
+            for item in record['ingredients'])
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tags[slug])
+            for (record, _), recipe in zip(new, created)
+            for slug in set(record['tags']))
+        for (record, _), recipe in zip(new, created):
+            existing[recipe.name] = self.recipe_ids[record.get('id')] = (
+                recipe.id)
+        for record in skipped:
+            self.recipe_ids[record.get('id')] = existing[record['name']]
+        self.counts['recipes'] += len(created)
+        self.counts['skipped'] += len(skipped)
+
+    def resolve(self, batch):
+        """id рецептов ссылок: свои - через recipe_ids, чужие - как есть."""
+
+        ids = {}
+        for number, record in batch:
+            if type(record.get('recipe')) is not int:
+                raise ValidationError(
+                    {'errors': f'Строка {number}: нет id рецепта.'})
+            ids[number] = self.recipe_ids.get(
+                record['recipe'], record['recipe'])
+        known = set(Recipe.objects.filter(
+            id__in=set(ids.values())).values_list('id', flat=True))
+        self.counts['skipped'] += sum(
+            recipe_id not in known for recipe_id in ids.values())
+        return [(record, ids[number]) for number, record in batch
+                if ids[number] in known]
+
+    def import_favorites(self, batch):
+        if not batch:
+            return
+        rows = self.resolve(batch)
+        FavoriteRecipe.recipe.through.objects.bulk_create(
+            (FavoriteRecipe.recipe.through(
+                favoriterecipe_id=self.user.favorite_recipe.id,
+                recipe_id=recipe_id)
+             for _, recipe_id in rows),
+            ignore_conflicts=True)
+        self.counts['favorites'] += len(rows)
+
+    def import_cart(self, batch):
+        if not batch:
+            return
+        rows = self.resolve(batch)
+        for number, record in batch:
+            if not positive(record.get('servings', 1), MAX_SERVINGS):
+                raise ValidationError({'errors': (
+                    f'Строка {number}: порций от 1 до {MAX_SERVINGS}.')})
+        ShoppingCartRecipe.objects.bulk_create(
+            (ShoppingCartRecipe(
+                shoppingcart_id=self.user.shopping_cart.id,
+                recipe_id=recipe_id,
+                servings=record.get('servings', 1))
+             for record, recipe_id in rows),
+            update_conflicts=True,
+            unique_fields=('shoppingcart', 'recipe'),
+            update_fields=('servings',))
+        self.counts['shopping_cart'] += len(rows)
+
+
+@transaction.atomic
+def import_lines(user, lines):
+    """Импорт целиком или ничего: ошибка в строке откатывает все."""
+
+    return Importer(user).feed(lines)
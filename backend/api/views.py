@@ -1,36 +1,69 @@
 import io
+import os
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
-from django.db.models.aggregates import Count, Sum
+from django.core.files.storage import storages
+from django.db.models import Prefetch
+from django.db.models.aggregates import Count
 from django.db.models.expressions import Exists, OuterRef, Value
-from django.http import FileResponse
+from django.http import FileResponse, HttpResponse
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
 from rest_framework import generics, status, viewsets
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
-from rest_framework.decorators import action, api_view
+from rest_framework.decorators import (action, api_view,
+                                       permission_classes)
 from rest_framework.permissions import (SAFE_METHODS, AllowAny,
-                                        IsAuthenticated,
+                                        IsAdminUser, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
+from api.compression import PrecompressedListMixin
 from api.filters import IngredientFilter, RecipeFilter
+from api.pagination import (BATCH_MAX_IDS, FEED_MAX_LIMIT,
+                            LimitPageNumberPagination, decode_cursor,
+                            encode_cursor)
+from api.metrics import registry
 from api.permissions import IsAdminOrReadOnly
-from recipes.models import (FavoriteRecipe, Ingredient, Recipe, ShoppingCart,
-                            Subscribe, Tag)
-from .serializers import (IngredientSerializer, RecipeReadSerializer,
+from api.response_cache import AnonymousCacheMixin
+from api.shopping_list import (FILENAME, cached_pdf, render_pdf,
+                               shopping_list, shopping_list_totals)
+from api.user_data import import_lines, stream_export
+from jobs.models import Job
+from jobs.queue import enqueue
+from recipes.feed import feed_page
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart,
+                            ShoppingCartRecipe, Subscribe, Tag)
+from .serializers import (CartServingsSerializer, IngredientSerializer,
+                          JobSerializer,
+                          RecipeReadSerializer,
                           RecipeWriteSerializer, SubscribeRecipeSerializer,
                           SubscribeSerializer, TagSerializer, TokenSerializer,
                           UserCreateSerializer, UserListSerializer,
-                          UserPasswordSerializer)
+                          UserPasswordSerializer, recipe_fieldset,
+                          wants_nutrition)
 
 User = get_user_model()
-FILENAME = 'shoppingcart.pdf'
+# Колонки Recipe, которые можно исключить через ?fields=.
+RECIPE_COLUMNS = (
+    'author', 'name', 'image', 'text', 'cooking_time', 'pub_date')
+USER_LIST_FIELDS = [
+    name for name in UserListSerializer.Meta.fields
+    if name != 'is_subscribed']
+
+
+def accel_redirect(url):
+    """PDF отдает nginx: backend только указывает файл."""
+
+    response = HttpResponse(content_type='application/pdf')
+    response['X-Accel-Redirect'] = url
+    response['Content-Disposition'] = f'attachment; filename="{FILENAME}"'
+    return response
 
 
 class GetObjectMixin:
@@ -116,10 +149,19 @@ class AddDeleteShoppingCart(
     """Добавление и удаление рецепта в/из корзины."""
 
     def create(self, request, *args, **kwargs):
+        """Повторный запрос меняет множитель порций рецепта."""
+
         instance = self.get_object()
-        request.user.shopping_cart.recipe.add(instance)
+        servings = CartServingsSerializer(data=request.data)
+        servings.is_valid(raise_exception=True)
+        ShoppingCartRecipe.objects.update_or_create(
+            shoppingcart=request.user.shopping_cart,
+            recipe=instance,
+            defaults=servings.validated_data)
         serializer = self.get_serializer(instance)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(
+            {**serializer.data, **servings.validated_data},
+            status=status.HTTP_201_CREATED)
 
     def perform_destroy(self, instance):
         self.request.user.shopping_cart.recipe.remove(instance)
@@ -148,14 +190,18 @@ class UsersViewSet(UserViewSet):
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
-        return User.objects.annotate(
-            is_subscribed=Exists(
-                self.request.user.follower.filter(
-                    author=OuterRef('id'))
-            )).prefetch_related(
-                'follower', 'following'
-        ) if self.request.user.is_authenticated else User.objects.annotate(
-            is_subscribed=Value(False))
+        """Только сериализуемые колонки, подписка - одним EXISTS."""
+
+        queryset = User.objects.only(*USER_LIST_FIELDS)
+        if not self.request.user.is_authenticated:
+            return queryset.annotate(is_subscribed=Value(False))
+        return queryset.annotate(is_subscribed=Exists(
+            Subscribe.objects.filter(
+                user=self.request.user, author=OuterRef('id'))))
+
+    def get_instance(self):
+        # /me/ тоже через get_queryset, чтобы в ответе был is_subscribed.
+        return self.get_queryset().get(pk=self.request.user.pk)
 
     def get_serializer_class(self):
         if self.request.method.lower() == 'post':
@@ -166,6 +212,30 @@ class UsersViewSet(UserViewSet):
         password = make_password(self.request.data['password'])
         serializer.save(password=password)
 
+    @action(
+        detail=False,
+        url_path='me/export',
+        permission_classes=(IsAuthenticated,))
+    def export_data(self, request):
+        """Свои рецепты, избранное и корзина потоком JSONL."""
+
+        return stream_export(request.user)
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='me/import',
+        permission_classes=(IsAuthenticated,))
+    def import_data(self, request):
+        """Восстановление из выгрузки.
+
+        Тело запроса - JSONL, читается по строке, а не целиком.
+        """
+
+        return Response(
+            import_lines(request.user, request._request),
+            status=status.HTTP_201_CREATED)
+
     @action(
         detail=False,
         permission_classes=(IsAuthenticated,))
@@ -181,7 +251,47 @@ class UsersViewSet(UserViewSet):
         return self.get_paginated_response(serializer.data)
 
 
-class RecipesViewSet(viewsets.ModelViewSet):
+def recipe_queryset(request, fieldset):
+    """Колонки, аннотации и prefetch - только для запрошенных полей.
+
+    Общий для RecipesViewSet и асинхронного чтения (api.async_views).
+    """
+
+    user = request.user
+    queryset = Recipe.objects.all()
+    if fieldset.sparse:
+        columns = ['id', *(
+            name for name in RECIPE_COLUMNS if fieldset.includes(name))]
+        if fieldset.expands('author'):
+            columns += [f'author__{name}' for name in USER_LIST_FIELDS]
+        queryset = queryset.only(*columns)
+    flags = {
+        'is_favorited': FavoriteRecipe,
+        'is_in_shopping_cart': ShoppingCart,
+    }
+    for name, model in flags.items():
+        # Аннотация нужна и для фильтра по этому полю.
+        if not (fieldset.includes(name) or name in request.GET):
+            continue
+        queryset = queryset.annotate(**{name: Exists(
+            model.objects.filter(user=user, recipe=OuterRef('id'))
+        ) if user.is_authenticated else Value(False)})
+    if fieldset.expands('author'):
+        queryset = queryset.select_related('author')
+    if fieldset.includes('tags'):
+        queryset = queryset.prefetch_related(
+            'tags' if fieldset.expands('tags') else Prefetch(
+                'tags', queryset=Tag.objects.only('id')))
+    if fieldset.includes('ingredients') or wants_nutrition(request):
+        ingredients = RecipeIngredient.objects.all()
+        if fieldset.expands('ingredients'):
+            ingredients = ingredients.select_related('ingredient')
+        queryset = queryset.prefetch_related(
+            Prefetch('recipe', queryset=ingredients))
+    return queryset
+
+
+class RecipesViewSet(AnonymousCacheMixin, viewsets.ModelViewSet):
     """Рецепты."""
 
     queryset = Recipe.objects.all()
@@ -194,91 +304,179 @@ class RecipesViewSet(viewsets.ModelViewSet):
         return RecipeWriteSerializer
 
     def get_queryset(self):
-        return Recipe.objects.annotate(
-            is_favorited=Exists(
-                FavoriteRecipe.objects.filter(
-                    user=self.request.user, recipe=OuterRef('id'))),
-            is_in_shopping_cart=Exists(
-                ShoppingCart.objects.filter(
-                    user=self.request.user,
-                    recipe=OuterRef('id')))
-        ).select_related('author').prefetch_related(
-            'tags', 'ingredients', 'recipe',
-            'shopping_cart', 'favorite_recipe'
-        ) if self.request.user.is_authenticated else Recipe.objects.annotate(
-            is_in_shopping_cart=Value(False),
-            is_favorited=Value(False),
-        ).select_related('author').prefetch_related(
-            'tags', 'ingredients', 'recipe',
-            'shopping_cart', 'favorite_recipe')
+        return recipe_queryset(self.request, recipe_fieldset(
+            self.request if self.request.method in SAFE_METHODS else None))
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @action(
+        detail=False,
+        methods=['get'])
+    def batch(self, request):
+        """Несколько рецептов одним запросом: ?ids=3,1,2, порядок как в ids."""
+
+        try:
+            ids = list(dict.fromkeys(
+                int(value)
+                for value in request.query_params.get('ids', '').split(',')
+                if value.strip()))
+        except ValueError:
+            return Response(
+                {'errors': 'ids - это id рецептов через запятую!'},
+                status=status.HTTP_400_BAD_REQUEST)
+        if not ids or len(ids) > BATCH_MAX_IDS:
+            return Response(
+                {'errors': f'Нужно от 1 до {BATCH_MAX_IDS} id рецептов!'},
+                status=status.HTTP_400_BAD_REQUEST)
+        recipes = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id in ids
+             if recipe_id in recipes],
+            many=True)
+        return Response(serializer.data)
+
+    @action(
+        detail=True,
+        methods=['get'])
+    def similar(self, request, pk=None):
+        """Рецепты, которые чаще всего добавляют вместе с этим.
+
+        Соседи посчитаны заранее (refresh_similar_recipes), ?limit= не
+        больше SIMILAR_RECIPES_TOP_K.
+        """
+
+        try:
+            limit = min(
+                int(request.query_params.get(
+                    'limit', settings.SIMILAR_RECIPES_TOP_K)),
+                settings.SIMILAR_RECIPES_TOP_K)
+        except ValueError:
+            return Response(
+                {'errors': 'limit - это число!'},
+                status=status.HTTP_400_BAD_REQUEST)
+        recipe = generics.get_object_or_404(Recipe.objects.only('id'), pk=pk)
+        ids = list(recipe.similar.values_list(
+            'similar_id', flat=True)[:max(limit, 0)])
+        recipes = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id in ids
+             if recipe_id in recipes],
+            many=True)
+        return Response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        """Рецепты авторов из подписок, постранично по курсору."""
+
+        try:
+            before = decode_cursor(request.query_params.get('cursor'))
+            limit = min(
+                int(request.query_params.get(
+                    'limit', LimitPageNumberPagination.page_size)),
+                FEED_MAX_LIMIT)
+        except ValueError:
+            return Response(
+                {'errors': 'Неверный курсор или limit!'},
+                status=status.HTTP_400_BAD_REQUEST)
+        keys, has_more = feed_page(request.user, max(limit, 1), before)
+        recipes = self.get_queryset().in_bulk([key[1] for key in keys])
+        serializer = RecipeReadSerializer(
+            [recipes[key[1]] for key in keys if key[1] in recipes],
+            many=True,
+            context={'request': request})
+        return Response({
+            'next': replace_query_param(
+                request.build_absolute_uri(), 'cursor',
+                encode_cursor(keys[-1])) if has_more else None,
+            'results': serializer.data,
+        })
+
     @action(
         detail=False,
         methods=['get'],
         permission_classes=(IsAuthenticated,))
     def download_shopping_cart(self, request):
-        """Качаем список с ингредиентами."""
-
-        buffer = io.BytesIO()
-        page = canvas.Canvas(buffer)
-        pdfmetrics.registerFont(TTFont('Vera', 'Vera.ttf'))
-        x_position, y_position = 50, 800
-        shopping_cart = (
-            request.user.shopping_cart.recipe.
-            values(
-                'ingredients__name',
-                'ingredients__measurement_unit'
-            ).annotate(amount=Sum('recipe__amount')).order_by())
-        page.setFont('Vera', 14)
-        if shopping_cart:
-            indent = 20
-            page.drawString(x_position, y_position, 'Cписок покупок:')
-            for index, recipe in enumerate(shopping_cart, start=1):
-                page.drawString(
-                    x_position, y_position - indent,
-                    f'{index}. {recipe["ingredients__name"]} - '
-                    f'{recipe["amount"]} '
-                    f'{recipe["ingredients__measurement_unit"]}.')
-                y_position -= 15
-                if y_position <= 50:
-                    page.showPage()
-                    y_position = 800
-            page.save()
-            buffer.seek(0)
-            return FileResponse(
-                buffer, as_attachment=True, filename=FILENAME)
-        page.setFont('Vera', 24)
-        page.drawString(
-            x_position,
-            y_position,
-            'Cписок покупок пуст!')
-        page.save()
-        buffer.seek(0)
-        return FileResponse(buffer, as_attachment=True, filename=FILENAME)
+        """Качаем список с ингредиентами.
+
+        С ?mode=async PDF готовит фоновый воркер, в ответе id задачи.
+        """
+
+        if request.query_params.get('mode') == 'async':
+            job = enqueue(
+                'shopping_cart_pdf', user=request.user, priority=1)
+            return Response(
+                JobSerializer(job, context={'request': request}).data,
+                status=status.HTTP_202_ACCEPTED)
+        shopping_cart = list(shopping_list(request.user))
+        totals = shopping_list_totals(request.user)
+        name = cached_pdf(shopping_cart, totals)
+        if settings.SHOPPING_LIST_X_ACCEL:
+            return accel_redirect(settings.PRIVATE_MEDIA_URL + name)
+        try:
+            file = open(os.path.join(settings.PRIVATE_MEDIA_ROOT, name), 'rb')
+        except FileNotFoundError:
+            file = io.BytesIO(render_pdf(shopping_cart, totals))
+        return FileResponse(file, as_attachment=True, filename=FILENAME)
 
 
 class TagsViewSet(
+        PrecompressedListMixin,
         PermissionAndPaginationMixin,
         viewsets.ModelViewSet):
     """Список тэгов."""
 
+    reference_name = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
 class IngredientsViewSet(
+        PrecompressedListMixin,
         PermissionAndPaginationMixin,
         viewsets.ModelViewSet):
     """Список ингредиентов."""
 
+    reference_name = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filterset_class = IngredientFilter
 
 
+class JobDetail(generics.RetrieveAPIView):
+    """Статус фоновой задачи пользователя."""
+
+    serializer_class = JobSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user)
+
+
+class JobDownload(JobDetail):
+    """Результат готовой задачи - файл из закрытого хранилища."""
+
+    def retrieve(self, request, *args, **kwargs):
+        job = self.get_object()
+        if job.status != Job.DONE:
+            return Response(
+                {'errors': 'Файл еще не готов!'},
+                status=status.HTTP_409_CONFLICT)
+        storage = storages['private']
+        if settings.SHOPPING_LIST_X_ACCEL:
+            return accel_redirect(storage.url(job.result['file']))
+        try:
+            file = storage.open(job.result['file'])
+        except FileNotFoundError:
+            return Response(
+                {'errors': 'Файл удален, запросите список заново.'},
+                status=status.HTTP_410_GONE)
+        return FileResponse(file, as_attachment=True, filename=FILENAME)
+
+
 @api_view(['post'])
 def set_password(request):
     """Изменить пароль."""
@@ -294,3 +492,13 @@ def set_password(request):
     return Response(
         {'error': 'Введите верные данные!'},
         status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['get'])
+@permission_classes((IsAdminUser,))
+def metrics(request):
+    """Метрики процесса в текстовом формате Prometheus."""
+
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,32 @@
+import gc
+import logging
+
+from django.db import DatabaseError, connections
+
+from api.filter_cache import tag_ids_by_slug
+from api.shopping_list import pdf_canvas
+from recipes.nutrition import get_table
+
+logger = logging.getLogger('foodgram.performance')
+
+
+def warm_up():
+    """Общее для воркеров gunicorn строим один раз в мастере.
+
+    С preload_app воркеры получают это после fork и делят страницы
+    памяти copy-on-write: шрифт и модули PDF, таблицу КБЖУ и тэги
+    фильтра (в locmem-кэше) не строит каждый воркер заново.
+    """
+
+    pdf_canvas()
+    try:
+        get_table()
+        tag_ids_by_slug()
+    except DatabaseError as error:
+        # БД может быть еще не готова: воркеры построят все сами.
+        logger.warning('Прогрев без БД: %s', error)
+    # Сокеты соединений мастера не должны достаться воркерам.
+    connections.close_all()
+    # Объекты мастера не трогает сборщик мусора воркеров, иначе
+    # подсчет ссылок и обход поколений копируют общие страницы.
+    gc.freeze()
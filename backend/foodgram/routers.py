@@ -0,0 +1,29 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+use_replica = ContextVar('use_replica', default=False)
+
+# Токены читаем только с primary: сразу после логина реплика может отставать.
+PRIMARY_ONLY = {'authtoken.token'}
+
+
+class ReadReplicaRouter:
+    """Чтение безопасных запросов API с реплик, запись - в default."""
+
+    def db_for_read(self, model, **hints):
+        if (not settings.DATABASE_REPLICAS
+                or not use_replica.get()
+                or model._meta.label_lower in PRIMARY_ONLY):
+            return None
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
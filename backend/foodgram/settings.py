@@ -27,6 +27,7 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'recipes.apps.RecipesConfig',
     'api.apps.ApiConfig',
+    'jobs.apps.JobsConfig',
     'djoser',
     'rest_framework',
     'rest_framework.authtoken',
@@ -34,6 +35,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.CompressionMiddleware',
+    'api.middleware.PerformanceMiddleware',
+    'api.middleware.ProfilingMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,8 +87,68 @@ DATABASES = {
         'PORT': os.getenv(
             'DB_PORT',
             default='5432'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
+        'CONN_HEALTH_CHECKS': True,
     }}
 
+# Через запятую: хосты реплик PostgreSQL или файлы для SQLite.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(
+        filter(None, os.getenv('DB_REPLICAS', default='').split(','))):
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        ('NAME' if 'sqlite' in DATABASES['default']['ENGINE']
+         else 'HOST'): replica.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['foodgram.routers.ReadReplicaRouter']
+
+REPLICA_VIEWS = [
+    'api:recipe-list', 'api:recipe-detail',
+    'api:tag-list', 'api:tag-detail',
+    'api:ingredient-list', 'api:ingredient-detail',
+    'api:user-subscriptions',
+    'api:async-recipe-list', 'api:async-recipe-detail',
+    'api:async-tag-list', 'api:async-ingredient-list',
+]
+REPLICA_STICKY_SECONDS = int(
+    os.getenv('REPLICA_STICKY_SECONDS', default=10))
+
+# Общий для воркеров кэш (например, Redis) нужен, чтобы сброс по
+# сигналам был виден всем процессам.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+# Ключи версий (таблица питательности, сжатые справочники). В общем кэше
+# живут бессрочно (0); в LocMemCache у каждого процесса свой ключ, и
+# смену версии в другом процессе этот заметит только по истечении TTL.
+CACHE_VERSION_TIMEOUT = int(os.getenv(
+    'CACHE_VERSION_TIMEOUT',
+    default=60 if 'locmem' in CACHES['default']['BACKEND'] else 0)) or None
+
+FILTER_CACHE_TIMEOUT = int(os.getenv('FILTER_CACHE_TIMEOUT', default=300))
+# Ответы /api/recipes/ для анонимов: сколько хранить в кэше приложения
+# и сколько разрешать кэшировать nginx и браузерам (Cache-Control max-age).
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', default=600))
+RECIPE_CACHE_MAX_AGE = int(os.getenv('RECIPE_CACHE_MAX_AGE', default=30))
+# Полные списки тэгов и ингредиентов, сжатые заранее; сбрасываются сигналами.
+REFERENCE_CACHE_TIMEOUT = int(
+    os.getenv('REFERENCE_CACHE_TIMEOUT', default=24 * 60 * 60))
+
+# Сжатие ответов API: тела меньше порога не сжимаем.
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', default=512))
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', default=6))
+COMPRESSION_BROTLI_QUALITY = int(
+    os.getenv('COMPRESSION_BROTLI_QUALITY', default=5))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -115,6 +180,37 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Файлы пользователей не для всех (PDF списков покупок): nginx раздает
+# их только по X-Accel-Redirect, location /private/ помечен internal.
+PRIVATE_MEDIA_URL = '/private/'
+PRIVATE_MEDIA_ROOT = os.getenv(
+    'PRIVATE_MEDIA_ROOT', default=os.path.join(BASE_DIR, 'private'))
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    'private': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {
+            'location': PRIVATE_MEDIA_ROOT,
+            'base_url': PRIVATE_MEDIA_URL,
+        },
+    },
+}
+
+# Сколько секунд хранить завершенные фоновые задачи и их файлы.
+JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', default=24 * 60 * 60))
+
+SHOPPING_LIST_CACHE_MAX_BYTES = int(
+    os.getenv('SHOPPING_LIST_CACHE_MAX_BYTES', default=100 * 1024 * 1024))
+# Отдавать PDF через nginx (X-Accel-Redirect на location /private/).
+SHOPPING_LIST_X_ACCEL = (
+    os.getenv('SHOPPING_LIST_X_ACCEL', default='False') == 'True')
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
@@ -131,3 +227,37 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.LimitPageNumberPagination',
     'PAGE_SIZE': 6,
 }
+
+PERF_SLOW_REQUEST_MS = int(os.getenv('PERF_SLOW_REQUEST_MS', default=500))
+PERF_SLOW_QUERIES_LOGGED = int(
+    os.getenv('PERF_SLOW_QUERIES_LOGGED', default=5))
+# Метрики нескольких воркеров gunicorn: каждый процесс сбрасывает свои
+# счетчики в файл каталога, /api/metrics/ их суммирует. Пусто - только
+# счетчики процесса (runserver, тесты).
+METRICS_DIR = os.getenv('METRICS_DIR', default='')
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', default=1))
+
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', default=0))
+PROFILING_VIEWS = [
+    view for view in os.getenv('PROFILING_VIEWS', default='').split(',')
+    if view]
+PROFILING_HEADER = 'X-Profile'
+PROFILING_DIR = os.getenv(
+    'PROFILING_DIR', default=os.path.join(BASE_DIR, 'profiles'))
+PROFILING_MAX_FILES = int(os.getenv('PROFILING_MAX_FILES', default=200))
+
+# Лента подписок: у авторов с большим числом подписчиков рецепты
+# не раскладываются по лентам, а добавляются при чтении.
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', default=1000))
+FEED_POPULAR_TTL = 300
+FEED_BACKFILL = 100
+FEED_MAX_ENTRIES = 1000
+
+# Похожие рецепты: сколько соседей хранить, минимум общих пользователей
+# и сколько пар (рецепт, рецепт пользователя) разворачивать за один блок -
+# это ограничивает память расчета.
+SIMILAR_RECIPES_TOP_K = int(os.getenv('SIMILAR_RECIPES_TOP_K', default=20))
+SIMILAR_RECIPES_MIN_COMMON = int(
+    os.getenv('SIMILAR_RECIPES_MIN_COMMON', default=2))
+SIMILAR_RECIPES_CHUNK_PAIRS = int(
+    os.getenv('SIMILAR_RECIPES_CHUNK_PAIRS', default=1000000))
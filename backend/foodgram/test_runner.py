@@ -0,0 +1,13 @@
+from django.test.runner import DiscoverRunner, get_max_test_processes
+
+
+class FastTestRunner(DiscoverRunner):
+    """Без --parallel тесты идут параллельно по числу ядер.
+
+    --parallel 1 возвращает последовательный запуск, число процессов
+    можно задать и через DJANGO_TEST_PROCESSES.
+    """
+
+    def __init__(self, parallel=0, **kwargs):
+        super().__init__(
+            parallel=parallel or get_max_test_processes(), **kwargs)
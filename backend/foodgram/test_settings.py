@@ -0,0 +1,53 @@
+import os
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+
+# Профиль для тестов без docker-compose:
+#   python manage.py test --settings=foodgram.test_settings
+# SQLite в памяти, схема из моделей без миграций (кроме recipes),
+# быстрые хэши паролей, тесты параллельно по числу ядер.
+
+DEBUG = False
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }}
+DATABASE_REPLICAS = []
+
+
+class DisableMigrations:
+    """Схему тестовой БД строим сразу из моделей.
+
+    У recipes миграции остаются: в них справочные данные (UnitConversion),
+    без которых список покупок не сводит единицы.
+    """
+
+    def __contains__(self, app_label):
+        return app_label != 'recipes'
+
+    def __getitem__(self, app_label):
+        return None
+
+
+MIGRATION_MODULES = DisableMigrations()
+
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }}
+
+MEDIA_ROOT = os.path.join(tempfile.gettempdir(), 'foodgram-test-media')
+PRIVATE_MEDIA_ROOT = os.path.join(
+    tempfile.gettempdir(), 'foodgram-test-private')
+STORAGES['private']['OPTIONS']['location'] = PRIVATE_MEDIA_ROOT  # noqa: F405
+PROFILING_SAMPLE_RATE = 0
+PROFILING_VIEWS = []
+
+TEST_RUNNER = 'foodgram.test_runner.FastTestRunner'
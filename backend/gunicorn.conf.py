@@ -0,0 +1,44 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from dotenv import load_dotenv
+
+# Те же переменные, что увидит settings.py.
+load_dotenv()
+
+bind = os.getenv('GUNICORN_BIND', default='0.0.0.0:8000')
+# LocMemCache у каждого воркера свой: липкая запись для реплик, сброс
+# кэша ответов и ключи версий не видны соседям. Несколько воркеров -
+# только с общим кэшем (CACHE_BACKEND, например Redis).
+shared_cache = 'locmem' not in os.getenv(
+    'CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+workers = int(os.getenv(
+    'GUNICORN_WORKERS',
+    default=multiprocessing.cpu_count() * 2 + 1 if shared_cache else 1))
+# Django грузится в мастере до fork: воркеры стартуют без импорта
+# приложения и делят его память copy-on-write.
+preload_app = os.getenv('GUNICORN_PRELOAD', default='True') == 'True'
+# Каталог, через который /api/metrics/ суммирует счетчики всех воркеров.
+metrics_dir = os.environ.setdefault(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'foodgram-metrics'))
+
+
+def on_starting(server):
+    # Файлы воркеров прошлого запуска: для Prometheus это сброс счетчиков.
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def when_ready(server):
+    # Мастер после загрузки приложения, до запуска воркеров.
+    if preload_app:
+        from api.warmup import warm_up
+        warm_up()
+
+
+def worker_exit(server, worker):
+    # Последние значения воркера, еще не сброшенные в файл.
+    from api.metrics import registry
+    registry.flush()
@@ -0,0 +1,14 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'name', 'user', 'status', 'priority',
+        'attempts', 'run_after', 'created',)
+    list_filter = ('status', 'name',)
+    list_select_related = ('user',)
+    search_fields = ('name', 'user__email',)
+    empty_value_display = '-пусто-'
@@ -0,0 +1,112 @@
+import os
+import time
+from concurrent.futures import (ALL_COMPLETED, FIRST_COMPLETED,
+                                ProcessPoolExecutor, wait)
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import connections
+
+from jobs.queue import (claim, delete_expired, execute, finish, release,
+                        requeue_stale)
+from jobs.worker import init_process
+
+# Как часто удалять устаревшие задачи, с.
+EXPIRE_EVERY = 60
+
+
+class Command(BaseCommand):
+    help = 'Воркер фоновых задач с пулом процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count() or 1)
+        parser.add_argument(
+            '--poll', type=float, default=1.0,
+            help='Пауза между опросами пустой очереди, c.')
+        parser.add_argument(
+            '--stale-after', type=int, default=600,
+            help='Через сколько секунд вернуть зависшую задачу в очередь.')
+        parser.add_argument(
+            '--keep-results', type=int, default=settings.JOB_RESULT_TTL,
+            help='Сколько секунд хранить завершенные задачи и их файлы.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить накопившиеся задачи и выйти.')
+
+    def handle(self, *args, **options):
+        self.expired_at = 0
+        self.stdout.write(
+            f'Воркер запущен, процессов: {options["processes"]}.')
+        while self.serve(options):
+            self.stderr.write('Процесс пула упал, пересоздаем пул.')
+
+    def serve(self, options):
+        """Цикл на одном пуле; True - пул сломан, нужен новый."""
+
+        processes = options['processes']
+        running = {}
+        # spawn: дочерние процессы не наследуют соединения с БД.
+        with ProcessPoolExecutor(
+                processes,
+                mp_context=get_context('spawn'),
+                initializer=init_process,
+                initargs=(os.environ['DJANGO_SETTINGS_MODULE'],)) as pool:
+            while True:
+                self.housekeeping(options)
+                broken = not self.submit(
+                    pool, claim(processes - len(running)), running)
+                if not running:
+                    if options['once']:
+                        return False
+                    connections.close_all()
+                    time.sleep(options['poll'])
+                    continue
+                broken = self.collect(
+                    running, options['poll'], FIRST_COMPLETED) or broken
+                if broken:
+                    # Остальные задачи пула тоже упали: дожидаемся их.
+                    self.collect(running, None, ALL_COMPLETED)
+                    return True
+
+    def housekeeping(self, options):
+        requeue_stale(options['stale_after'])
+        if time.monotonic() - self.expired_at >= EXPIRE_EVERY:
+            delete_expired(options['keep_results'])
+            self.expired_at = time.monotonic()
+
+    @staticmethod
+    def submit(pool, jobs, running):
+        """False, если пул уже сломан; не запущенные задачи - в очередь."""
+
+        for index, job in enumerate(jobs):
+            try:
+                running[pool.submit(execute, job.id)] = job
+            except BrokenProcessPool:
+                release(jobs[index:])
+                return False
+        return True
+
+    def collect(self, running, timeout, return_when):
+        """Завершаем выполненные задачи; True, если умер процесс пула."""
+
+        done, _ = wait(running, timeout=timeout, return_when=return_when)
+        broken = False
+        for future in done:
+            job = running.pop(future)
+            try:
+                ok, outcome = future.result()
+            except BrokenProcessPool as error:
+                # Например, OOM killer: это попытка, как и исключение.
+                broken = True
+                ok, outcome = False, f'Процесс пула упал: {error!r}'
+            except Exception as error:
+                ok, outcome = False, repr(error)
+            if finish(job, ok, outcome):
+                self.stdout.write(f'{job}: попытка {job.attempts}.')
+            else:
+                self.stdout.write(
+                    f'{job}: задачу уже перезапустили, итог отброшен.')
+        return broken
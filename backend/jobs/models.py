@@ -0,0 +1,74 @@
+from django.contrib.auth import get_user_model
+from django.db import models
+
+User = get_user_model()
+
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(
+        'Задача',
+        max_length=100)
+    payload = models.JSONField(
+        'Параметры',
+        default=dict,
+        blank=True)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='jobs',
+        verbose_name='Пользователь')
+    status = models.CharField(
+        'Статус',
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED)
+    priority = models.SmallIntegerField(
+        'Приоритет',
+        default=0)
+    attempts = models.PositiveSmallIntegerField(
+        'Попыток',
+        default=0)
+    max_attempts = models.PositiveSmallIntegerField(
+        'Макс. попыток',
+        default=3)
+    run_after = models.DateTimeField(
+        'Не раньше')
+    locked_at = models.DateTimeField(
+        'Взята в работу',
+        null=True,
+        blank=True)
+    result = models.JSONField(
+        'Результат',
+        null=True,
+        blank=True)
+    error = models.TextField(
+        'Ошибка',
+        blank=True)
+    created = models.DateTimeField(
+        'Создана',
+        auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ['-id']
+        indexes = [
+            models.Index(
+                fields=['status', '-priority', 'run_after'],
+                name='job_queue_idx')]
+
+    def __str__(self):
+        return f'{self.name} #{self.id} ({self.status})'
@@ -0,0 +1,141 @@
+import traceback
+from datetime import timedelta
+
+from django.core.files.storage import storages
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from jobs.models import Job
+
+TASKS = {}
+
+
+def task(name):
+    """Регистрируем функцию как фоновую задачу."""
+
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, user=None, priority=0, max_attempts=3):
+    if name not in TASKS:
+        raise KeyError(f'Неизвестная задача {name}.')
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        user=user,
+        priority=priority,
+        max_attempts=max_attempts,
+        run_after=timezone.now())
+
+
+def claim(limit):
+    """Забираем задачи; SKIP LOCKED не дает двум воркерам взять одну."""
+
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(Job.objects.select_for_update(skip_locked=True).filter(
+            status=Job.QUEUED, run_after__lte=now,
+        ).order_by('-priority', 'id')[:limit])
+        Job.objects.filter(id__in=[job.id for job in jobs]).update(
+            status=Job.RUNNING, locked_at=now)
+    for job in jobs:
+        # По locked_at finish узнает, что задача все еще за этим воркером.
+        job.status, job.locked_at = Job.RUNNING, now
+    return jobs
+
+
+def release(jobs):
+    """Возвращаем в очередь взятые, но не запущенные задачи."""
+
+    Job.objects.filter(id__in=[job.id for job in jobs]).update(
+        status=Job.QUEUED, locked_at=None)
+
+
+def requeue_stale(timeout):
+    """Возвращаем в очередь задачи упавших воркеров.
+
+    Зависание - это попытка: задача, которая каждый раз роняет процесс,
+    после max_attempts становится FAILED, а не крутится вечно.
+    """
+
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        locked_at__lt=timezone.now() - timedelta(seconds=timeout))
+    changes = {
+        'attempts': F('attempts') + 1,
+        'locked_at': None,
+        'error': f'Задача не завершилась за {timeout} с.',
+    }
+    failed = stale.filter(attempts__gte=F('max_attempts') - 1).update(
+        status=Job.FAILED, **changes)
+    return stale.update(status=Job.QUEUED, **changes) + failed
+
+
+def delete_expired(ttl):
+    """Удаляем завершенные задачи старше ttl секунд вместе с файлами."""
+
+    deleted, _ = Job.objects.filter(
+        status__in=(Job.DONE, Job.FAILED),
+        created__lt=timezone.now() - timedelta(seconds=ttl),
+    ).delete()
+    return deleted
+
+
+def execute(job_id):
+    """Выполняется в процессе пула, возвращает (ok, результат/ошибка)."""
+
+    try:
+        job = Job.objects.get(id=job_id)
+        return True, TASKS[job.name](job)
+    except Exception:
+        return False, traceback.format_exc()
+    finally:
+        connections.close_all()
+
+
+def delete_result(result):
+    if isinstance(result, dict) and result.get('file'):
+        storages['private'].delete(result['file'])
+
+
+@receiver(post_delete, sender=Job)
+def delete_result_file(sender, instance, **kwargs):
+    """Файл результата ({'file': имя} в закрытом хранилище)."""
+
+    delete_result(instance.result)
+
+
+def finish(job, ok, outcome):
+    """Итог попытки; False, если задачу уже забрали у этого воркера.
+
+    Пока задача выполнялась, requeue_stale мог вернуть ее в очередь,
+    а другой воркер - взять снова. Тогда эта попытка ничего не меняет:
+    обновляем строку, только если locked_at тот же, что при claim.
+    """
+
+    attempts = job.attempts + 1
+    changes = {'attempts': attempts, 'locked_at': None}
+    if ok:
+        changes.update(status=Job.DONE, result=outcome, error='')
+    elif attempts < job.max_attempts:
+        changes.update(
+            status=Job.QUEUED, error=outcome,
+            run_after=timezone.now() + timedelta(seconds=2 ** attempts))
+    else:
+        changes.update(status=Job.FAILED, error=outcome)
+    updated = Job.objects.filter(
+        pk=job.pk, status=Job.RUNNING, locked_at=job.locked_at,
+    ).update(**changes)
+    if not updated:
+        if ok:
+            delete_result(outcome)
+        return False
+    for name, value in changes.items():
+        setattr(job, name, value)
+    return True
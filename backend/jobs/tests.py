@@ -0,0 +1,190 @@
+import threading
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from jobs.models import Job
+from jobs.queue import TASKS, claim, enqueue, finish, requeue_stale, task
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCartRecipe)
+
+User = get_user_model()
+
+
+@task('test_noop')
+def noop(job):
+    return {'ok': True}
+
+
+def make_stale(*jobs, seconds=3600):
+    Job.objects.filter(id__in=[job.id for job in jobs]).update(
+        locked_at=timezone.now() - timedelta(seconds=seconds))
+
+
+class QueueTests(TestCase):
+    """Порядок выдачи, повторы с паузой, зависшие задачи."""
+
+    def test_claim_order_and_priority(self):
+        first = enqueue('test_noop')
+        urgent = enqueue('test_noop', priority=1)
+        second = enqueue('test_noop')
+        later = enqueue('test_noop', priority=5)
+        Job.objects.filter(id=later.id).update(
+            run_after=timezone.now() + timedelta(hours=1))
+        self.assertEqual(
+            [job.id for job in claim(2)], [urgent.id, first.id])
+        self.assertEqual([job.id for job in claim(5)], [second.id])
+        self.assertEqual(claim(5), [])
+        self.assertEqual(
+            Job.objects.filter(status=Job.RUNNING).count(), 3)
+
+    def test_retry_backoff(self):
+        enqueue('test_noop', max_attempts=3)
+        for attempt, pause in ((1, 2), (2, 4)):
+            job, = claim(1)
+            started = timezone.now()
+            self.assertTrue(finish(job, False, 'ошибка'))
+            job.refresh_from_db()
+            self.assertEqual(
+                (job.status, job.attempts, job.error),
+                (Job.QUEUED, attempt, 'ошибка'))
+            self.assertAlmostEqual(
+                (job.run_after - started).total_seconds(), pause, delta=1)
+            # До run_after задачу не выдаем.
+            self.assertEqual(claim(1), [])
+            Job.objects.filter(id=job.id).update(run_after=timezone.now())
+        job, = claim(1)
+        self.assertTrue(finish(job, False, 'ошибка'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 3))
+
+    def test_stale_jobs_are_requeued_then_failed(self):
+        enqueue('test_noop', max_attempts=2)
+        job, = claim(1)
+        make_stale(job)
+        self.assertEqual(requeue_stale(60), 1)
+        job.refresh_from_db()
+        self.assertEqual(
+            (job.status, job.attempts, job.locked_at), (Job.QUEUED, 1, None))
+        job, = claim(1)
+        # Свежую задачу не трогаем.
+        self.assertEqual(requeue_stale(60), 0)
+        make_stale(job)
+        self.assertEqual(requeue_stale(60), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_late_finish_is_dropped(self):
+        enqueue('test_noop')
+        slow, = claim(1)
+        make_stale(slow)
+        requeue_stale(60)
+        Job.objects.filter(id=slow.id).update(run_after=timezone.now())
+        rerun, = claim(1)
+        storage = storages['private']
+        name = storage.save('shopping_lists/jobs/late.pdf', ContentFile(b''))
+        self.addCleanup(storage.delete, name)
+        self.assertFalse(finish(slow, True, {'file': name}))
+        self.assertFalse(storage.exists(name))
+        job = Job.objects.get(id=slow.id)
+        self.assertEqual((job.status, job.attempts), (Job.RUNNING, 1))
+        self.assertTrue(finish(rerun, True, {'ok': True}))
+        job.refresh_from_db()
+        self.assertEqual(
+            (job.status, job.attempts, job.result),
+            (Job.DONE, 2, {'ok': True}))
+
+
+@skipUnless(
+    connection.features.has_select_for_update_skip_locked,
+    'SKIP LOCKED есть только у PostgreSQL (и MySQL 8).')
+class SkipLockedTests(TransactionTestCase):
+    def test_locked_job_is_skipped(self):
+        first, second = enqueue('test_noop'), enqueue('test_noop')
+        locked, release = threading.Event(), threading.Event()
+
+        def hold_lock():
+            # Другой воркер посреди claim: строка first под FOR UPDATE.
+            with transaction.atomic():
+                list(Job.objects.select_for_update().filter(id=first.id))
+                locked.set()
+                release.wait(10)
+            connection.close()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        try:
+            self.assertTrue(locked.wait(10))
+            self.assertEqual([job.id for job in claim(2)], [second.id])
+        finally:
+            release.set()
+            thread.join()
+
+
+class AsyncShoppingCartTests(TestCase):
+    """?mode=async: задача, статус, скачивание готового PDF."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='cook@example.com', username='cook',
+            first_name='Повар', last_name='Поваров')
+        cls.other = User.objects.create_user(
+            email='other@example.com', username='other',
+            first_name='Другой', last_name='Другов')
+        recipe = Recipe.objects.create(
+            author=cls.user, name='Суп', text='Текст', cooking_time=10,
+            image='recipe.png')
+        RecipeIngredient.objects.create(
+            recipe=recipe, amount=5,
+            ingredient=Ingredient.objects.create(
+                name='соль', measurement_unit='г'))
+        ShoppingCartRecipe.objects.create(
+            shoppingcart=cls.user.shopping_cart, recipe=recipe)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url, user=None):
+        token, _ = Token.objects.get_or_create(user=user or self.user)
+        return self.client.get(
+            url, HTTP_HOST='localhost',
+            HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def run_jobs(self):
+        # Шаг run_worker без пула процессов.
+        for job in claim(10):
+            self.assertTrue(finish(job, True, TASKS[job.name](job)))
+
+    def test_download_flow(self):
+        response = self.get(
+            '/api/recipes/download_shopping_cart/?mode=async')
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual(job['status'], Job.QUEUED)
+        self.assertIsNone(job['download_url'])
+        download = f'/api/jobs/{job["id"]}/download/'
+        self.assertEqual(self.get(download).status_code, 409)
+
+        self.run_jobs()
+        job = self.get(f'/api/jobs/{job["id"]}/').json()
+        self.assertEqual(job['status'], Job.DONE)
+        self.assertTrue(job['download_url'].endswith(download))
+        self.assertEqual(self.get(download, self.other).status_code, 404)
+        response = self.get(download)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response).startswith(b'%PDF'))
+
+        name = Job.objects.get(id=job['id']).result['file']
+        self.assertTrue(name.startswith('shopping_lists/jobs/'))
+        self.assertTrue(storages['private'].exists(name))
+        Job.objects.filter(id=job['id']).delete()
+        self.assertFalse(storages['private'].exists(name))
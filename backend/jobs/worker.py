@@ -0,0 +1,9 @@
+import os
+
+
+def init_process(settings_module):
+    """Инициализация процесса пула; модуль не импортирует модели."""
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
@@ -1,9 +1,57 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, Exists, OuterRef, Prefetch, Q
+from django.utils.functional import cached_property
 
 from .models import (FavoriteRecipe, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Subscribe, Tag)
+                     ShoppingCart, ShoppingCartRecipe, Subscribe, Tag,
+                     UnitConversion)
 
 EMPTY_MSG = '-пусто-'
+# Ниже этого числа строк оценка планировщика неточна, считаем честно.
+ESTIMATE_THRESHOLD = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """Для больших таблиц без фильтров берем оценку из pg_class."""
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        connection = connections[self.object_list.db]
+        if connection.vendor == 'postgresql' and not query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE relname = %s',
+                    [self.object_list.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] >= ESTIMATE_THRESHOLD:
+                return int(row[0])
+        return super().count
+
+
+class LargeTableAdminMixin:
+    """Без второго COUNT(*) на всю таблицу и с оценочным числом строк."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class TagListFilter(admin.SimpleListFilter):
+    """Фильтр по тэгу через EXISTS, без JOIN и DISTINCT."""
+
+    title = 'Тэги'
+    parameter_name = 'tag'
+
+    def lookups(self, request, model_admin):
+        return Tag.objects.values_list('id', 'name')
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'), tag_id=self.value())))
 
 
 class RecipeIngredientAdmin(admin.StackedInline):
@@ -12,20 +60,44 @@ class RecipeIngredientAdmin(admin.StackedInline):
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = (
         'id', 'get_author', 'name', 'text',
         'cooking_time', 'get_tags', 'get_ingredients',
         'pub_date', 'get_favorite_count')
+    list_select_related = ('author',)
     search_fields = (
-        'name', 'cooking_time',
-        'author__email', 'ingredients__name')
-    list_filter = ('pub_date', 'tags',)
+        'name', 'cooking_time', 'author__email')
+    list_filter = ('pub_date', TagListFilter,)
     inlines = (RecipeIngredientAdmin,)
     empty_value_display = EMPTY_MSG
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient')),
+        ).annotate(favorite_count=Count('favorite_recipe'))
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по ингредиентам через EXISTS: без дублей строк."""
+
+        found, may_have_duplicates = super().get_search_results(
+            request, queryset, search_term)
+        if not search_term:
+            return found, may_have_duplicates
+        return queryset.filter(
+            Q(pk__in=found.values('pk'))
+            | Q(Exists(RecipeIngredient.objects.filter(
+                recipe_id=OuterRef('pk'),
+                ingredient__name__icontains=search_term)))
+        ), may_have_duplicates
+
     @admin.display(
-        description='Электронная почта автора')
+        description='Электронная почта автора',
+        ordering='author__email')
     def get_author(self, obj):
         return obj.author.email
 
@@ -37,15 +109,15 @@ class RecipeAdmin(admin.ModelAdmin):
     @admin.display(description=' Ингредиенты ')
     def get_ingredients(self, obj):
         return '\n '.join([
-            f'{item["ingredient__name"]} - {item["amount"]}'
-            f' {item["ingredient__measurement_unit"]}.'
-            for item in obj.recipe.values(
-                'ingredient__name',
-                'amount', 'ingredient__measurement_unit')])
+            f'{item.ingredient.name} - {item.amount}'
+            f' {item.ingredient.measurement_unit}.'
+            for item in obj.recipe.all()])
 
-    @admin.display(description='В избранном')
+    @admin.display(
+        description='В избранном',
+        ordering='favorite_count')
     def get_favorite_count(self, obj):
-        return obj.favorite_recipe.count()
+        return obj.favorite_count
 
 
 @admin.register(Tag)
@@ -57,7 +129,7 @@ class TagAdmin(admin.ModelAdmin):
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = (
         'id', 'name', 'measurement_unit',)
     search_fields = (
@@ -66,43 +138,58 @@ class IngredientAdmin(admin.ModelAdmin):
 
 
 @admin.register(Subscribe)
-class SubscribeAdmin(admin.ModelAdmin):
+class SubscribeAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = (
         'id', 'user', 'author', 'created',)
+    list_select_related = ('user', 'author',)
     search_fields = (
         'user__email', 'author__email',)
     empty_value_display = EMPTY_MSG
 
 
-@admin.register(FavoriteRecipe)
-class FavoriteRecipeAdmin(admin.ModelAdmin):
+class UserRecipesAdminMixin(LargeTableAdminMixin):
+    """Рецепты и их число для списков избранного и корзин."""
+
     list_display = (
         'id', 'user', 'get_recipe', 'get_count')
+    list_select_related = ('user',)
     empty_value_display = EMPTY_MSG
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('recipe', queryset=Recipe.objects.only('id', 'name'))
+        ).annotate(recipe_count=Count('recipe'))
+
     @admin.display(
         description='Рецепты')
     def get_recipe(self, obj):
-        return [
-            f'{item["name"]} ' for item in obj.recipe.values('name')[:5]]
+        return [f'{item.name} ' for item in obj.recipe.all()[:5]]
 
     @admin.display(
-        description='В избранных')
+        description='Рецептов',
+        ordering='recipe_count')
     def get_count(self, obj):
-        return obj.recipe.count()
+        return obj.recipe_count
+
+
+@admin.register(FavoriteRecipe)
+class FavoriteRecipeAdmin(UserRecipesAdminMixin, admin.ModelAdmin):
+    pass
+
+
+class ShoppingCartRecipeAdmin(admin.TabularInline):
+    model = ShoppingCartRecipe
+    raw_id_fields = ('recipe',)
 
 
 @admin.register(ShoppingCart)
-class SoppingCartAdmin(admin.ModelAdmin):
-    list_display = (
-        'id', 'user', 'get_recipe', 'get_count')
-    empty_value_display = EMPTY_MSG
+class SoppingCartAdmin(UserRecipesAdminMixin, admin.ModelAdmin):
+    inlines = (ShoppingCartRecipeAdmin,)
 
-    @admin.display(description='Рецепты')
-    def get_recipe(self, obj):
-        return [
-            f'{item["name"]} ' for item in obj.recipe.values('name')[:5]]
 
-    @admin.display(description='В избранных')
-    def get_count(self, obj):
-        return obj.recipe.count()
+@admin.register(UnitConversion)
+class UnitConversionAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'unit', 'base_unit', 'factor',)
+    search_fields = (
+        'unit', 'base_unit',)
@@ -0,0 +1,173 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Recipe, Subscribe, TimelineEntry
+
+POPULAR_AUTHORS_KEY = 'feed:popular-authors'
+
+
+def popular_authors():
+    """Авторы, чьи рецепты не раскладываются по лентам, а читаются."""
+
+    return cache.get_or_set(
+        POPULAR_AUTHORS_KEY,
+        lambda: set(Subscribe.objects.values('author').annotate(
+            followers=Count('id')
+        ).filter(
+            followers__gt=settings.FEED_FANOUT_LIMIT
+        ).values_list('author', flat=True)),
+        settings.FEED_POPULAR_TTL)
+
+
+def is_popular(author_id):
+    return author_id in popular_authors()
+
+
+def follower_ids(author_id):
+    return list(Subscribe.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True))
+
+
+def recent_recipes(author_id):
+    return list(Recipe.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id').values_list('id', 'pub_date')[
+            :settings.FEED_BACKFILL])
+
+
+def deliver(user_ids, author_id, recipes):
+    """Записи (id, pub_date) рецептов автора в ленты user_ids."""
+
+    return len(TimelineEntry.objects.bulk_create(
+        (TimelineEntry(
+            user_id=user_id, recipe_id=recipe_id,
+            author_id=author_id, pub_date=pub_date)
+         for recipe_id, pub_date in recipes for user_id in user_ids),
+        batch_size=1000,
+        ignore_conflicts=True))
+
+
+def deliver_recent(user_ids, author_id):
+    """Последние рецепты автора в ленты user_ids по их pub_date."""
+
+    deliver(user_ids, author_id, recent_recipes(author_id))
+    trim_overflowing(user_ids)
+
+
+def fan_out(*recipes):
+    """Кладем новые рецепты одного автора в ленты его подписчиков."""
+
+    author_id = recipes[0].author_id
+    if is_popular(author_id):
+        return 0
+    # Подписчиков не больше FEED_FANOUT_LIMIT, иначе автор популярный.
+    followers = follower_ids(author_id)
+    created = deliver(
+        followers, author_id,
+        [(recipe.id, recipe.pub_date) for recipe in recipes])
+    trim_overflowing(followers)
+    return created
+
+
+def backfill(user_id, author_id, trim_timeline=True):
+    """Последние рецепты автора в ленту нового подписчика."""
+
+    if is_popular(author_id):
+        return
+    deliver([user_id], author_id, recent_recipes(author_id))
+    if trim_timeline:
+        trim(user_id)
+
+
+def trim(user_id):
+    """Оставляем в ленте не больше FEED_MAX_ENTRIES последних записей."""
+
+    oldest_kept = TimelineEntry.objects.filter(user_id=user_id).values_list(
+        'pub_date', flat=True)[settings.FEED_MAX_ENTRIES - 1:
+                               settings.FEED_MAX_ENTRIES]
+    if oldest_kept:
+        TimelineEntry.objects.filter(
+            user_id=user_id, pub_date__lt=oldest_kept[0]).delete()
+
+
+def trim_overflowing(user_ids):
+    """trim только для лент длиннее FEED_MAX_ENTRIES: один запрос-счетчик."""
+
+    for user_id in TimelineEntry.objects.filter(
+            user_id__in=user_ids).values('user_id').annotate(
+            entries=Count('id')).filter(
+            entries__gt=settings.FEED_MAX_ENTRIES).values_list(
+            'user_id', flat=True):
+        trim(user_id)
+
+
+def popularity_changed(author_id):
+    """Автор перешел порог FEED_FANOUT_LIMIT подписчиков.
+
+    Сбрасываем кэш popular_authors: ставший популярным сразу читается
+    из Recipe. Переставшему быть популярным раскладываем последние
+    рецепты по лентам подписчиков: изданное за время популярности
+    и подписки этого времени лентам не досталось.
+    """
+
+    followers = follower_ids(author_id)
+    if len(followers) <= settings.FEED_FANOUT_LIMIT:
+        deliver_recent(followers, author_id)
+    cache.delete(POPULAR_AUTHORS_KEY)
+
+
+def follower_count(author_id):
+    return Subscribe.objects.filter(author_id=author_id).count()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        fan_out(instance)
+
+
+@receiver(post_save, sender=Subscribe)
+def subscribed(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    # Эта подписка перевела автора через порог.
+    if follower_count(instance.author_id) == settings.FEED_FANOUT_LIMIT + 1:
+        popularity_changed(instance.author_id)
+    backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscribe)
+def unsubscribed(sender, instance, **kwargs):
+    TimelineEntry.objects.filter(
+        user_id=instance.user_id, author_id=instance.author_id).delete()
+    if follower_count(instance.author_id) == settings.FEED_FANOUT_LIMIT:
+        popularity_changed(instance.author_id)
+
+
+def feed_page(user, limit, before=None):
+    """Ключи (pub_date, id) страницы ленты и признак продолжения.
+
+    Записи timeline сливаются с рецептами популярных авторов, на которых
+    подписан пользователь; before - ключ последнего рецепта прошлой
+    страницы.
+    """
+
+    timeline = TimelineEntry.objects.filter(user=user)
+    popular = Recipe.objects.filter(author_id__in=list(
+        Subscribe.objects.filter(
+            user=user, author_id__in=popular_authors()
+        ).values_list('author_id', flat=True)))
+    if before is not None:
+        pub_date, recipe_id = before
+        timeline = timeline.filter(
+            Q(pub_date__lt=pub_date)
+            | Q(pub_date=pub_date, recipe_id__lt=recipe_id))
+        popular = popular.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=recipe_id))
+    keys = set(timeline.values_list('pub_date', 'recipe_id')[:limit + 1])
+    keys.update(popular.order_by('-pub_date', '-id').values_list(
+        'pub_date', 'id')[:limit + 1])
+    keys = sorted(keys, reverse=True)
+    return keys[:limit], len(keys) > limit
@@ -0,0 +1,219 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.dispatch import Signal
+
+from recipes.models import Ingredient, Tag
+
+BATCH_SIZE = 1000
+READ_CHUNK = 64 * 1024
+TAG_FIELDS = ('name', 'color', 'slug')
+# Ошибки данных, о которых команды сообщают без traceback.
+LOAD_ERRORS = (OSError, ValueError, KeyError, IntegrityError)
+# bulk_create не шлет post_save: кэши справочников сбрасываем по нему.
+bulk_loaded = Signal()
+
+
+def read_csv(path):
+    """Построчно читаем csv файл с заголовком."""
+
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        yield from csv.DictReader(file)
+
+
+def read_jsonl(path):
+    """Построчно читаем файл в формате JSON Lines."""
+
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def read_json(path):
+    """Потоково читаем JSON массив объектов, не загружая файл целиком."""
+
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as file:
+        buffer = file.read(READ_CHUNK).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f'{path}: ожидается JSON массив.')
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = file.read(READ_CHUNK)
+                if not chunk:
+                    raise
+                buffer += chunk
+                continue
+            yield item
+            buffer = buffer[end:]
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+    '.jsonl': read_jsonl,
+}
+
+
+def read_records(path):
+    """Выбираем читателя по расширению файла."""
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise ValueError(
+            f'Неподдерживаемый формат {extension}, '
+            f'доступны: {", ".join(READERS)}.')
+    return READERS[extension](path)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class LoadStats:
+    """Счетчики загрузки и пропускная способность."""
+
+    def __init__(self):
+        self.read = 0
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        # Строки, которые будут добавлены или изменены (для --dry-run).
+        self.changes = []
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self):
+        return self.read / self.elapsed if self.elapsed else 0
+
+    def __str__(self):
+        return (
+            f'прочитано {self.read}, новых {self.created}, '
+            f'изменено {self.updated}, '
+            f'уже есть {self.skipped} за {self.elapsed:.1f} c '
+            f'({self.rate:.0f} строк/с)')
+
+
+def _ingredient_key(record):
+    name, unit = record['name'], record['measurement_unit']
+    if not isinstance(name, str) or not isinstance(unit, str):
+        raise ValueError(f'Неверный ингредиент: {record!r}.')
+    return name.strip(), unit.strip()
+
+
+def load_ingredients(records, batch_size=BATCH_SIZE, dry_run=False,
+                     progress=None):
+    """Пакетный upsert ингредиентов по (name, measurement_unit)."""
+
+    stats = LoadStats()
+    for batch in batched(records, batch_size):
+        keys = {_ingredient_key(record) for record in batch}
+        stats.read += len(batch)
+        existing = set(
+            Ingredient.objects.filter(
+                name__in={name for name, _ in keys}
+            ).values_list('name', 'measurement_unit'))
+        new = keys - existing
+        stats.skipped += len(batch) - len(new)
+        stats.created += len(new)
+        if dry_run:
+            stats.changes += [
+                f'+ {name}, {unit}' for name, unit in sorted(new)]
+        elif new:
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in new),
+                batch_size=batch_size,
+                ignore_conflicts=True)
+        if progress:
+            progress(stats)
+    if not dry_run and stats.created:
+        bulk_loaded.send(sender=Ingredient)
+    return stats
+
+
+def _tag(record):
+    """Тэг из записи файла: ровно name, color и slug, все строки."""
+
+    if not isinstance(record, dict):
+        raise ValueError(f'Неверный тэг: {record!r}.')
+    extra = set(record) - set(TAG_FIELDS)
+    if extra:
+        raise ValueError(f'Лишние поля тэга: {", ".join(sorted(extra))}.')
+    values = {field: record[field] for field in TAG_FIELDS}
+    if not all(isinstance(value, str) for value in values.values()):
+        raise ValueError(f'Неверный тэг: {record!r}.')
+    return Tag(**{field: value.strip() for field, value in values.items()})
+
+
+def _check_tag_conflicts(tags):
+    """Имя и цвет уникальны: не должны совпасть у разных slug.
+
+    Иначе upsert по slug упадет с IntegrityError посреди загрузки.
+    """
+
+    for field in TAG_FIELDS:
+        values = [getattr(tag, field) for tag in tags]
+        if len(set(values)) != len(values):
+            raise ValueError(f'В файле повторяется {field} тэгов.')
+    taken = Tag.objects.filter(
+        Q(name__in=[tag.name for tag in tags])
+        | Q(color__in=[tag.color for tag in tags]))
+    for old in taken:
+        for tag in tags:
+            if tag.slug != old.slug and (
+                    tag.name == old.name or tag.color == old.color):
+                raise ValueError(
+                    f'Тэг {tag.slug}: имя или цвет уже у тэга {old.slug}.')
+
+
+def load_tags(records, dry_run=False):
+    """Upsert тэгов по slug: имя и цвет обновляются."""
+
+    stats = LoadStats()
+    tags = [_tag(record) for record in records]
+    stats.read = len(tags)
+    _check_tag_conflicts(tags)
+    existing = Tag.objects.in_bulk(
+        [tag.slug for tag in tags], field_name='slug')
+    for tag in tags:
+        old = existing.get(tag.slug)
+        if old is None:
+            stats.created += 1
+            stats.changes.append(f'+ {tag.slug}: {tag.name}, {tag.color}')
+        elif (old.name, old.color) != (tag.name, tag.color):
+            stats.updated += 1
+            stats.changes.append(
+                f'~ {tag.slug}: {old.name}, {old.color} '
+                f'-> {tag.name}, {tag.color}')
+        else:
+            stats.skipped += 1
+    if not dry_run:
+        with transaction.atomic():
+            Tag.objects.bulk_create(
+                tags,
+                update_conflicts=True,
+                unique_fields=('slug',),
+                update_fields=('name', 'color'))
+        if stats.created or stats.updated:
+            bulk_loaded.send(sender=Tag)
+    return stats
@@ -1,22 +1,51 @@
-import csv
+import os
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
 
-from recipes.models import Ingredient
+from recipes.loaders import (BATCH_SIZE, LOAD_ERRORS, load_ingredients,
+                             read_records)
 
 
 class Command(BaseCommand):
-    help = 'Загрузка из csv файла'
+    help = 'Загрузка ингредиентов из csv, json или jsonl файла'
 
-    def handle(self, *args, **kwargs):
-        data_path = settings.BASE_DIR
-        with open(
-            f'{data_path}/data/ingredients.csv',
-            'r',
-            encoding='utf-8'
-        ) as file:
-            reader = csv.DictReader(file)
-            Ingredient.objects.bulk_create(
-                Ingredient(**data) for data in reader)
-        self.stdout.write(self.style.SUCCESS('Все ингридиенты загружены!'))
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=os.path.join(
+                settings.BASE_DIR, 'data', 'ingredients.csv'),
+            help='Путь к файлу с ингредиентами.')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Размер пакета для вставки.')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, какие записи будут добавлены.')
+
+    def show_progress(self, stats):
+        self.stdout.write(f'... {stats}')
+
+    def handle(self, *args, **options):
+        try:
+            records = read_records(options['path'])
+            stats = load_ingredients(
+                records,
+                batch_size=options['batch_size'],
+                dry_run=options['dry_run'],
+                progress=(
+                    self.show_progress if options['verbosity'] > 1
+                    else None))
+        except LOAD_ERRORS as error:
+            raise CommandError(f'Ошибка загрузки: {error!r}')
+        if options['dry_run']:
+            for change in stats.changes:
+                self.stdout.write(change)
+            self.stdout.write(f'Пробный запуск: {stats}')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Все ингридиенты загружены: {stats}'))
@@ -1,15 +1,38 @@
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
 
-from recipes.models import Tag
+from recipes.loaders import LOAD_ERRORS, load_tags, read_records
+
+DEFAULT_TAGS = [
+    {'name': 'Завтрак', 'color': '#E26C2D', 'slug': 'breakfast'},
+    {'name': 'Обед', 'color': '#49B64E', 'slug': 'dinner'},
+    {'name': 'Ужин', 'color': '#8775D2', 'slug': 'supper'}]
 
 
 class Command(BaseCommand):
     help = 'Создаем тэги'
 
-    def handle(self, *args, **kwargs):
-        data = [
-            {'name': 'Завтрак', 'color': '#E26C2D', 'slug': 'breakfast'},
-            {'name': 'Обед', 'color': '#49B64E', 'slug': 'dinner'},
-            {'name': 'Ужин', 'color': '#8775D2', 'slug': 'supper'}]
-        Tag.objects.bulk_create(Tag(**tag) for tag in data)
-        self.stdout.write(self.style.SUCCESS('Все тэги загружены!'))
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            help='Файл с тэгами (csv, json, jsonl), иначе базовый набор.')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, какие тэги будут добавлены или изменены.')
+
+    def handle(self, *args, **options):
+        try:
+            records = (
+                read_records(options['path']) if options['path']
+                else DEFAULT_TAGS)
+            stats = load_tags(records, dry_run=options['dry_run'])
+        except LOAD_ERRORS as error:
+            raise CommandError(f'Ошибка загрузки: {error!r}')
+        if options['dry_run']:
+            for change in stats.changes:
+                self.stdout.write(change)
+            self.stdout.write(f'Пробный запуск: {stats}')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Все тэги загружены: {stats}'))
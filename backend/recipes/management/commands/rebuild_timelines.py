@@ -0,0 +1,27 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.feed import backfill, trim
+from recipes.models import Subscribe, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = 'Пересобираем ленты подписок (после bulk загрузки данных)'
+
+    @transaction.atomic
+    def handle(self, *args, **kwargs):
+        TimelineEntry.objects.all().delete()
+        subscriptions = Subscribe.objects.values_list(
+            'user_id', 'author_id').order_by('user_id')
+        previous_user = None
+        for count, (user_id, author_id) in enumerate(
+                subscriptions.iterator(chunk_size=2000), start=1):
+            if previous_user not in (None, user_id):
+                trim(previous_user)
+            previous_user = user_id
+            backfill(user_id, author_id, trim_timeline=False)
+            if not count % 1000:
+                self.stdout.write(f'Подписок: {count}', ending='\r')
+        if previous_user is not None:
+            trim(previous_user)
+        self.stdout.write(self.style.SUCCESS('Ленты пересобраны!'))
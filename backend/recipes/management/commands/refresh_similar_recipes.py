@@ -0,0 +1,29 @@
+import time
+
+from django.core.management import BaseCommand
+
+from recipes.models import StaleSimilarity
+from recipes.similar import refresh
+
+
+class Command(BaseCommand):
+    help = 'Пересчитываем похожие рецепты (по умолчанию - только устаревшие)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать соседей всех рецептов. Запускайте '
+                 'периодически (например, раз в сутки): отметки не ловят '
+                 'рецепты, чьим соседом рецепт станет после удаления '
+                 'из избранного.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        stale = list(StaleSimilarity.objects.values_list(
+            'recipe_id', flat=True))
+        count = refresh(None if options['full'] else stale)
+        # Отметки, появившиеся во время расчета, остаются до следующего.
+        StaleSimilarity.objects.filter(recipe_id__in=stale).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитаны соседи {count} рецептов за '
+            f'{time.perf_counter() - started:.1f} c.'))
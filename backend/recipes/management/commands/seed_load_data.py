@@ -0,0 +1,238 @@
+import random
+import re
+import time
+from itertools import accumulate
+from multiprocessing import get_context
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from recipes.loaders import batched
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, Subscribe, Tag)
+
+User = get_user_model()
+PASSWORD = 'loadtest-password'
+# Большие списки id передаются воркерам через fork, а не через pickle.
+SHARED = {}
+WORDS = (
+    'суп', 'салат', 'пирог', 'рагу', 'каша', 'запеканка', 'омлет',
+    'паста', 'плов', 'котлеты', 'блины', 'десерт', 'соус', 'смузи')
+
+
+class ZipfChoice:
+    """Выбор с распределением Ципфа: первые элементы популярнее."""
+
+    def __init__(self, items, exponent):
+        self.items = list(items)
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent
+            for rank in range(1, len(self.items) + 1)))
+
+    def sample(self, rnd, k):
+        """k различных элементов (или меньше, если элементов мало)."""
+
+        k = min(k, len(self.items))
+        chosen = set()
+        while len(chosen) < k:
+            chosen.update(rnd.choices(
+                self.items, cum_weights=self.cum_weights,
+                k=k - len(chosen)))
+        return chosen
+
+
+def _init_worker():
+    # Соединения родителя после fork не используем.
+    connections.close_all()
+
+
+def _seed_recipes(task):
+    """Создаем рецепты с ингредиентами и тэгами для среза [start, stop)."""
+
+    start, stop, options = task
+    rnd = random.Random(options['seed'] * 1_000_003 + start)
+    authors = ZipfChoice(SHARED['user_ids'], options['zipf'])
+    ingredients = ZipfChoice(SHARED['ingredient_ids'], options['zipf'])
+    tag_ids = SHARED['tag_ids']
+    tag_through = Recipe.tags.through
+    for batch in batched(range(start, stop), options['batch_size']):
+        with transaction.atomic():
+            recipes = Recipe.objects.bulk_create([
+                Recipe(
+                    author_id=authors.sample(rnd, 1).pop(),
+                    name=f'{rnd.choice(WORDS).capitalize()} №{number}',
+                    text=' '.join(rnd.choices(WORDS, k=30)),
+                    cooking_time=rnd.randint(1, 180))
+                for number in batch])
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(
+                    recipe_id=recipe.id,
+                    ingredient_id=ingredient_id,
+                    amount=rnd.randint(1, 500))
+                for recipe in recipes
+                for ingredient_id in ingredients.sample(
+                    rnd, rnd.randint(
+                        min(2, options['ingredients']),
+                        options['ingredients']))],
+                batch_size=options['batch_size'])
+            tag_through.objects.bulk_create([
+                tag_through(recipe_id=recipe.id, tag_id=tag_id)
+                for recipe in recipes
+                for tag_id in rnd.sample(
+                    tag_ids, rnd.randint(1, len(tag_ids)))],
+                batch_size=options['batch_size'])
+    return stop - start
+
+
+def _seed_relations(task):
+    """Подписки, избранное и корзины для пользователей из среза."""
+
+    user_ids, options = task
+    rnd = random.Random(options['seed'] * 1_000_033 + user_ids[0])
+    authors = ZipfChoice(SHARED['user_ids'], options['zipf'])
+    recipes = ZipfChoice(SHARED['recipe_ids'], options['zipf'])
+    favorite_through = FavoriteRecipe.recipe.through
+    cart_through = ShoppingCart.recipe.through
+    favorites = dict(FavoriteRecipe.objects.filter(
+        user_id__in=user_ids).values_list('user_id', 'id'))
+    carts = dict(ShoppingCart.objects.filter(
+        user_id__in=user_ids).values_list('user_id', 'id'))
+    with transaction.atomic():
+        Subscribe.objects.bulk_create([
+            Subscribe(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in authors.sample(
+                rnd, rnd.randint(0, options['subscriptions']))
+            if author_id != user_id],
+            batch_size=options['batch_size'],
+            ignore_conflicts=True)
+        favorite_through.objects.bulk_create([
+            favorite_through(
+                favoriterecipe_id=favorites[user_id], recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in recipes.sample(
+                rnd, rnd.randint(0, options['favorites']))],
+            batch_size=options['batch_size'],
+            ignore_conflicts=True)
+        cart_through.objects.bulk_create([
+            cart_through(
+                shoppingcart_id=carts[user_id], recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in recipes.sample(
+                rnd, rnd.randint(0, options['cart']))],
+            batch_size=options['batch_size'],
+            ignore_conflicts=True)
+    return len(user_ids)
+
+
+class Command(BaseCommand):
+    help = 'Генерация тестовых данных для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--subscriptions', type=int, default=20,
+            help='Макс. подписок на пользователя.')
+        parser.add_argument(
+            '--favorites', type=int, default=30,
+            help='Макс. избранных рецептов на пользователя.')
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Макс. рецептов в корзине пользователя.')
+        parser.add_argument(
+            '--ingredients', type=int, default=12,
+            help='Макс. ингредиентов в рецепте.')
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='Показатель распределения Ципфа для популярности.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Число процессов (для PostgreSQL).')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--prefix', default='load',
+            help='Префикс username/email создаваемых пользователей.')
+
+    def handle(self, *args, **options):
+        if options['ingredients'] < 1:
+            raise CommandError('--ingredients должно быть не меньше 1.')
+        SHARED['ingredient_ids'] = list(
+            Ingredient.objects.values_list('id', flat=True))
+        SHARED['tag_ids'] = list(Tag.objects.values_list('id', flat=True))
+        if not SHARED['ingredient_ids'] or not SHARED['tag_ids']:
+            raise CommandError(
+                'Сначала загрузите ингредиенты и тэги: '
+                'load_ingrs, load_tags.')
+        if (options['workers'] > 1
+                and connections['default'].vendor == 'sqlite'):
+            raise CommandError('SQLite не поддерживает --workers > 1.')
+        started = time.monotonic()
+        rnd = random.Random(options['seed'])
+        user_ids = self.seed_users(options)
+        rnd.shuffle(user_ids)
+        SHARED['user_ids'] = user_ids
+        self.run(
+            'Рецепты', _seed_recipes, options,
+            ((start, min(start + options['batch_size'],
+                         options['recipes']), options)
+             for start in range(
+                 0, options['recipes'], options['batch_size'])))
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        rnd.shuffle(recipe_ids)
+        SHARED['recipe_ids'] = recipe_ids
+        self.run(
+            'Подписки, избранное, корзины', _seed_relations, options,
+            ((chunk, options)
+             for chunk in batched(user_ids, options['batch_size'])))
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {time.monotonic() - started:.1f} c.'))
+
+    def seed_users(self, options):
+        password = make_password(PASSWORD)
+        prefix = options['prefix']
+        for batch in batched(range(options['users']), options['batch_size']):
+            with transaction.atomic():
+                User.objects.bulk_create([
+                    User(
+                        username=f'{prefix}{number}',
+                        email=f'{prefix}{number}@example.com',
+                        first_name='Имя',
+                        last_name=f'Фамилия {number}',
+                        password=password)
+                    for number in batch],
+                    ignore_conflicts=True)
+        # Только сгенерированные <prefix><номер>, не loader, loadtest и т.п.
+        users = User.objects.filter(
+            username__regex=rf'^{re.escape(prefix)}[0-9]+$',
+            email__endswith='@example.com')
+        user_ids = list(users.values_list('id', flat=True))
+        # bulk_create не шлет post_save, создаем избранное и корзины сами.
+        for model in (FavoriteRecipe, ShoppingCart):
+            existing = set(model.objects.filter(
+                user__in=users).values_list('user_id', flat=True))
+            model.objects.bulk_create(
+                (model(user_id=user_id) for user_id in user_ids
+                 if user_id not in existing),
+                batch_size=options['batch_size'])
+        self.stdout.write(f'Пользователей: {len(user_ids)}')
+        return user_ids
+
+    def run(self, title, func, options, tasks):
+        started, done = time.monotonic(), 0
+        if options['workers'] > 1:
+            connections.close_all()
+            with get_context('fork').Pool(
+                    options['workers'], initializer=_init_worker) as pool:
+                for count in pool.imap_unordered(func, tasks):
+                    done += count
+                    self.stdout.write(f'{title}: {done}', ending='\r')
+        else:
+            for task in tasks:
+                done += func(task)
+                self.stdout.write(f'{title}: {done}', ending='\r')
+        self.stdout.write(
+            f'{title}: {done} за {time.monotonic() - started:.1f} c.')
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:36
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Повторные запуски load_ingrs плодили дубли, склеиваем их."""
+
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep_id=Min('id'), total=Count('id')).filter(total__gt=1)
+    for group in duplicates.iterator():
+        extra_ids = list(Ingredient.objects.filter(
+            name=group['name'],
+            measurement_unit=group['measurement_unit'],
+        ).exclude(id=group['keep_id']).values_list('id', flat=True))
+        for extra_id in extra_ids:
+            used_in = RecipeIngredient.objects.filter(
+                ingredient_id=group['keep_id']).values('recipe_id')
+            RecipeIngredient.objects.filter(
+                ingredient_id=extra_id, recipe_id__in=used_in).delete()
+            RecipeIngredient.objects.filter(
+                ingredient_id=extra_id
+            ).update(ingredient_id=group['keep_id'])
+        Ingredient.objects.filter(id__in=extra_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop),
+    ]
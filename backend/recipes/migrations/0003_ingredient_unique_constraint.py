@@ -0,0 +1,17 @@
+from django.db import migrations, models
+
+
+# Отдельно от склейки дублей в 0002: PostgreSQL не дает менять таблицу
+# в одной транзакции с отложенными триггерами FK (pending trigger events).
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_ingredient_unique'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_unit'),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:55
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Объемы ложек и стакана - кухонные стандарты.
+UNIT_CONVERSIONS = (
+    ('мг', 'г', 0.001),
+    ('кг', 'г', 1000),
+    ('л', 'мл', 1000),
+    ('стакан', 'мл', 250),
+    ('ст. л.', 'мл', 15),
+    ('ч. л.', 'мл', 5),
+)
+
+
+def add_unit_conversions(apps, schema_editor):
+    UnitConversion = apps.get_model('recipes', 'UnitConversion')
+    UnitConversion.objects.bulk_create(
+        (UnitConversion(unit=unit, base_unit=base_unit, factor=factor)
+         for unit, base_unit, factor in UNIT_CONVERSIONS),
+        ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_ingredient_nutrition'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnitConversion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unit', models.CharField(max_length=200, unique=True, verbose_name='Единица измерения')),
+                ('base_unit', models.CharField(max_length=200, verbose_name='Базовая единица')),
+                ('factor', models.FloatField(validators=[django.core.validators.MinValueValidator(0)], verbose_name='Базовых единиц в одной')),
+            ],
+            options={
+                'verbose_name': 'Перевод единиц',
+                'verbose_name_plural': 'Переводы единиц',
+                'ordering': ['unit'],
+            },
+        ),
+        migrations.RunPython(
+            add_unit_conversions, migrations.RunPython.noop),
+        # Таблица связи уже есть: объявляем ее моделью, не трогая данные.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ShoppingCartRecipe',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_entries', to='recipes.recipe', verbose_name='Рецепт')),
+                        ('shoppingcart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='recipes.shoppingcart', verbose_name='Корзина')),
+                    ],
+                    options={
+                        'verbose_name': 'Рецепт в корзине',
+                        'verbose_name_plural': 'Рецепты в корзине',
+                        'db_table': 'recipes_shoppingcart_recipe',
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='shoppingcart',
+                    name='recipe',
+                    field=models.ManyToManyField(related_name='shopping_cart', through='recipes.ShoppingCartRecipe', to='recipes.recipe', verbose_name='Покупка'),
+                ),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='shoppingcartrecipe',
+            name='id',
+            field=models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcartrecipe',
+            name='servings',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(100)], verbose_name='Множитель порций'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcartrecipe',
+            constraint=models.UniqueConstraint(fields=('shoppingcart', 'recipe'), name='unique_cart_recipe'),
+        ),
+    ]
@@ -5,6 +5,7 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 
 User = get_user_model()
+MAX_SERVINGS = 100
 
 
 class Ingredient(models.Model):
@@ -14,11 +15,43 @@ class Ingredient(models.Model):
     measurement_unit = models.CharField(
         'Единица измерения ингредиента',
         max_length=200)
+    unit_weight = models.FloatField(
+        'Вес единицы измерения, г',
+        blank=True,
+        null=True,
+        help_text='Для штук, ложек и т.п.; г, кг, мл и л пересчитываются '
+                  'сами.')
+    calories = models.FloatField(
+        'Калорийность на 100 г, ккал',
+        blank=True,
+        null=True)
+    proteins = models.FloatField(
+        'Белки на 100 г, г',
+        blank=True,
+        null=True)
+    fats = models.FloatField(
+        'Жиры на 100 г, г',
+        blank=True,
+        null=True)
+    carbohydrates = models.FloatField(
+        'Углеводы на 100 г, г',
+        blank=True,
+        null=True)
+    price = models.DecimalField(
+        'Цена за 100 г, руб.',
+        max_digits=10,
+        decimal_places=2,
+        blank=True,
+        null=True)
 
     class Meta:
         ordering = ['name']
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_unit')]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}.'
@@ -84,6 +117,20 @@ class Recipe(models.Model):
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date', )
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_date_idx'),
+            # Диапазоны и сортировки фильтра рецептов.
+            models.Index(
+                fields=['pub_date', 'id'],
+                name='recipe_pub_date_idx'),
+            models.Index(
+                fields=['cooking_time', 'id'],
+                name='recipe_cooking_time_idx'),
+            models.Index(
+                fields=['name', 'id'],
+                name='recipe_name_idx')]
 
     def __str__(self):
         return f'{self.author.email}, {self.name}'
@@ -113,6 +160,11 @@ class RecipeIngredient(models.Model):
             models.UniqueConstraint(
                 fields=['recipe', 'ingredient'],
                 name='unique ingredient')]
+        indexes = [
+            # Рецепты с ингредиентом: EXISTS по (ingredient, recipe).
+            models.Index(
+                fields=['ingredient', 'recipe'],
+                name='recipeingredient_ingr_idx')]
 
 
 class Subscribe(models.Model):
@@ -160,7 +212,7 @@ class FavoriteRecipe(models.Model):
         verbose_name_plural = 'Избранные рецепты'
 
     def __str__(self):
-        list_ = [item['name'] for item in self.recipe.values('name')]
+        list_ = [item.name for item in self.recipe.all()]
         return f'Пользователь {self.user} добавил {list_} в избранные.'
 
     @receiver(post_save, sender=User)
@@ -179,6 +231,7 @@ class ShoppingCart(models.Model):
         verbose_name='Пользователь')
     recipe = models.ManyToManyField(
         Recipe,
+        through='ShoppingCartRecipe',
         related_name='shopping_cart',
         verbose_name='Покупка')
 
@@ -188,7 +241,7 @@ class ShoppingCart(models.Model):
         ordering = ['-id']
 
     def __str__(self):
-        list_ = [item['name'] for item in self.recipe.values('name')]
+        list_ = [item.name for item in self.recipe.all()]
         return f'Пользователь {self.user} добавил {list_} в покупки.'
 
     @receiver(post_save, sender=User)
@@ -196,3 +249,149 @@ class ShoppingCart(models.Model):
             sender, instance, created, **kwargs):
         if created:
             return ShoppingCart.objects.create(user=instance)
+
+
+class ShoppingCartRecipe(models.Model):
+    shoppingcart = models.ForeignKey(
+        ShoppingCart,
+        on_delete=models.CASCADE,
+        related_name='entries',
+        verbose_name='Корзина')
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_entries',
+        verbose_name='Рецепт')
+    servings = models.PositiveSmallIntegerField(
+        'Множитель порций',
+        default=1,
+        validators=(
+            validators.MinValueValidator(1),
+            validators.MaxValueValidator(MAX_SERVINGS)))
+
+    class Meta:
+        db_table = 'recipes_shoppingcart_recipe'
+        verbose_name = 'Рецепт в корзине'
+        verbose_name_plural = 'Рецепты в корзине'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['shoppingcart', 'recipe'],
+                name='unique_cart_recipe')]
+
+    def __str__(self):
+        return f'{self.recipe_id} x{self.servings}'
+
+
+class UnitConversion(models.Model):
+    """Перевод единицы измерения в базовую для сводного списка покупок."""
+
+    unit = models.CharField(
+        'Единица измерения',
+        max_length=200,
+        unique=True)
+    base_unit = models.CharField(
+        'Базовая единица',
+        max_length=200)
+    factor = models.FloatField(
+        'Базовых единиц в одной',
+        validators=(validators.MinValueValidator(0),))
+
+    class Meta:
+        verbose_name = 'Перевод единиц'
+        verbose_name_plural = 'Переводы единиц'
+        ordering = ['unit']
+
+    def __str__(self):
+        return f'1 {self.unit} = {self.factor:g} {self.base_unit}'
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписчика, раскладывается при публикации."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик')
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор')
+    pub_date = models.DateTimeField(
+        'Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        ordering = ['-pub_date', '-recipe_id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_recipe')]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='timeline_user_date_idx'),
+            models.Index(
+                fields=['user', 'author'],
+                name='timeline_user_author_idx')]
+
+    def __str__(self):
+        return f'{self.user} <- {self.recipe_id}'
+
+
+class SimilarRecipe(models.Model):
+    """Сосед рецепта по совместным избранным и корзинам."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar',
+        verbose_name='Рецепт')
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт')
+    score = models.FloatField(
+        'Близость')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        ordering = ['recipe', '-score', 'similar']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similar_recipe')]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score', 'similar'],
+                name='similar_recipe_score_idx')]
+
+    def __str__(self):
+        return f'{self.recipe_id} ~ {self.similar_id} ({self.score:.3f})'
+
+
+class StaleSimilarity(models.Model):
+    """Рецепт, соседей которого надо пересчитать."""
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+        verbose_name='Рецепт')
+
+    class Meta:
+        verbose_name = 'Устаревшие соседи'
+        verbose_name_plural = 'Устаревшие соседи'
+
+    def __str__(self):
+        return str(self.recipe_id)
@@ -0,0 +1,140 @@
+import uuid
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.loaders import bulk_loaded
+from recipes.models import Ingredient
+
+NUTRIENTS = ('calories', 'proteins', 'fats', 'carbohydrates', 'price')
+# Сколько граммов в единице; плотность жидкостей считаем равной воде.
+UNIT_GRAMS = {
+    'мг': 0.001,
+    'г': 1,
+    'кг': 1000,
+    'мл': 1,
+    'л': 1000,
+}
+VERSION_KEY = 'nutrition:version'
+
+
+def unit_grams(measurement_unit, unit_weight=None):
+    """Граммы в одной единице измерения, None - перевести нельзя."""
+
+    unit = measurement_unit.strip().lower().rstrip('.')
+    if unit in UNIT_GRAMS:
+        return UNIT_GRAMS[unit]
+    return unit_weight
+
+
+class NutritionTable:
+    """Справочные данные ингредиентов в массивах, индекс - id ингредиента.
+
+    grams - граммы в единице измерения, per_gram - NUTRIENTS на грамм,
+    NaN там, где данных нет.
+    """
+
+    def __init__(self, rows):
+        rows = list(rows)
+        size = max((row[0] for row in rows), default=0) + 1
+        self.grams = np.full(size, np.nan)
+        self.per_gram = np.full((size, len(NUTRIENTS)), np.nan)
+        for ingredient_id, unit, weight, *values in rows:
+            grams = unit_grams(unit, weight)
+            if grams is not None:
+                self.grams[ingredient_id] = grams
+            self.per_gram[ingredient_id] = [
+                np.nan if value is None else float(value) / 100
+                for value in values]
+
+    @classmethod
+    def load(cls):
+        return cls(Ingredient.objects.values_list(
+            'id', 'measurement_unit', 'unit_weight', *NUTRIENTS))
+
+    def totals(self, groups, ingredient_ids, amounts, size):
+        """Суммы NUTRIENTS по группам (рецептам, корзине) за один проход.
+
+        Возвращает массив (size, len(NUTRIENTS)) и признак полноты данных
+        для каждой группы.
+        """
+
+        ingredient_ids = np.asarray(ingredient_ids, dtype=np.int64)
+        groups = np.asarray(groups, dtype=np.int64)
+        known = ingredient_ids < len(self.grams)
+        ids = np.where(known, ingredient_ids, 0)
+        values = (
+            np.asarray(amounts, dtype=float)
+            * self.grams[ids])[:, None] * self.per_gram[ids]
+        values[~known] = np.nan
+        missing = np.isnan(values)
+        result = np.zeros((size, len(NUTRIENTS)))
+        np.add.at(result, groups, np.where(missing, 0, values))
+        incomplete = np.zeros((size, len(NUTRIENTS)), dtype=bool)
+        np.logical_or.at(incomplete, groups, missing)
+        return result, ~incomplete.any(axis=1)
+
+
+def new_version():
+    return uuid.uuid4().hex
+
+
+_table = {'version': None, 'table': None}
+
+
+def get_table():
+    """Таблица живет в памяти процесса, пока не изменятся ингредиенты.
+
+    С кэшем в памяти процесса версия живет CACHE_VERSION_TIMEOUT:
+    правку ингредиента, сделанную в другом воркере, увидим не позже.
+    """
+
+    version = cache.get_or_set(
+        VERSION_KEY, new_version, settings.CACHE_VERSION_TIMEOUT)
+    if _table['version'] != version:
+        _table['table'] = NutritionTable.load()
+        _table['version'] = version
+    return _table['table']
+
+
+def as_dict(values, complete):
+    data = {
+        name: round(float(value), 2)
+        for name, value in zip(NUTRIENTS, values)}
+    data['complete'] = bool(complete)
+    return data
+
+
+def recipe_totals(recipes):
+    """{id рецепта: суммы}; ингредиенты берутся из prefetch 'recipe'."""
+
+    groups, ingredient_ids, amounts = [], [], []
+    for index, recipe in enumerate(recipes):
+        for item in recipe.recipe.all():
+            groups.append(index)
+            ingredient_ids.append(item.ingredient_id)
+            amounts.append(item.amount)
+    values, complete = get_table().totals(
+        groups, ingredient_ids, amounts, len(recipes))
+    return {
+        recipe.id: as_dict(values[index], complete[index])
+        for index, recipe in enumerate(recipes)}
+
+
+def cart_totals(rows):
+    """Суммы по списку покупок: строки с ingredient_id и amount."""
+
+    values, complete = get_table().totals(
+        [0] * len(rows),
+        [row['ingredient_id'] for row in rows],
+        [row['amount'] for row in rows],
+        1)
+    return as_dict(values[0], complete[0])
+
+
+@receiver((post_save, post_delete, bulk_loaded), sender=Ingredient)
+def invalidate_table(**kwargs):
+    cache.set(VERSION_KEY, new_version(), settings.CACHE_VERSION_TIMEOUT)
@@ -0,0 +1,203 @@
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
+
+from recipes.loaders import batched
+from recipes.models import (FavoriteRecipe, ShoppingCart, ShoppingCartRecipe,
+                            SimilarRecipe, StaleSimilarity)
+
+# Больше id в одном IN (...) не передаем.
+MAX_CHUNK_RECIPES = 900
+
+
+def spans(ptr, index):
+    """Позиции ptr[i]:ptr[i + 1] для всех i из index одним массивом."""
+
+    starts = ptr[index]
+    lengths = ptr[index + 1] - starts
+    offsets = np.cumsum(lengths) - lengths
+    positions = (
+        np.repeat(starts - offsets, lengths) + np.arange(lengths.sum()))
+    return positions, lengths
+
+
+class Interactions:
+    """Разреженная матрица пользователь x рецепт (избранное и корзины).
+
+    Хранится дважды, как CSR по пользователям и по рецептам: ptr[i]:ptr[i+1]
+    - участок массива с рецептами пользователя i или пользователями
+    рецепта i. Индекс рецепта - его id.
+    """
+
+    def __init__(self, pairs):
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        self.size = int(pairs[:, 1].max(initial=0)) + 1
+        # Рецепт в избранном и в корзине - одна пара.
+        users, recipes = np.divmod(
+            np.unique(pairs[:, 0] * self.size + pairs[:, 1]), self.size)
+        _, users = np.unique(users, return_inverse=True)
+        by_user = np.argsort(users, kind='stable')
+        self.user_ptr = np.concatenate(
+            ([0], np.cumsum(np.bincount(users))))
+        self.user_recipes = recipes[by_user]
+        by_recipe = np.argsort(recipes, kind='stable')
+        self.degree = np.bincount(recipes, minlength=self.size)
+        self.recipe_ptr = np.concatenate(([0], np.cumsum(self.degree)))
+        self.recipe_users = users[by_recipe]
+        # Сколько пар развернет расчет соседей рецепта.
+        self.cost = np.bincount(
+            recipes, weights=np.diff(self.user_ptr)[users],
+            minlength=self.size)
+
+    @classmethod
+    def load(cls):
+        queries = (
+            FavoriteRecipe.recipe.through.objects.filter(
+                favoriterecipe__user__isnull=False
+            ).values_list('favoriterecipe__user_id', 'recipe_id'),
+            ShoppingCartRecipe.objects.filter(
+                shoppingcart__user__isnull=False
+            ).values_list('shoppingcart__user_id', 'recipe_id'),
+        )
+        return cls(np.fromiter(
+            chain.from_iterable(chain.from_iterable(
+                query.iterator(chunk_size=10000) for query in queries)),
+            dtype=np.int64))
+
+    def chunks(self, recipe_ids, max_pairs):
+        """Делим рецепты на блоки не больше max_pairs развернутых пар."""
+
+        recipe_ids = np.asarray(sorted(recipe_ids), dtype=np.int64)
+        cost = np.where(
+            recipe_ids < self.size,
+            self.cost[np.minimum(recipe_ids, self.size - 1)], 0)
+        start, used = 0, 0
+        for end, recipe_cost in enumerate(cost):
+            if end > start and (used + recipe_cost > max_pairs
+                                or end - start >= MAX_CHUNK_RECIPES):
+                yield recipe_ids[start:end]
+                start, used = end, 0
+            used += recipe_cost
+        if start < len(recipe_ids):
+            yield recipe_ids[start:]
+
+    def neighbors(self, recipe_ids, top_k, min_common):
+        """Top-K соседей по косинусу: общие / sqrt(n(a) * n(b)).
+
+        Возвращает массивы (рецепт, сосед, близость), отсортированные
+        по рецепту и убыванию близости.
+        """
+
+        recipe_ids = recipe_ids[recipe_ids < self.size]
+        positions, lengths = spans(self.recipe_ptr, recipe_ids)
+        owners = np.repeat(recipe_ids, lengths)
+        positions, lengths = spans(
+            self.user_ptr, self.recipe_users[positions])
+        sources = np.repeat(owners, lengths)
+        others = self.user_recipes[positions]
+        distinct = sources != others
+        keys, common = np.unique(
+            sources[distinct] * self.size + others[distinct],
+            return_counts=True)
+        enough = common >= min_common
+        sources, others = np.divmod(keys[enough], self.size)
+        scores = common[enough] / np.sqrt(
+            self.degree[sources] * self.degree[others])
+        order = np.lexsort((others, -scores, sources))
+        sources, others, scores = (
+            sources[order], others[order], scores[order])
+        rank = np.arange(len(sources)) - np.searchsorted(sources, sources)
+        top = rank < top_k
+        return sources[top], others[top], scores[top]
+
+
+def refresh(recipe_ids=None):
+    """Пересчитываем соседей рецептов, None - всех. Возвращает их число."""
+
+    interactions = Interactions.load()
+    if recipe_ids is None:
+        SimilarRecipe.objects.all().delete()
+        recipe_ids = np.flatnonzero(interactions.degree)
+    count = 0
+    for chunk in interactions.chunks(
+            recipe_ids, settings.SIMILAR_RECIPES_CHUNK_PAIRS):
+        sources, others, scores = interactions.neighbors(
+            chunk, settings.SIMILAR_RECIPES_TOP_K,
+            settings.SIMILAR_RECIPES_MIN_COMMON)
+        with transaction.atomic():
+            SimilarRecipe.objects.filter(recipe_id__in=chunk.tolist()).delete()
+            SimilarRecipe.objects.bulk_create(
+                (SimilarRecipe(
+                    recipe_id=recipe_id, similar_id=similar_id, score=score)
+                 for recipe_id, similar_id, score in zip(
+                     sources.tolist(), others.tolist(), scores.tolist())),
+                batch_size=1000)
+        count += len(chunk)
+    return count
+
+
+def user_recipe_ids(user_ids):
+    """Рецепты в избранном и корзинах пользователей (список или подзапрос)."""
+
+    return set(FavoriteRecipe.recipe.through.objects.filter(
+        favoriterecipe__user_id__in=user_ids
+    ).values_list('recipe_id', flat=True).union(
+        ShoppingCartRecipe.objects.filter(
+            shoppingcart__user_id__in=user_ids
+        ).values_list('recipe_id', flat=True)))
+
+
+def mark_stale(recipe_ids):
+    """Отмечаем рецепты для пересчета соседей."""
+
+    StaleSimilarity.objects.bulk_create(
+        (StaleSimilarity(recipe_id=recipe_id) for recipe_id in recipe_ids),
+        ignore_conflicts=True)
+
+
+def mark_changed(recipe_ids, user_ids):
+    """Пользователи user_ids добавили или убрали рецепты recipe_ids.
+
+    Меняются общие пользователи этих рецептов с остальными рецептами
+    пользователей, а число пользователей рецепта - его близость с каждым
+    рецептом, у которого он сейчас в соседях. Рецепт, в соседи которого
+    он попадет только после удаления (близость выросла), находит
+    периодический refresh_similar_recipes --full.
+    """
+
+    recipe_ids = set(recipe_ids)
+    stale = recipe_ids | user_recipe_ids(user_ids)
+    for chunk in batched(sorted(recipe_ids), MAX_CHUNK_RECIPES):
+        stale.update(SimilarRecipe.objects.filter(
+            similar_id__in=chunk).values_list('recipe_id', flat=True))
+    mark_stale(stale)
+
+
+@receiver(m2m_changed, sender=FavoriteRecipe.recipe.through)
+@receiver(m2m_changed, sender=ShoppingCart.recipe.through)
+def interactions_changed(sender, instance, action, reverse, model, pk_set,
+                         **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        # instance - рецепт, pk_set - избранные/корзины пользователей.
+        containers = (
+            model.objects.filter(recipe=instance) if pk_set is None
+            else model.objects.filter(id__in=pk_set))
+        mark_changed([instance.id], containers.values('user_id'))
+    else:
+        mark_changed(
+            pk_set if pk_set is not None
+            else user_recipe_ids([instance.user_id]),
+            [instance.user_id])
+
+
+@receiver(post_save, sender=ShoppingCartRecipe)
+def cart_recipe_added(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        mark_changed(
+            [instance.recipe_id], [instance.shoppingcart.user_id])
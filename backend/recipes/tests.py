@@ -0,0 +1,496 @@
+import csv
+import io
+import json
+import os
+import tempfile
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from recipes.feed import feed_page
+from recipes.loaders import load_ingredients, load_tags, read_records
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCartRecipe,
+                            SimilarRecipe, StaleSimilarity, Subscribe, Tag,
+                            TimelineEntry)
+from recipes.similar import Interactions, spans
+
+User = get_user_model()
+
+
+class AdminQueryCountTests(TestCase):
+    """Списки в админке: число запросов не зависит от числа строк."""
+
+    RECIPES = 1000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin',
+            first_name='Админ', last_name='Админов', password='pass')
+        users = [
+            User.objects.create_user(
+                email=f'user{number}@example.com',
+                username=f'user{number}',
+                first_name='Имя', last_name='Фамилия')
+            for number in range(5)]
+        tags = Tag.objects.bulk_create(
+            Tag(name=f'Тэг {number}', color=f'#00000{number}',
+                slug=f'tag{number}')
+            for number in range(3))
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Продукт {number}', measurement_unit='г')
+            for number in range(10))
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=users[number % len(users)],
+                   name=f'Рецепт {number}', text='Текст',
+                   cooking_time=number % 120 + 1, image='recipe.png')
+            for number in range(cls.RECIPES))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag.id)
+            for number, recipe in enumerate(recipes)
+            for tag in tags[:number % len(tags) + 1])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient=ingredients[(number + shift) % len(ingredients)],
+                amount=shift + 1)
+            for number, recipe in enumerate(recipes)
+            for shift in range(3))
+        for user in users:
+            FavoriteRecipe.recipe.through.objects.bulk_create(
+                FavoriteRecipe.recipe.through(
+                    favoriterecipe_id=user.favorite_recipe.id,
+                    recipe_id=recipe.id)
+                for recipe in recipes[::7])
+            ShoppingCartRecipe.objects.bulk_create(
+                ShoppingCartRecipe(
+                    shoppingcart_id=user.shopping_cart.id,
+                    recipe_id=recipe.id)
+                for recipe in recipes[::11])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist_queries(self, model, query=''):
+        url = reverse(
+            f'admin:recipes_{model}_changelist') + query
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_recipe_changelist(self):
+        # Сессия и пользователь, COUNT, страница, тэги, ингредиенты,
+        # тэги для фильтра.
+        self.assertEqual(self.changelist_queries('recipe'), 7)
+
+    def test_recipe_changelist_filtered(self):
+        tag = Tag.objects.first()
+        queries = self.changelist_queries('recipe', f'?tag={tag.id}')
+        self.assertEqual(
+            self.changelist_queries('recipe', '?q=Продукт'), queries)
+        self.assertEqual(queries, 7)
+
+    def test_recipe_changelist_pages(self):
+        self.assertEqual(
+            self.changelist_queries('recipe', '?p=5'),
+            self.changelist_queries('recipe'))
+
+    def test_favorite_changelist(self):
+        self.assertEqual(self.changelist_queries('favoriterecipe'), 5)
+
+    def test_shopping_cart_changelist(self):
+        self.assertEqual(self.changelist_queries('shoppingcart'), 5)
+
+
+class LoaderTests(TestCase):
+    """load_ingrs и load_tags: форматы, повторный запуск, ошибки."""
+
+    INGREDIENTS = [
+        {'name': 'соль', 'measurement_unit': 'г'},
+        {'name': 'молоко', 'measurement_unit': 'мл'},
+        {'name': 'соль', 'measurement_unit': 'щепотка'},
+    ]
+    TAGS = [
+        {'name': 'Завтрак', 'color': '#E26C2D', 'slug': 'breakfast'},
+        {'name': 'Обед', 'color': '#49B64E', 'slug': 'dinner'},
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, extension, records):
+        path = os.path.join(self.directory, f'data{extension}')
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            if extension == '.csv':
+                writer = csv.DictWriter(file, fieldnames=list(records[0]))
+                writer.writeheader()
+                writer.writerows(records)
+            elif extension == '.json':
+                json.dump(records, file, ensure_ascii=False, indent=2)
+            else:
+                file.writelines(
+                    json.dumps(record, ensure_ascii=False) + '\n'
+                    for record in records)
+        return path
+
+    def command(self, *args):
+        stdout = io.StringIO()
+        call_command(*args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_formats_read_the_same(self):
+        for records in (self.INGREDIENTS, self.TAGS):
+            for extension in ('.csv', '.json', '.jsonl'):
+                with self.subTest(extension=extension):
+                    path = self.write(extension, records)
+                    self.assertEqual(list(read_records(path)), records)
+
+    def test_ingredients_rerun_is_idempotent(self):
+        path = self.write('.jsonl', self.INGREDIENTS)
+        stats = load_ingredients(read_records(path), batch_size=2)
+        self.assertEqual((stats.created, stats.skipped), (3, 0))
+        stats = load_ingredients(read_records(path), batch_size=2)
+        self.assertEqual((stats.created, stats.skipped), (0, 3))
+        self.assertEqual(Ingredient.objects.count(), 3)
+
+    def test_tags_rerun_updates_by_slug(self):
+        load_tags(self.TAGS)
+        changed = [{**self.TAGS[0], 'name': 'Ранний завтрак'}, self.TAGS[1]]
+        stats = load_tags(changed)
+        self.assertEqual((stats.created, stats.updated, stats.skipped),
+                         (0, 1, 1))
+        self.assertEqual(
+            Tag.objects.get(slug='breakfast').name, 'Ранний завтрак')
+        self.assertEqual(Tag.objects.count(), 2)
+
+    def test_dry_run_lists_changes(self):
+        load_tags(self.TAGS[:1])
+        path = self.write('.json', [
+            {**self.TAGS[0], 'color': '#000000'}, self.TAGS[1]])
+        output = self.command('load_tags', path, '--dry-run')
+        self.assertIn('~ breakfast: Завтрак, #E26C2D -> Завтрак, #000000',
+                      output)
+        self.assertIn('+ dinner: Обед, #49B64E', output)
+        self.assertEqual(Tag.objects.count(), 1)
+        output = self.command(
+            'load_ingrs', self.write('.csv', self.INGREDIENTS), '--dry-run')
+        self.assertIn('+ соль, щепотка', output)
+        self.assertFalse(Ingredient.objects.exists())
+
+    def test_bad_tags_are_reported(self):
+        load_tags(self.TAGS)
+        cases = (
+            [{**self.TAGS[0], 'slug': 'morning'}],
+            [{'name': 'Ужин', 'color': '#49B64E', 'slug': 'supper'}],
+            [{**self.TAGS[0], 'extra': '1'}],
+            [{**self.TAGS[0], 'name': 1}],
+            [self.TAGS[1], {**self.TAGS[1], 'slug': 'lunch'}],
+        )
+        for records in cases:
+            with self.subTest(records=records):
+                with self.assertRaises(CommandError):
+                    self.command('load_tags', self.write('.json', records))
+        self.assertEqual(
+            list(Tag.objects.order_by('slug').values(*self.TAGS[0])),
+            sorted(self.TAGS, key=lambda tag: tag['slug']))
+
+
+class MergeDuplicateIngredientsTests(TransactionTestCase):
+    """0002 склеивает дубли ингредиентов, 0003 добавляет ограничение."""
+
+    before = [('recipes', '0001_initial')]
+    after = [('recipes', '0003_ingredient_unique_constraint')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes('recipes'))
+
+    def test_duplicates_are_merged(self):
+        apps = self.migrate(self.before)
+        Ingredient = apps.get_model('recipes', 'Ingredient')
+        Recipe = apps.get_model('recipes', 'Recipe')
+        RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+        User = apps.get_model('users', 'User')
+        author = User.objects.create(
+            email='cook@example.com', username='cook',
+            first_name='Повар', last_name='Поваров')
+        salt, *copies = [
+            Ingredient.objects.create(name='соль', measurement_unit='г')
+            for _ in range(3)]
+        soup, stew = [
+            Recipe.objects.create(
+                author=author, name=name, text='Текст', cooking_time=5,
+                image='recipe.png')
+            for name in ('Суп', 'Рагу')]
+        RecipeIngredient.objects.create(
+            recipe=soup, ingredient=salt, amount=1)
+        RecipeIngredient.objects.create(
+            recipe=soup, ingredient=copies[0], amount=2)
+        RecipeIngredient.objects.create(
+            recipe=stew, ingredient=copies[1], amount=3)
+
+        apps = self.migrate(self.after)
+        Ingredient = apps.get_model('recipes', 'Ingredient')
+        RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+        self.assertEqual(
+            list(Ingredient.objects.values_list('id', flat=True)),
+            [salt.id])
+        self.assertEqual(
+            sorted(RecipeIngredient.objects.values_list(
+                'recipe__name', 'ingredient_id', 'amount')),
+            [('Рагу', salt.id, 3), ('Суп', salt.id, 1)])
+
+
+@override_settings(FEED_FANOUT_LIMIT=2, FEED_BACKFILL=3, FEED_MAX_ENTRIES=4)
+class FeedTests(TestCase):
+    """Ленты подписок: раскладка, популярные авторы, курсор."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.star, *cls.readers = [
+            User.objects.create_user(
+                email=f'user{number}@example.com', username=f'user{number}',
+                first_name='Имя', last_name='Фамилия')
+            for number in range(5)]
+
+    def setUp(self):
+        cache.clear()
+
+    def publish(self, author, count=1):
+        return [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {Recipe.objects.count()}',
+                text='Текст', cooking_time=5, image='recipe.png').id
+            for _ in range(count)]
+
+    def subscribe(self, user, author):
+        Subscribe.objects.create(user=user, author=author)
+
+    def timeline(self, user):
+        return list(TimelineEntry.objects.filter(
+            user=user).values_list('recipe_id', flat=True))
+
+    def feed(self, user, limit=100):
+        return [key[1] for key in feed_page(user, limit)[0]]
+
+    def test_fan_out(self):
+        first, second, stranger = self.readers
+        self.subscribe(first, self.author)
+        self.subscribe(second, self.author)
+        recipes = self.publish(self.author, 2)
+        for reader in (first, second):
+            self.assertEqual(self.timeline(reader), recipes[::-1])
+        self.assertEqual(self.timeline(stranger), [])
+
+    def test_fan_out_trims_timelines(self):
+        reader = self.readers[0]
+        self.subscribe(reader, self.author)
+        recipes = self.publish(self.author, 6)
+        self.assertEqual(self.timeline(reader), recipes[:1:-1])
+
+    def test_backfill_on_subscribe(self):
+        recipes = self.publish(self.author, 5)
+        self.subscribe(self.readers[0], self.author)
+        self.assertEqual(self.timeline(self.readers[0]), recipes[:1:-1])
+
+    def test_popular_author_across_the_limit(self):
+        first, second, late = self.readers
+        old = self.publish(self.star)
+        self.subscribe(first, self.star)
+        self.subscribe(second, self.star)
+        self.subscribe(late, self.star)
+        # Три подписчика > FEED_FANOUT_LIMIT: рецепты читаются из Recipe.
+        popular = self.publish(self.star, 2)
+        self.assertEqual(self.timeline(first), old)
+        self.assertEqual(self.timeline(late), [])
+        for reader in self.readers:
+            self.assertEqual(self.feed(reader), (old + popular)[::-1])
+        Subscribe.objects.filter(user=first, author=self.star).delete()
+        # Снова обычный автор: ничего не пропало и у подписчика
+        # периода популярности, новые рецепты раскладываются.
+        recent = self.publish(self.star)
+        for reader in (second, late):
+            self.assertEqual(
+                self.timeline(reader), (old + popular + recent)[::-1])
+            self.assertEqual(
+                self.feed(reader), (old + popular + recent)[::-1])
+        self.assertEqual(self.feed(first), [])
+
+    def test_unsubscribe(self):
+        reader = self.readers[0]
+        self.subscribe(reader, self.author)
+        self.subscribe(reader, self.star)
+        self.publish(self.author, 2)
+        star = self.publish(self.star)
+        Subscribe.objects.filter(user=reader, author=self.author).delete()
+        self.assertEqual(self.timeline(reader), star)
+        self.assertEqual(self.feed(reader), star)
+
+    def test_cursor_paging(self):
+        reader = self.readers[0]
+        for user in self.readers:
+            self.subscribe(user, self.star)
+        self.subscribe(reader, self.author)
+        recipes = []
+        for _ in range(3):
+            recipes += self.publish(self.author) + self.publish(self.star)
+        token = Token.objects.create(user=reader)
+        url, seen = '/api/recipes/feed/?limit=2', []
+        while url:
+            response = self.client.get(
+                url, HTTP_HOST='localhost',
+                HTTP_AUTHORIZATION=f'Token {token.key}')
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertLessEqual(len(data['results']), 2)
+            seen += [recipe['id'] for recipe in data['results']]
+            url = data['next']
+        self.assertEqual(seen, recipes[::-1])
+
+
+class InteractionsTests(SimpleTestCase):
+    """Разреженный расчет соседей против плотного M.T @ M."""
+
+    def setUp(self):
+        rnd = np.random.default_rng(7)
+        self.matrix = rnd.random((30, 40)) < 0.2
+        # Рецепт без пользователей и пользователь без рецептов.
+        self.matrix[:, 5] = False
+        self.matrix[3] = False
+        self.interactions = Interactions(np.argwhere(self.matrix))
+
+    def expected(self, top_k, min_common):
+        common = self.matrix.T.astype(np.int64) @ self.matrix
+        degree = np.diag(common)
+        rows = []
+        for recipe in range(self.matrix.shape[1]):
+            candidates = [
+                (common[recipe, other]
+                 / np.sqrt(degree[recipe] * degree[other]), other)
+                for other in range(self.matrix.shape[1])
+                if other != recipe and common[recipe, other] >= min_common]
+            candidates.sort(key=lambda item: (-item[0], item[1]))
+            rows += [(recipe, other, score)
+                     for score, other in candidates[:top_k]]
+        return rows
+
+    def as_rows(self, sources, others, scores):
+        return list(zip(sources.tolist(), others.tolist(), scores.tolist()))
+
+    def assert_rows_equal(self, rows, expected):
+        self.assertEqual(
+            [row[:2] for row in rows], [row[:2] for row in expected])
+        np.testing.assert_allclose(
+            [row[2] for row in rows], [row[2] for row in expected])
+
+    def test_spans(self):
+        ptr = np.array([0, 2, 2, 5, 6])
+        positions, lengths = spans(ptr, np.array([2, 0, 1, 3]))
+        self.assertEqual(positions.tolist(), [2, 3, 4, 0, 1, 5])
+        self.assertEqual(lengths.tolist(), [3, 2, 0, 1])
+
+    def test_csr(self):
+        interactions = self.interactions
+        self.assertEqual(
+            interactions.degree.tolist(), self.matrix.sum(axis=0).tolist())
+        for recipe in range(self.matrix.shape[1]):
+            users = interactions.recipe_users[
+                interactions.recipe_ptr[recipe]:
+                interactions.recipe_ptr[recipe + 1]]
+            # Пользователи сжаты в 0..n-1, пустой пользователь 3 выпал.
+            compact = np.flatnonzero(self.matrix.any(axis=1))
+            self.assertEqual(
+                compact[users].tolist(),
+                np.flatnonzero(self.matrix[:, recipe]).tolist())
+
+    def test_neighbors_match_dense(self):
+        recipe_ids = np.arange(self.matrix.shape[1])
+        for top_k, min_common in ((3, 1), (5, 2), (100, 1)):
+            with self.subTest(top_k=top_k, min_common=min_common):
+                self.assert_rows_equal(
+                    self.as_rows(*self.interactions.neighbors(
+                        recipe_ids, top_k, min_common)),
+                    self.expected(top_k, min_common))
+
+    def test_chunks_match_single_block(self):
+        recipe_ids = np.arange(self.matrix.shape[1] + 3)
+        single = self.as_rows(
+            *self.interactions.neighbors(recipe_ids, 4, 1))
+        chunks = list(self.interactions.chunks(recipe_ids, 20))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(
+            np.concatenate(chunks).tolist(), recipe_ids.tolist())
+        self.assert_rows_equal(
+            [row for chunk in chunks for row in self.as_rows(
+                *self.interactions.neighbors(chunk, 4, 1))],
+            single)
+
+
+class StaleSimilarityTests(TestCase):
+    """Какие рецепты отмечаются для пересчета соседей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cook, cls.guest = [
+            User.objects.create_user(
+                email=f'user{number}@example.com', username=f'user{number}',
+                first_name='Имя', last_name='Фамилия')
+            for number in range(2)]
+        cls.soup, cls.salad, cls.cake, cls.pie = [
+            Recipe.objects.create(
+                author=cls.cook, name=name, text='Текст', cooking_time=5,
+                image='recipe.png')
+            for name in ('Суп', 'Салат', 'Торт', 'Пирог')]
+        cls.cook.favorite_recipe.recipe.add(cls.salad)
+        cls.guest.favorite_recipe.recipe.add(cls.cake)
+        # Суп сейчас в соседях пирога.
+        SimilarRecipe.objects.create(
+            recipe=cls.pie, similar=cls.soup, score=0.5)
+
+    def setUp(self):
+        StaleSimilarity.objects.all().delete()
+
+    def stale(self):
+        return set(StaleSimilarity.objects.values_list(
+            'recipe_id', flat=True))
+
+    def test_user_adds_recipe(self):
+        self.cook.favorite_recipe.recipe.add(self.soup)
+        self.assertEqual(
+            self.stale(), {self.soup.id, self.salad.id, self.pie.id})
+
+    def test_recipe_gets_user(self):
+        self.soup.favorite_recipe.add(self.guest.favorite_recipe)
+        self.assertEqual(
+            self.stale(), {self.soup.id, self.cake.id, self.pie.id})
+
+    def test_recipe_clears_users(self):
+        self.cake.favorite_recipe.add(self.cook.favorite_recipe)
+        StaleSimilarity.objects.all().delete()
+        self.cake.favorite_recipe.clear()
+        self.assertEqual(self.stale(), {self.cake.id, self.salad.id})
+
+    def test_cart(self):
+        ShoppingCartRecipe.objects.create(
+            shoppingcart=self.guest.shopping_cart, recipe=self.soup)
+        self.assertEqual(
+            self.stale(), {self.soup.id, self.cake.id, self.pie.id})